@@ -90,6 +90,32 @@ DATABASES = {
     }
 }
 
+# Caches
+# https://docs.djangoproject.com/en/3.2/ref/settings/#caches
+# 'shared' is seen by every process and holds what they must agree on,
+# like the collection versions. It is a database table,
+# created by the core migrations, unless SHARED_CACHE_BACKEND and
+# SHARED_CACHE_LOCATION name another shared backend like memcached.
+
+SHARED_CACHE_BACKEND = os.environ.get(
+    'SHARED_CACHE_BACKEND',
+    'django.core.cache.backends.db.DatabaseCache',
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKEND,
+        'LOCATION': os.environ.get(
+            'SHARED_CACHE_LOCATION', 'core_shared_cache',
+        ),
+    },
+}
+if SHARED_CACHE_BACKEND.endswith('.DatabaseCache'):
+    CACHES['shared']['OPTIONS'] = {'MAX_ENTRIES': 100000}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -142,8 +168,100 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS' : 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'core.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'core.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Token authentication cache, see core.authentication
+# AUTH_TOKEN_CACHE_ALIAS names a django cache to share entries between
+# processes, leave it as None to only cache in process memory, where a
+# logout or deactivation reaches other processes after the TTL only, so
+# the TTL is kept short.
+
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 30))
+AUTH_TOKEN_CACHE_MAX_SIZE = 10000
+AUTH_TOKEN_CACHE_ALIAS = os.environ.get('AUTH_TOKEN_CACHE_ALIAS') or None
+
+# Tokens issued by the user token endpoint, 'db' for database tokens or
+# 'signed' for short lived signed access tokens plus refresh tokens,
+# see core.tokens.
+
+AUTH_TOKEN_MODE = os.environ.get('AUTH_TOKEN_MODE', 'db')
+SIGNED_TOKEN_ACCESS_TTL = 5 * 60
+SIGNED_TOKEN_REFRESH_TTL = 7 * 24 * 60 * 60
+SIGNED_TOKEN_DENY_LIST_REFRESH = 5
+
+# In-memory bitmap index answering the recipe tag and ingredient
+# filters, see recipe.bitmap_index. It is rebuilt when the collection
+# version changes, or after the TTL without RECIPE_VERSION_CACHE.
+
+RECIPE_BITMAP_INDEX = os.environ.get('RECIPE_BITMAP_INDEX') == '1'
+RECIPE_BITMAP_INDEX_TTL = 300
+
+# Seconds before the in-memory tag and ingredient autocomplete indexes
+# are rebuilt without RECIPE_VERSION_CACHE, see recipe.autocomplete
+
+RECIPE_AUTOCOMPLETE_TTL = 300
+
+# Cache holding the per user collection versions behind the list ETags,
+# it must be shared by every process, writes made by one would otherwise
+# go unseen by the others, see recipe.caching. None disables the ETags.
+
+RECIPE_VERSION_CACHE = 'shared'
+
+# Cache of the recipe list responses, keyed on the collection versions so
+# writes never delete keys, see recipe.caching. None, the default,
+# disables it. The hits and misses of a process are served to staff
+# users by /api/recipe/recipes/list-cache-stats/.
+
+RECIPE_LIST_CACHE = os.environ.get('RECIPE_LIST_CACHE') or None
+RECIPE_LIST_CACHE_TIMEOUT = 300
+
+# Serialize recipe lists straight from .values() rows instead of model
+# instances, the output is the same, see recipe.serializers
+
+RECIPE_FAST_LIST_SERIALIZER = True
+
+# Recipes read and serialized at a time by the streaming export, which
+# bounds its memory use, see recipe.views
+
+RECIPE_EXPORT_CHUNK_SIZE = 500
+
+# Sizes in pixels of the resized variants made of every recipe image,
+# see recipe.images
+
+RECIPE_IMAGE_SIZES = (128, 512, 1024)
+
+# Answer uploads with 202 and a status url, leaving the image variants
+# to the workers run by the process_images command, see recipe.images
+
+RECIPE_IMAGE_ASYNC = os.environ.get('RECIPE_IMAGE_ASYNC') == '1'
+
+# Store uploads under the digest of their content, shared by the recipes
+# with the same image, see recipe.images
+
+RECIPE_IMAGE_CONTENT_ADDRESSED = \
+    os.environ.get('RECIPE_IMAGE_CONTENT_ADDRESSED') == '1'
+
+# Largest recipe image upload in bytes and in pixels, checked while the
+# upload streams to disk, see recipe.uploads
+
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40000000
+
+# Number of best matches returned by the recipe search, see recipe.search
+
+RECIPE_SEARCH_MAX_RESULTS = 100
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
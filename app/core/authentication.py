@@ -0,0 +1,212 @@
+"""
+Authentication classes for the API.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import tokens
+
+
+class TokenUserCache:
+    """
+    Cache of token key to user with a TTL.
+
+    When AUTH_TOKEN_CACHE_ALIAS names a django cache the entries are only
+    stored there, so every process sees an invalidation at once. Without
+    it the entries live in a process local LRU, and an invalidation only
+    reaches the process making it, the others keep the entry for up to
+    AUTH_TOKEN_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._user_keys = {}
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 30)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_MAX_SIZE', 10000)
+
+    @property
+    def backend(self):
+        alias = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    def _backend_key(self, key):
+        """Return the shared cache key for a token key."""
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return f'auth-token:{digest}'
+
+    def get(self, key):
+        """Return a copy of the cached user for key or None."""
+        backend = self.backend
+        if backend is not None:
+            user = backend.get(self._backend_key(key))
+            return copy.copy(user) if user is not None else None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                user, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return copy.copy(user)
+                self._remove(key)
+
+        return None
+
+    def set(self, key, user):
+        """Cache user for key."""
+        if self.ttl <= 0:
+            return
+        backend = self.backend
+        if backend is not None:
+            backend.set(self._backend_key(key), user, self.ttl)
+        else:
+            self._store(key, copy.copy(user))
+
+    def _store(self, key, user):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user, time.monotonic() + self.ttl)
+            self._user_keys.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """Drop key from the local cache, the lock must be held."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._user_keys.get(entry[0].pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[entry[0].pk]
+
+    def invalidate(self, key):
+        """Forget the user cached for key."""
+        with self._lock:
+            self._remove(key)
+        backend = self.backend
+        if backend is not None:
+            backend.delete(self._backend_key(key))
+
+    def invalidate_user(self, user_id):
+        """Forget every token cached for the user."""
+        with self._lock:
+            keys = set(self._user_keys.get(user_id, ()))
+            for key in keys:
+                self._remove(key)
+        backend = self.backend
+        if backend is not None:
+            keys.update(
+                Token.objects.filter(user_id=user_id)
+                .values_list('key', flat=True)
+            )
+            backend.delete_many([self._backend_key(key) for key in keys])
+
+    def clear(self):
+        """Forget every cached token of this process."""
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+
+token_user_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the token to user lookup.
+
+    Cached entries are invalidated when the token is deleted or the user
+    is saved or deleted, see core.signals.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_user_cache.get(key)
+        if user is not None:
+            return (user, Token(key=key, user=user))
+
+        user, token = super().authenticate_credentials(key)
+        token_user_cache.set(key, user)
+        return (user, token)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticate with a signed access token, see core.tokens.
+
+    Clients send the header "Authorization: Bearer <token>". The token is
+    verified without a database lookup. request.user carries the id and
+    the active, staff and superuser flags of the token, its other fields
+    are deferred and loaded on first access. request.auth is the verified
+    SignedToken.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise AuthenticationFailed(_('Invalid token header.'))
+        try:
+            signed_token = tokens.verify(auth[1].decode())
+        except (UnicodeError, tokens.InvalidToken) as exc:
+            raise AuthenticationFailed(_('Invalid token.')) from exc
+
+        user_model = get_user_model()
+        known = {
+            user_model._meta.pk.attname: signed_token.user_id,
+            'is_active': True,
+            'is_staff': signed_token.is_staff,
+            'is_superuser': signed_token.is_superuser,
+        }
+        # from_db takes the values in field order and defers the others
+        field_names = [
+            field.attname for field in user_model._meta.concrete_fields
+            if field.attname in known
+        ]
+        user = user_model.from_db(
+            router.db_for_read(user_model),
+            field_names,
+            [known[name] for name in field_names],
+        )
+        return (user, signed_token)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class SignedTokenScheme(OpenApiAuthenticationExtension):
+    """Describe SignedTokenAuthentication in the API schema."""
+    target_class = SignedTokenAuthentication
+    name = 'signedTokenAuth'
+
+    def get_security_definition(self, auto_schema):
+        return {'type': 'http', 'scheme': 'bearer'}
@@ -0,0 +1,65 @@
+"""
+System checks of the settings the processes must agree on.
+"""
+from django.conf import settings
+from django.core.checks import (
+    Error,
+    Tags,
+    Warning,
+    register,
+)
+
+# backends whose entries are only seen by the process storing them
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# seconds a logout may take to reach the other processes
+MAX_LOCAL_TOKEN_CACHE_TTL = 60
+
+
+def is_shared_cache(alias):
+    """Return True if the cache alias is seen by every process."""
+    return settings.CACHES[alias]['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+@register(Tags.caches)
+def check_recipe_version_cache(app_configs, **kwargs):
+    """A write in one process must change the ETags all of them send."""
+    alias = getattr(settings, 'RECIPE_VERSION_CACHE', None)
+    if not alias or is_shared_cache(alias):
+        return []
+    return [Error(
+        f'RECIPE_VERSION_CACHE names the process local cache {alias!r}, '
+        f'writes made by other processes would not change the ETags.',
+        hint='Name a cache shared by every process, like "shared", or '
+             'None to send no ETags.',
+        id='core.E002',
+    )]
+
+
+@register(Tags.caches)
+def check_auth_token_cache(app_configs, **kwargs):
+    """A logout must reach every process within a short delay."""
+    alias = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', None)
+    if alias and not is_shared_cache(alias):
+        return [Error(
+            f'AUTH_TOKEN_CACHE_ALIAS names the process local cache '
+            f'{alias!r}, a logout would not reach the other processes.',
+            hint='Name a cache shared by every process, or None to cache '
+                 'in process memory for AUTH_TOKEN_CACHE_TTL seconds.',
+            id='core.E003',
+        )]
+    ttl = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 30)
+    if not alias and ttl > MAX_LOCAL_TOKEN_CACHE_TTL:
+        return [Warning(
+            f'Tokens are cached in process memory for {ttl} seconds, a '
+            f'logout or deactivation reaches the other processes only '
+            f'after that.',
+            hint=f'Lower AUTH_TOKEN_CACHE_TTL to at most '
+                 f'{MAX_LOCAL_TOKEN_CACHE_TTL} or set AUTH_TOKEN_CACHE_ALIAS '
+                 f'to a shared cache.',
+            id='core.W001',
+        )]
+    return []
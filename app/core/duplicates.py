@@ -0,0 +1,68 @@
+"""
+Merging of tags and ingredients whose names differ only in case.
+
+The merge runs before the migration adding the unique constraint, on a
+schema older than the signal handlers of the recipe app expect, so rows
+are deleted without sending signals.
+"""
+from django.db.models.functions import Lower
+
+NAMED_FIELDS = {
+    'tag': 'tags',
+    'ingredient': 'ingredients',
+}
+
+
+def find_duplicates(model):
+    """Return a map of each duplicate id to the id of the row it merges
+    into, the lowest id with the same user and lower cased name."""
+    rows = model.objects.annotate(
+        name_key=Lower('name'),
+    ).order_by('user_id', 'name_key', 'id').values_list(
+        'user_id', 'name_key', 'id',
+    )
+    keep = {}
+    duplicates = {}
+    for user_id, name_key, pk in rows:
+        kept = keep.setdefault((user_id, name_key), pk)
+        if kept != pk:
+            duplicates[pk] = kept
+
+    return duplicates
+
+
+def merge_duplicates(model, recipe_model, batch_size=1000):
+    """
+    Merge the duplicate rows of model into the row they duplicate.
+
+    Recipes related to a duplicate are related to the kept row instead and
+    the duplicates are deleted, without sending signals. Return the number
+    of rows deleted.
+    """
+    duplicates = find_duplicates(model)
+    field = recipe_model._meta.get_field(
+        NAMED_FIELDS[model._meta.model_name]
+    )
+    through = field.remote_field.through
+    source = f'{field.m2m_field_name()}_id'
+    target = f'{field.m2m_reverse_field_name()}_id'
+
+    ids = list(duplicates)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        rows = through.objects.filter(
+            **{f'{target}__in': batch}
+        ).values_list(source, target)
+        through.objects.bulk_create(
+            [
+                through(**{source: recipe_id, target: duplicates[pk]})
+                for recipe_id, pk in rows
+            ],
+            ignore_conflicts=True,
+        )
+        through.objects.filter(
+            **{f'{target}__in': batch}
+        )._raw_delete(through.objects.db)
+        model.objects.filter(pk__in=batch)._raw_delete(model.objects.db)
+
+    return len(ids)
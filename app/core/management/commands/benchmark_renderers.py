@@ -0,0 +1,78 @@
+"""
+Django command to compare the API renderers.
+"""
+import statistics
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import (
+    FastJSONRenderer,
+    MessagePackRenderer,
+)
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the renderers on recipe lists."""
+    help = (
+        'Render a list shaped like the recipe list response with each '
+        'renderer and compare timings and sizes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--raw-decimals',
+            action='store_true',
+            help='keep prices as Decimal instead of serializer strings',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        data = [
+            OrderedDict([
+                ('id', i),
+                ('title', f'recipe {i}'),
+                ('time_minutes', i % 120),
+                ('price', self._price(i, options['raw_decimals'])),
+                ('link', f'https://example.com/recipes/{i}'),
+                ('tags', [
+                    OrderedDict([('id', j), ('name', f'tag {j}')])
+                    for j in range(3)
+                ]),
+                ('ingredients', [
+                    OrderedDict([('id', j), ('name', f'ingredient {j}')])
+                    for j in range(5)
+                ]),
+            ])
+            for i in range(options['recipes'])
+        ]
+
+        baseline = None
+        for renderer in (
+            JSONRenderer(),
+            FastJSONRenderer(),
+            MessagePackRenderer(),
+        ):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                content = renderer.render(data, renderer.media_type)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            median = statistics.median(timings)
+            baseline = baseline or median
+            self.stdout.write(self.style.SUCCESS(
+                f'{type(renderer).__name__}: {len(content)} bytes, median '
+                f'{median:.2f} ms, min {min(timings):.2f} ms, '
+                f'{baseline / median:.1f}x'
+            ))
+
+    def _price(self, i, raw):
+        price = Decimal(i % 10000) / 100
+        return price if raw else f'{price:.2f}'
@@ -0,0 +1,45 @@
+"""
+Django command to merge tags and ingredients differing only in case.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import duplicates
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+
+class Command(BaseCommand):
+    """Django command to merge duplicate tag and ingredient names."""
+    help = (
+        'Merge the tags and ingredients of a user whose names differ only '
+        'in case into the oldest one, moving their recipes over. Migration '
+        'core 0008, adding the unique name constraint, merges them too; '
+        'run this before it to review the duplicates with --dry-run or to '
+        'merge them ahead of the migration. Nothing is left to merge once '
+        'it is applied.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        for model in (Tag, Ingredient):
+            label = model._meta.verbose_name_plural
+            if options['dry_run']:
+                found = len(duplicates.find_duplicates(model))
+                self.stdout.write(f'{found} duplicate {label} found')
+                continue
+
+            with transaction.atomic():
+                merged = duplicates.merge_duplicates(
+                    model, Recipe, options['batch_size'],
+                )
+            self.stdout.write(
+                self.style.SUCCESS(f'{merged} duplicate {label} merged')
+            )
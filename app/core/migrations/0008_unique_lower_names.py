@@ -0,0 +1,71 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:20
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge duplicates so the unique indexes can be created."""
+    recipe_model = apps.get_model('core', 'Recipe')
+    for model_name, field_name in (
+        ('Tag', 'tags'),
+        ('Ingredient', 'ingredients'),
+    ):
+        model = apps.get_model('core', model_name)
+        # the lowest id of each user and lower cased name is kept
+        keep = {}
+        duplicates = {}
+        for user_id, name_key, pk in model.objects.annotate(
+            name_key=Lower('name'),
+        ).order_by('user_id', 'name_key', 'id').values_list(
+            'user_id', 'name_key', 'id',
+        ):
+            kept = keep.setdefault((user_id, name_key), pk)
+            if kept != pk:
+                duplicates[pk] = kept
+
+        field = recipe_model._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        ids = list(duplicates)
+        for start in range(0, len(ids), 1000):
+            batch = ids[start:start + 1000]
+            rows = through.objects.filter(
+                **{f'{target}__in': batch}
+            ).values_list(source, target)
+            through.objects.bulk_create(
+                [
+                    through(**{source: recipe_id, target: duplicates[pk]})
+                    for recipe_id, pk in rows
+                ],
+                ignore_conflicts=True,
+            )
+            model.objects.filter(pk__in=batch).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='core_recipe_user_id_idx'),
+        ),
+        migrations.RunPython(
+            merge_duplicate_names, migrations.RunPython.noop,
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_tag_user_lower_name_uniq '
+            'ON core_tag (user_id, LOWER(name))',
+            'DROP INDEX core_tag_user_lower_name_uniq',
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_ingr_user_lower_name_uniq '
+            'ON core_ingredient (user_id, LOWER(name))',
+            'DROP INDEX core_ingr_user_lower_name_uniq',
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_recipe_image_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentImage',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_shared_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=32, unique=True)),
+                ('token_type', models.CharField(max_length=16)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
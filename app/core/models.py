@@ -49,6 +49,15 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
+
+class ImageStatus(models.TextChoices):
+    """Processing state of the image of a recipe"""
+    NONE = '', 'No image'
+    PENDING = 'pending', 'Pending'
+    PROCESSING = 'processing', 'Processing'
+    READY = 'ready', 'Ready'
+    FAILED = 'failed', 'Failed'
+
 class Recipe(models.Model):
     """Recipe object"""
     user = models.ForeignKey(
@@ -63,6 +72,21 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image_status = models.CharField(
+        max_length=10,
+        blank=True,
+        choices=ImageStatus.choices,
+        default=ImageStatus.NONE,
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='core_recipe_user_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -75,6 +99,14 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-name', '-id'],
+                name='core_tag_user_name_id_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -86,5 +118,71 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-name', '-id'],
+                name='core_ingr_user_name_id_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeSearchDocument(models.Model):
+    """Search index entry of a recipe, see recipe.search"""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    length = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=40)
+
+
+class RecipeSearchPosting(models.Model):
+    """Occurrences of a term in an indexed recipe"""
+    document = models.ForeignKey(
+        RecipeSearchDocument,
+        on_delete=models.CASCADE,
+        related_name='postings',
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    term = models.CharField(max_length=64)
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'term'],
+                name='core_search_user_term_idx',
+            ),
+        ]
+
+
+class ContentImage(models.Model):
+    """Image file stored once under the digest of its content"""
+    name = models.CharField(max_length=255, primary_key=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class RevokedToken(models.Model):
+    """Signed token denied until it expires, see core.tokens"""
+    jti = models.CharField(max_length=32, unique=True)
+    token_type = models.CharField(max_length=16)
+    expires = models.DateTimeField(db_index=True)
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.jti
@@ -0,0 +1,93 @@
+"""
+Renderers for the API.
+"""
+import msgpack
+import orjson
+
+from rest_framework.renderers import (
+    BaseRenderer,
+    JSONRenderer,
+)
+from rest_framework.utils import encoders
+
+_encoder = encoders.JSONEncoder()
+
+
+def encode_default(obj):
+    """
+    Encode types msgpack and orjson do not know like DRF's JSONEncoder.
+
+    Serializer fields already turn decimals into strings, raw Decimals
+    become floats and datetimes use the same ISO 8601 format as DRF.
+    """
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer encoding straight to bytes with orjson.
+
+    The output matches JSONRenderer for the compact, unicode output the
+    API uses. Indented output, as the browsable API asks for, and the
+    ASCII only or non compact settings fall back to JSONRenderer.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return self.dumps(data)
+
+    def dumps(self, data):
+        """Return data as compact JSON bytes."""
+        ret = orjson.dumps(data, default=encode_default, option=self.options)
+        # escaped like JSONRenderer, so the output is a javascript subset
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029',
+            )
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer which serializes to MessagePack, a compact binary format.
+
+    Clients ask for it with "Accept: application/msgpack".
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+class NDJSONRenderer(FastJSONRenderer):
+    """
+    Renderer which writes a list as newline delimited JSON, one item per
+    line, and any other data as a single line.
+
+    Line and paragraph separators are escaped, so only newlines split
+    the output.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if not isinstance(data, list):
+            data = [data]
+        return b''.join(self.dumps(item) + b'\n' for item in data)
@@ -0,0 +1,154 @@
+"""
+Test the cached token authentication.
+"""
+from django.contrib.auth import get_user_model
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import checks
+from core.authentication import (
+    TokenUserCache,
+    token_user_cache,
+)
+
+ME_URL = reverse('user:me')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with cached tokens."""
+
+    def setUp(self):
+        token_user_cache.clear()
+        self.addCleanup(token_user_cache.clear)
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_request_runs_no_auth_query(self):
+        """Test a repeated request does not look up the token."""
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token_rejected(self):
+        """Test an unknown token is rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION='Token notatoken')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_invalidated(self):
+        """Test deleting a token drops its cached user."""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_invalidated(self):
+        """Test deactivating a user drops their cached tokens."""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_modified_user_reloaded(self):
+        """Test changes to the user are seen by the next request."""
+        self.client.get(ME_URL)
+
+        self.user.name = 'New Name'
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New Name')
+
+    @override_settings(AUTH_TOKEN_CACHE_TTL=0)
+    def test_cache_disabled(self):
+        """Test a TTL of zero disables caching."""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    @override_settings(AUTH_TOKEN_CACHE_MAX_SIZE=1)
+    def test_least_recently_used_evicted(self):
+        """Test the cache keeps at most max size entries."""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        other_token = Token.objects.create(user=other)
+        self.client.get(ME_URL)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {other_token.key}')
+        self.client.get(ME_URL)
+
+        self.assertIsNone(token_user_cache.get(self.token.key))
+        self.assertEqual(token_user_cache.get(other_token.key), other)
+
+    @override_settings(AUTH_TOKEN_CACHE_ALIAS='default')
+    def test_shared_cache(self):
+        """Test entries are shared through the django cache."""
+        self.client.get(ME_URL)
+        token_user_cache.clear()
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.token.delete()
+        token_user_cache.clear()
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_TOKEN_CACHE_ALIAS='default')
+    def test_shared_cache_invalidation_seen_by_other_process(self):
+        """Test an invalidation in one process reaches the others."""
+        other_process = TokenUserCache()
+        token_user_cache.set(self.token.key, self.user)
+        self.assertEqual(token_user_cache.get(self.token.key), self.user)
+
+        other_process.invalidate(self.token.key)
+
+        self.assertIsNone(token_user_cache.get(self.token.key))
+
+    @override_settings(AUTH_TOKEN_CACHE_ALIAS='default')
+    def test_local_token_cache_alias_check(self):
+        """Test a process local token cache alias is reported."""
+        errors = checks.check_auth_token_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E003'])
+
+    @override_settings(AUTH_TOKEN_CACHE_ALIAS=None, AUTH_TOKEN_CACHE_TTL=300)
+    def test_long_local_token_cache_check(self):
+        """Test a long TTL of the in-process token cache is reported."""
+        errors = checks.check_auth_token_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.W001'])
+
+    @override_settings(AUTH_TOKEN_CACHE_ALIAS=None, AUTH_TOKEN_CACHE_TTL=30)
+    def test_short_local_token_cache_check(self):
+        """Test the default in-process token cache passes the check."""
+        self.assertEqual(checks.check_auth_token_cache(None), [])
@@ -5,9 +5,23 @@ from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from io import StringIO
+
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from django.test.utils import CaptureQueriesContext
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -32,3 +46,93 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class BenchmarkRenderersTests(SimpleTestCase):
+    """Test the renderer benchmark."""
+
+    def test_benchmark_renderers(self):
+        """Test every renderer is measured."""
+        out = StringIO()
+
+        call_command('benchmark_renderers', recipes=10, repeat=1, stdout=out)
+
+        for name in ('JSONRenderer', 'FastJSONRenderer', 'MessagePack'):
+            self.assertIn(name, out.getvalue())
+
+
+class MergeDuplicateNamesTests(TestCase):
+    """Test merging tags and ingredients differing only in case."""
+
+    def setUp(self):
+        # the duplicates predate the unique indexes, dropped in this
+        # test's transaction only
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX core_tag_user_lower_name_uniq')
+            cursor.execute('DROP INDEX core_ingr_user_lower_name_uniq')
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def test_merge_duplicate_names(self):
+        """Test duplicates are merged into the oldest row."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        lower = Tag.objects.create(user=self.user, name='vegan')
+        upper = Tag.objects.create(user=self.user, name='VEGAN')
+        other_user = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        other = Tag.objects.create(user=other_user, name='vegan')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        Ingredient.objects.create(user=self.user, name='salt')
+        r1 = Recipe.objects.create(
+            user=self.user, title='r1', time_minutes=5, price=1,
+        )
+        r1.tags.add(vegan, lower)
+        r2 = Recipe.objects.create(
+            user=self.user, title='r2', time_minutes=5, price=1,
+        )
+        r2.tags.add(upper)
+        out = StringIO()
+
+        call_command('merge_duplicate_names', stdout=out)
+
+        self.assertIn('2 duplicate tags merged', out.getvalue())
+        self.assertIn('1 duplicate ingredients merged', out.getvalue())
+        self.assertEqual(
+            set(Tag.objects.values_list('id', flat=True)),
+            {vegan.id, other.id},
+        )
+        self.assertEqual(list(r1.tags.all()), [vegan])
+        self.assertEqual(list(r2.tags.all()), [vegan])
+        self.assertEqual(list(Ingredient.objects.all()), [salt])
+
+    def test_merge_without_signals(self):
+        """Test merging writes nothing but the names and their recipes."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        lower = Tag.objects.create(user=self.user, name='vegan')
+        recipe = Recipe.objects.create(
+            user=self.user, title='r1', time_minutes=5, price=1,
+        )
+        recipe.tags.add(lower)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('merge_duplicate_names', stdout=StringIO())
+
+        self.assertEqual(list(recipe.tags.all()), [vegan])
+        for query in queries:
+            self.assertNotIn('"core_recipe" ', query['sql'])
+            self.assertNotIn('core_shared_cache', query['sql'])
+
+    def test_dry_run(self):
+        """Test a dry run only counts duplicates."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='vegan')
+        out = StringIO()
+
+        call_command('merge_duplicate_names', dry_run=True, stdout=out)
+
+        self.assertIn('1 duplicate tags found', out.getvalue())
+        self.assertEqual(Tag.objects.count(), 2)
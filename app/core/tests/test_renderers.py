@@ -0,0 +1,145 @@
+"""
+Test the API renderers and parsers.
+"""
+import datetime
+from collections import OrderedDict
+from decimal import Decimal
+
+import msgpack
+
+from django.contrib.auth import get_user_model
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.renderers import (
+    FastJSONRenderer,
+    MessagePackRenderer,
+    NDJSONRenderer,
+)
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+SAMPLE = [
+    OrderedDict([
+        ('id', 1),
+        ('title', 'Crème brûlée\u2028line'),
+        ('price', Decimal('5.50')),
+        ('created', datetime.datetime(
+            2023, 7, 18, 1, 29, 3, 123456, tzinfo=datetime.timezone.utc,
+        )),
+        ('tags', [{'id': 2, 'name': 'Dessert'}]),
+        ('link', None),
+        ('ratio', 0.25),
+        ('public', True),
+    ]),
+]
+
+
+class RendererTests(SimpleTestCase):
+    """Test the renderers."""
+
+    def test_fast_json_matches_json_renderer(self):
+        """Test FastJSONRenderer renders the same bytes as JSONRenderer."""
+        self.assertEqual(
+            FastJSONRenderer().render(SAMPLE),
+            JSONRenderer().render(SAMPLE),
+        )
+
+    def test_fast_json_indent(self):
+        """Test indented output is rendered like JSONRenderer."""
+        media_type = 'application/json; indent=2'
+
+        self.assertEqual(
+            FastJSONRenderer().render(SAMPLE, media_type),
+            JSONRenderer().render(SAMPLE, media_type),
+        )
+
+    def test_empty_data(self):
+        """Test None renders an empty body."""
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+        self.assertEqual(MessagePackRenderer().render(None), b'')
+
+    def test_message_pack(self):
+        """Test MessagePack output decodes to the JSON values."""
+        data = msgpack.unpackb(MessagePackRenderer().render(SAMPLE))
+
+        self.assertEqual(data[0]['price'], 5.5)
+        self.assertEqual(data[0]['created'], '2023-07-18T01:29:03.123456Z')
+        self.assertEqual(data[0]['tags'], [{'id': 2, 'name': 'Dessert'}])
+
+    def test_ndjson(self):
+        """Test NDJSON has a line per item and escapes separators."""
+        content = NDJSONRenderer().render(SAMPLE * 2)
+
+        self.assertEqual(
+            content,
+            (JSONRenderer().render(SAMPLE[0]) + b'\n') * 2,
+        )
+        self.assertEqual(len(content.decode('utf-8').splitlines()), 2)
+        self.assertEqual(
+            NDJSONRenderer().render({'detail': 'Not found.'}),
+            b'{"detail":"Not found."}\n',
+        )
+
+
+class ContentNegotiationTests(TestCase):
+    """Test selecting the formats with Accept and Content-Type."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            'title': 'Soup',
+            'time_minutes': 10,
+            'price': '2.50',
+            'tags': [{'name': 'Lunch'}],
+        }
+
+    def test_message_pack_round_trip(self):
+        """Test creating and listing recipes in MessagePack."""
+        res = self.client.post(
+            RECIPES_URL,
+            msgpack.packb(self.payload),
+            content_type='application/msgpack',
+            HTTP_ACCEPT='application/msgpack',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        created = msgpack.unpackb(res.content)
+        self.assertEqual(created['title'], 'Soup')
+        self.assertEqual(created['tags'][0]['name'], 'Lunch')
+
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT='application/msgpack')
+        json_res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(msgpack.unpackb(res.content), json_res.json())
+
+    def test_json_is_default(self):
+        """Test JSON is rendered when any format is accepted."""
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT='*/*')
+
+        self.assertEqual(res['Content-Type'], 'application/json')
+
+    def test_invalid_message_pack(self):
+        """Test a malformed MessagePack body is rejected."""
+        res = self.client.post(
+            RECIPES_URL,
+            b'\xc1',
+            content_type='application/msgpack',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
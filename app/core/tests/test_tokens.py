@@ -0,0 +1,204 @@
+"""
+Test signed tokens and their authentication.
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+)
+
+from core import tokens
+from core.authentication import SignedTokenAuthentication
+
+RECIPES_URL = reverse('recipe:recipe-list')
+CACHE_STATS_URL = reverse('recipe:recipe-list-cache-stats')
+
+
+class SignedTokenTests(TestCase):
+    """Test issuing and verifying signed tokens."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+        )
+
+    def test_verify_token(self):
+        """Test an issued token verifies to its user."""
+        token = tokens.issue(self.user)
+
+        signed_token = tokens.verify(token)
+
+        self.assertEqual(signed_token.user_id, self.user.pk)
+        self.assertEqual(signed_token.type, tokens.ACCESS)
+
+    def test_tampered_token_invalid(self):
+        """Test a modified token does not verify."""
+        token = tokens.issue(self.user)
+
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+
+    def test_refresh_token_is_not_access_token(self):
+        """Test a refresh token cannot be used as an access token."""
+        token = tokens.issue(self.user, tokens.REFRESH)
+
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token)
+
+    def test_expired_token_invalid(self):
+        """Test a token is rejected after it expires."""
+        token = tokens.issue(self.user)
+
+        with patch('core.tokens.time.time', return_value=2 ** 40):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.verify(token)
+
+    def test_revoked_token_invalid(self):
+        """Test a revoked token is rejected."""
+        token = tokens.issue(self.user)
+
+        tokens.revoke(tokens.verify(token))
+
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token)
+
+    def test_revoke_once(self):
+        """Test only the first of several revocations succeeds."""
+        signed_token = tokens.verify(tokens.issue(self.user))
+
+        self.assertTrue(tokens.revoke(signed_token))
+        self.assertFalse(tokens.revoke(signed_token))
+
+    def test_revocation_seen_by_other_processes(self):
+        """Test another process denies a revoked token once it reloads."""
+        token = tokens.issue(self.user)
+        tokens.revoke(tokens.verify(token))
+        other = tokens.DenyList()
+
+        with patch('core.tokens.deny_list', other):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.verify(token)
+
+    def test_deny_list_reloaded_after_interval(self):
+        """Test the deny-list is loaded again after the refresh interval."""
+        signed_token = tokens.verify(tokens.issue(self.user))
+        other = tokens.DenyList()
+        self.assertNotIn(signed_token.jti, other)
+
+        tokens.revoke(signed_token)
+
+        self.assertNotIn(signed_token.jti, other)
+        with patch('core.tokens.time.monotonic', return_value=2 ** 40):
+            self.assertIn(signed_token.jti, other)
+
+    def test_deny_list_skips_expired(self):
+        """Test expired revocations are not loaded."""
+        signed_token = tokens.verify(tokens.issue(self.user))
+        tokens.revoke(signed_token)
+        other = tokens.DenyList()
+        expired = signed_token.expires + 1
+
+        with patch('core.tokens.time.time', return_value=expired):
+            self.assertNotIn(signed_token.jti, other)
+
+    def test_refresh_token_revocation_checked_in_database(self):
+        """Test a revoked refresh token is rejected by every process."""
+        token = tokens.issue(self.user, tokens.REFRESH)
+        tokens.revoke(tokens.verify(token, tokens.REFRESH))
+
+        with patch('core.tokens.deny_list', tokens.DenyList()):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.verify(token, tokens.REFRESH)
+
+
+class SignedTokenAuthenticationTests(TestCase):
+    """Test authenticating recipe requests with signed tokens."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+
+    def test_authenticate_without_auth_query(self):
+        """Test the token is verified without a database lookup."""
+        token = tokens.issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.client.get(RECIPES_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # the collection version and the recipes
+        self.assertEqual(len(queries), 2)
+        tables = [
+            get_user_model()._meta.db_table,
+            'authtoken_token',
+            'core_revokedtoken',
+        ]
+        for query in queries:
+            for table in tables:
+                self.assertNotIn(f'"{table}"', query['sql'])
+
+    def test_token_user_loads_other_fields(self):
+        """Test the fields not in the token are loaded on access."""
+        token = tokens.issue(self.user)
+        request = APIRequestFactory().get(
+            RECIPES_URL, HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+
+        user, _ = SignedTokenAuthentication().authenticate(request)
+
+        self.assertFalse(user.is_staff)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, self.user.email)
+
+    def test_staff_token_user(self):
+        """Test a staff user can use admin endpoints with a token."""
+        self.user.is_staff = True
+        self.user.save()
+        token = tokens.issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        res = self.client.get(CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_non_staff_token_user(self):
+        """Test a token of a regular user cannot use admin endpoints."""
+        token = tokens.issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        res = self.client.get(CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_create_recipe_for_token_user(self):
+        """Test recipes created with a signed token belong to its user."""
+        token = tokens.issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        payload = {'title': 'Soup', 'time_minutes': 5, 'price': '1.00'}
+
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(self.user.recipe_set.filter(title='Soup').exists())
+
+    def test_invalid_token_rejected(self):
+        """Test an invalid signed token is rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer notatoken')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,173 @@
+"""
+Stateless signed access and refresh tokens.
+
+A token is the HMAC signed payload of the user id, an expiry time, a
+random id (jti) and the token type. It is verified with the SECRET_KEY
+alone, without a database lookup. Revoked tokens are stored in the
+RevokedToken table until they expire. Every process keeps the revoked
+access tokens in memory and reloads them every
+SIGNED_TOKEN_DENY_LIST_REFRESH seconds, so requests are not slowed by a
+lookup and a revocation reaches the other processes within that delay.
+Refresh tokens are looked up in the table when they are used.
+"""
+import secrets
+import threading
+import time
+from datetime import (
+    datetime,
+    timezone,
+)
+
+from django.conf import settings
+from django.core import signing
+from django.db import (
+    IntegrityError,
+    transaction,
+)
+
+from core.models import RevokedToken
+
+ACCESS = 'access'
+REFRESH = 'refresh'
+
+
+class InvalidToken(Exception):
+    """Raised when a token is malformed, expired or revoked."""
+
+
+class SignedToken:
+    """A verified token payload."""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.user_id = payload['uid']
+        self.is_staff = payload.get('stf', False)
+        self.is_superuser = payload.get('sup', False)
+        self.expires = payload['exp']
+        self.jti = payload['jti']
+        self.type = payload['typ']
+
+    def __str__(self):
+        return self.jti
+
+
+def _lifetime(token_type):
+    """Return the lifetime in seconds of a token type."""
+    if token_type == REFRESH:
+        return getattr(settings, 'SIGNED_TOKEN_REFRESH_TTL', 7 * 24 * 3600)
+    return getattr(settings, 'SIGNED_TOKEN_ACCESS_TTL', 300)
+
+
+def _datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+class DenyList:
+    """The revoked access tokens that have not expired yet."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._expires = {}
+        self._loaded = None
+
+    @property
+    def refresh_interval(self):
+        return getattr(settings, 'SIGNED_TOKEN_DENY_LIST_REFRESH', 5)
+
+    def _load(self):
+        """Replace the revoked tokens with those in the database."""
+        self._expires = dict(RevokedToken.objects.filter(
+            token_type=ACCESS,
+            expires__gt=_datetime(time.time()),
+        ).values_list('jti', 'expires'))
+        self._loaded = time.monotonic()
+
+    def __contains__(self, jti):
+        with self._lock:
+            if self._loaded is None or \
+                    self._loaded + self.refresh_interval < time.monotonic():
+                self._load()
+            return jti in self._expires
+
+    def add(self, signed_token):
+        """Deny signed_token in this process right away."""
+        with self._lock:
+            self._expires[signed_token.jti] = _datetime(signed_token.expires)
+
+    def clear(self):
+        """Forget the loaded tokens, they are loaded again on next use."""
+        with self._lock:
+            self._expires = {}
+            self._loaded = None
+
+
+deny_list = DenyList()
+
+
+def _salt(token_type):
+    return f'core.tokens.{token_type}'
+
+
+def issue(user, token_type=ACCESS):
+    """Return a new signed token of token_type for user."""
+    payload = {
+        'uid': user.pk,
+        'stf': user.is_staff,
+        'sup': user.is_superuser,
+        'exp': int(time.time()) + _lifetime(token_type),
+        'jti': secrets.token_hex(8),
+        'typ': token_type,
+    }
+    return signing.dumps(payload, salt=_salt(token_type))
+
+
+def issue_pair(user):
+    """Return a new access and refresh token for user."""
+    return {
+        'token': issue(user, ACCESS),
+        'refresh': issue(user, REFRESH),
+        'expires_in': _lifetime(ACCESS),
+    }
+
+
+def verify(token, token_type=ACCESS):
+    """Return the SignedToken of token or raise InvalidToken."""
+    try:
+        payload = signing.loads(token, salt=_salt(token_type))
+    except signing.BadSignature:
+        raise InvalidToken('Invalid token.')
+    if not isinstance(payload, dict) or payload.get('typ') != token_type:
+        raise InvalidToken('Invalid token.')
+    if payload['exp'] <= time.time():
+        raise InvalidToken('Token has expired.')
+    if token_type == ACCESS:
+        revoked = payload['jti'] in deny_list
+    else:
+        revoked = RevokedToken.objects.filter(jti=payload['jti']).exists()
+    if revoked:
+        raise InvalidToken('Token has been revoked.')
+
+    return SignedToken(payload)
+
+
+def revoke(signed_token):
+    """
+    Deny signed_token until it expires.
+
+    Return False if it was already denied. The check and the write are
+    one insert on a unique column, so of concurrent calls only one
+    returns True.
+    """
+    RevokedToken.objects.filter(expires__lte=_datetime(time.time())).delete()
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(
+                jti=signed_token.jti,
+                token_type=signed_token.type,
+                expires=_datetime(signed_token.expires),
+            )
+    except IntegrityError:
+        return False
+    if signed_token.type == ACCESS:
+        deny_list.add(signed_token)
+    return True
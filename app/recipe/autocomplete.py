@@ -0,0 +1,163 @@
+"""
+in-memory autocomplete over the names of tags and ingredients
+
+every user gets, per model, their names sorted case-insensitively so
+prefix matches are found with a binary search, and a trigram index
+answering misspelled or partial queries by similarity.
+
+the index is local to the process. it is dropped by the signal handlers
+in recipe.signals when a name of the user is written, and remembers the
+collection version of the user it was built at (see recipe.caching), so
+it is rebuilt when a write of another process changes the version.
+without a version cache it is rebuilt after RECIPE_AUTOCOMPLETE_TTL
+seconds, which bounds how long those writes are missed.
+"""
+import bisect
+import re
+import threading
+import time
+from collections import (
+    Counter,
+    defaultdict,
+)
+
+from django.conf import settings
+from django.db import transaction
+
+SIMILARITY_THRESHOLD = 0.3
+WORD_RE = re.compile(r'\w+')
+
+
+def trigrams(text):
+    """return the trigrams of the words of text, padded like pg_trgm"""
+    grams = set()
+    for word in WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex:
+    """prefix and trigram index of the names of one user"""
+
+    def __init__(self, items, version=None):
+        self.built = time.monotonic()
+        self.version = version
+        self.items = sorted(
+            items, key=lambda item: (item[1].lower(), item[0]),
+        )
+        self.keys = [name.lower() for _, name in self.items]
+        self.sizes = []
+        self.postings = defaultdict(list)
+        for position, (_, name) in enumerate(self.items):
+            grams = trigrams(name)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(position)
+
+    def prefix(self, query, limit):
+        """return the positions of up to limit names starting with query"""
+        start = bisect.bisect_left(self.keys, query)
+        positions = []
+        for position in range(start, len(self.keys)):
+            if len(positions) == limit or \
+                    not self.keys[position].startswith(query):
+                break
+            positions.append(position)
+        return positions
+
+    def similar(self, query, limit, skip=()):
+        """return the positions of up to limit names most like query"""
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        scored = []
+        for position, count in shared.items():
+            if position in skip:
+                continue
+            similarity = count / (len(grams) + self.sizes[position] - count)
+            if similarity >= SIMILARITY_THRESHOLD:
+                scored.append((-similarity, self.keys[position], position))
+        scored.sort()
+        return [position for _, _, position in scored[:limit]]
+
+    def complete(self, query, limit):
+        """return up to limit (id, name) pairs, prefix matches first"""
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        positions = self.prefix(query, limit)
+        if len(positions) < limit:
+            positions += self.similar(
+                query, limit - len(positions), set(positions),
+            )
+        return [self.items[position] for position in positions]
+
+
+class AutocompleteIndex:
+    """per user name indexes of a model with a name and a user"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._generations = Counter()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'RECIPE_AUTOCOMPLETE_TTL', 300)
+
+    def _is_stale(self, index, version):
+        if version is not None:
+            return index.version != version
+        return index.built + self.ttl < time.monotonic()
+
+    def complete(self, model, user_id, query, limit=10, version=None):
+        """
+        return up to limit (id, name) pairs of model matching query
+
+        version is the current collection version of the user, if known.
+        """
+        key = (model._meta.label, user_id)
+        with self._lock:
+            index = self._indexes.get(key)
+            generation = self._generations[key]
+        if index is None or self._is_stale(index, version):
+            index = NameIndex(
+                model.objects.filter(user_id=user_id)
+                .values_list('id', 'name'),
+                version,
+            )
+            with self._lock:
+                # an invalidation during the build means it may be stale
+                if self._generations[key] == generation:
+                    self._indexes[key] = index
+
+        return index.complete(query, limit)
+
+    def _drop(self, key):
+        with self._lock:
+            self._indexes.pop(key, None)
+            self._generations[key] += 1
+
+    def invalidate(self, model, user_id):
+        """
+        drop the index of a user so it is rebuilt on next use
+
+        inside a transaction the index is dropped again on commit, so an
+        index built from the names before the commit is not kept.
+        """
+        key = (model._meta.label, user_id)
+        self._drop(key)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self._drop(key))
+
+    def clear(self):
+        """drop every index"""
+        with self._lock:
+            self._indexes.clear()
+
+
+name_index = AutocompleteIndex()
@@ -0,0 +1,63 @@
+"""
+Sample data shared by the recipe benchmark commands.
+"""
+from django.contrib.auth import get_user_model
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+
+def create_sample_data(rng, recipes, vocabulary, per_recipe):
+    """
+    Create a user with sample recipes, tags and ingredients.
+
+    Return the user and the ids of their tags and ingredients.
+    """
+    user = get_user_model().objects.create_user(
+        f'benchmark-{rng.getrandbits(32)}@example.com',
+    )
+    Tag.objects.bulk_create(
+        Tag(user=user, name=f'tag {i}') for i in range(vocabulary)
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'ingredient {i}')
+        for i in range(vocabulary)
+    )
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                user=user,
+                title=f'recipe {i}',
+                time_minutes=10,
+                price='1.00',
+            )
+            for i in range(recipes)
+        ),
+        batch_size=1000,
+    )
+
+    tag_ids = list(user.tag_set.values_list('id', flat=True))
+    ingredient_ids = list(user.ingredient_set.values_list('id', flat=True))
+    recipe_ids = list(user.recipe_set.values_list('id', flat=True))
+    per_recipe = min(per_recipe, vocabulary)
+    for field_name, related_ids in (
+        ('tags', tag_ids),
+        ('ingredients', ingredient_ids),
+    ):
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        through.objects.bulk_create(
+            (
+                through(**{source: recipe_id, target: related_id})
+                for recipe_id in recipe_ids
+                for related_id in rng.sample(related_ids, per_recipe)
+            ),
+            batch_size=5000,
+        )
+
+    return user, tag_ids, ingredient_ids
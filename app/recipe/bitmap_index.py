@@ -0,0 +1,251 @@
+"""
+in-memory index of the recipes of each tag and ingredient
+
+every user gets a dense position for each of their recipes, and each tag
+and ingredient keeps a bitset of the positions of its recipes, stored as
+a python int. filter combinations are answered with bitwise operations
+and only the matching recipe ids go to the database.
+
+the index is local to the process. it is kept up to date by the signal
+handlers in recipe.signals, and remembers the collection version of the
+user it was built at (see recipe.caching). queries pass the current
+version and the index is rebuilt when it differs, so writes made by other
+processes are seen at once. without a version cache it is rebuilt after
+RECIPE_BITMAP_INDEX_TTL seconds, which bounds how long they are missed.
+changes made inside a transaction are applied once it commits, so a
+rollback leaves the index alone.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from core.models import Recipe
+
+FIELDS = ('tags', 'ingredients')
+
+
+def is_enabled():
+    """return True if the recipe views should use the index"""
+    return getattr(settings, 'RECIPE_BITMAP_INDEX', False)
+
+
+class UserIndex:
+    """bitsets of the recipes of one user"""
+
+    def __init__(self, recipe_ids, version=None):
+        self.built = time.monotonic()
+        self.version = version
+        self.ids = []
+        self.positions = {}
+        self.recipes = 0
+        self.bitsets = {field_name: {} for field_name in FIELDS}
+        for recipe_id in recipe_ids:
+            self.add_recipe(recipe_id)
+
+    def add_recipe(self, recipe_id):
+        """return the position of recipe_id, adding it if needed"""
+        position = self.positions.get(recipe_id)
+        if position is None:
+            position = len(self.ids)
+            self.ids.append(recipe_id)
+            self.positions[recipe_id] = position
+        self.recipes |= 1 << position
+        return position
+
+    def remove_recipe(self, recipe_id):
+        """clear the bit of recipe_id everywhere"""
+        position = self.positions.get(recipe_id)
+        if position is None:
+            return
+        self.recipes &= ~(1 << position)
+        for field_name in FIELDS:
+            self.clear_recipe(field_name, recipe_id)
+
+    def clear_recipe(self, field_name, recipe_id):
+        """clear the bit of recipe_id in every bitset of field_name"""
+        position = self.positions.get(recipe_id)
+        if position is None:
+            return
+        mask = ~(1 << position)
+        bitsets = self.bitsets[field_name]
+        for related_id in bitsets:
+            bitsets[related_id] &= mask
+
+    def add(self, field_name, pairs):
+        """set the bits of (recipe id, related id) pairs"""
+        bitsets = self.bitsets[field_name]
+        for recipe_id, related_id in pairs:
+            position = self.add_recipe(recipe_id)
+            bitsets[related_id] = bitsets.get(related_id, 0) | 1 << position
+
+    def remove(self, field_name, pairs):
+        """clear the bits of (recipe id, related id) pairs"""
+        bitsets = self.bitsets[field_name]
+        for recipe_id, related_id in pairs:
+            position = self.positions.get(recipe_id)
+            if position is not None and related_id in bitsets:
+                bitsets[related_id] &= ~(1 << position)
+
+    def remove_related(self, field_name, related_id):
+        """drop the bitset of a deleted tag or ingredient"""
+        self.bitsets[field_name].pop(related_id, None)
+
+    def match(self, field_name, related_ids, match_all):
+        """return the bitset of recipes related to any or all ids"""
+        bitsets = self.bitsets[field_name]
+        related_ids = set(related_ids)
+        if match_all:
+            result = self.recipes
+            for related_id in related_ids:
+                result &= bitsets.get(related_id, 0)
+            return result
+
+        result = 0
+        for related_id in related_ids:
+            result |= bitsets.get(related_id, 0)
+        return result
+
+    def recipe_ids(self, bitset):
+        """return the recipe ids in bitset, highest id first"""
+        bits = bin(bitset)[:1:-1]
+        ids = []
+        position = bits.find('1')
+        while position != -1:
+            ids.append(self.ids[position])
+            position = bits.find('1', position + 1)
+        ids.sort(reverse=True)
+        return ids
+
+
+class RecipeBitmapIndex:
+    """per user bitmap indexes of recipe tags and ingredients"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'RECIPE_BITMAP_INDEX_TTL', 300)
+
+    def _build(self, user_id, version):
+        """load the index of a user from the database"""
+        index = UserIndex(
+            Recipe.objects.filter(user_id=user_id)
+            .order_by('id').values_list('id', flat=True),
+            version,
+        )
+        for field_name in FIELDS:
+            field = Recipe._meta.get_field(field_name)
+            source = f'{field.m2m_field_name()}_id'
+            target = f'{field.m2m_reverse_field_name()}_id'
+            index.add(
+                field_name,
+                field.remote_field.through.objects.filter(
+                    **{f'{field.m2m_field_name()}__user_id': user_id}
+                ).values_list(source, target),
+            )
+        return index
+
+    def _is_stale(self, index, version):
+        if version is not None:
+            return index.version != version
+        return index.built + self.ttl < time.monotonic()
+
+    def _get(self, user_id, version=None):
+        """
+        return the index of a user at collection version, building it if
+        needed
+
+        the version is read before the rows, so an index built while a
+        write commits is at worst rebuilt once more.
+        """
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None or self._is_stale(index, version):
+                index = self._users[user_id] = self._build(user_id, version)
+            return index
+
+    def _apply(self, user_id, method, *args):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                getattr(index, method)(*args)
+
+    def _update(self, user_id, method, *args):
+        """
+        apply a change to the index of a user if it is loaded
+
+        inside a transaction the change waits for the commit. an index
+        built meanwhile read the rows before it, and the changes can be
+        applied twice.
+        """
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(
+                lambda: self._apply(user_id, method, *args),
+            )
+        else:
+            self._apply(user_id, method, *args)
+
+    def query(self, user_id, include=None, exclude=None, match_all=False,
+              version=None, before=None, after=None, limit=None):
+        """
+        return the ids of the recipes of a user matching the filters,
+        highest id first
+
+        include and exclude map a field name to related ids. a recipe
+        matches if it is related to any (or with match_all, every) of the
+        included ids of each field and to none of the excluded ids.
+        version is the current collection version of the user, if known.
+        before and after keep the ids below or above an id, and limit
+        keeps that many of them, the highest ones or with after the
+        lowest ones.
+        """
+        with self._lock:
+            index = self._get(user_id, version)
+            result = index.recipes
+            for field_name, related_ids in (include or {}).items():
+                result &= index.match(field_name, related_ids, match_all)
+            for field_name, related_ids in (exclude or {}).items():
+                result &= ~index.match(field_name, related_ids, False)
+            ids = index.recipe_ids(result)
+
+        if before is not None:
+            ids = [pk for pk in ids if pk < before]
+        if after is not None:
+            ids = [pk for pk in ids if pk > after]
+            return ids[-limit:] if limit else ids
+        return ids[:limit] if limit else ids
+
+    def add_recipe(self, user_id, recipe_id):
+        self._update(user_id, 'add_recipe', recipe_id)
+
+    def remove_recipe(self, user_id, recipe_id):
+        self._update(user_id, 'remove_recipe', recipe_id)
+
+    def add(self, user_id, field_name, pairs):
+        self._update(user_id, 'add', field_name, pairs)
+
+    def remove(self, user_id, field_name, pairs):
+        self._update(user_id, 'remove', field_name, pairs)
+
+    def clear_recipe(self, user_id, field_name, recipe_id):
+        self._update(user_id, 'clear_recipe', field_name, recipe_id)
+
+    def remove_related(self, user_id, field_name, related_id):
+        self._update(user_id, 'remove_related', field_name, related_id)
+
+    def invalidate(self, user_id):
+        """drop the index of a user so it is rebuilt on next use"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        """drop every index"""
+        with self._lock:
+            self._users.clear()
+
+
+recipe_index = RecipeBitmapIndex()
@@ -0,0 +1,247 @@
+"""
+per user collection versions, conditional GETs and the list cache
+
+every user has a version token, stored in the RECIPE_VERSION_CACHE cache
+shared by every process, that changes on any write to their recipes,
+tags or ingredients, see recipe.signals.
+list responses carry an ETag derived from it, so an unchanged collection
+is answered with 304 before the list query runs, and rendered list data
+is cached under keys containing it, so a write invalidates every cached
+list of the user without looking up or deleting any key. without a
+version cache neither ETags nor the list cache are used.
+"""
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _cache():
+    alias = getattr(settings, 'RECIPE_VERSION_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _key(user_id):
+    return f'collection-version:{user_id}'
+
+
+def get_version(user_id):
+    """return the current collection version of a user"""
+    cache = _cache()
+    version = cache.get(_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_key(user_id), version, None):
+            version = cache.get(_key(user_id), version)
+    return version
+
+
+def request_version(request):
+    """return the collection version of the user of request, read once"""
+    if not hasattr(request, '_collection_version'):
+        request._collection_version = get_version(request.user.pk)
+    return request._collection_version
+
+
+def current_version(request):
+    """
+    return the collection version of the user of request, or None
+    without a version cache
+    """
+    if _cache() is None:
+        return None
+    return request_version(request)
+
+
+def _set_new_version(user_id):
+    _cache().set(_key(user_id), uuid.uuid4().hex, None)
+
+
+class _PendingVersions(set):
+    """users whose version changes when the transaction commits"""
+    done = False
+
+    def __call__(self):
+        self.done = True
+        for user_id in self:
+            _set_new_version(user_id)
+
+
+def _pending_versions(connection):
+    """return the pending versions of the transaction, registered once"""
+    for entry in connection.run_on_commit:
+        if isinstance(entry[1], _PendingVersions) and not entry[1].done:
+            return entry[1]
+    pending = _PendingVersions()
+    transaction.on_commit(pending)
+    return pending
+
+
+def bump_version(user_id):
+    """
+    change the collection version of a user after a write
+
+    inside a transaction the version changes on commit, so a response
+    built from the data before the commit is not served under the new
+    version, and a rollback leaves it alone. the writes of a transaction
+    change the version of each user once.
+    """
+    if _cache() is None:
+        return
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        _pending_versions(connection).add(user_id)
+    else:
+        _set_new_version(user_id)
+
+
+def collection_etag(request):
+    """return the strong ETag of a list request of the current user"""
+    version = request_version(request)
+    digest = hashlib.sha1(
+        f'{request.user.pk}:{version}:{request.accepted_media_type}:'
+        f'{request.get_full_path()}'.encode('utf-8')
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def recipe_etag(request, recipe):
+    """
+    return the strong ETag of a detail request, from the updated_at of
+    the recipe to the microsecond
+    """
+    digest = hashlib.sha1(
+        f'{recipe.pk}:{recipe.updated_at.isoformat()}:'
+        f'{request.accepted_media_type}:{request.get_full_path()}'
+        .encode('utf-8')
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+class CollectionETagMixin:
+    """
+    answer list requests with the ETag of the user's collection version
+    and with 304 when the client already has it
+    """
+
+    def list(self, request, *args, **kwargs):
+        if _cache() is None:
+            return super().list(request, *args, **kwargs)
+
+        etag = collection_etag(request)
+        matches = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in matches or '*' in matches:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class CacheStats:
+    """
+    hit and miss counters of the list cache in this process, served by
+    the list-cache-stats action of the recipe api
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+list_cache_stats = CacheStats()
+
+
+def _list_cache():
+    alias = getattr(settings, 'RECIPE_LIST_CACHE', None)
+    return caches[alias] if alias else None
+
+
+class CachedListMixin:
+    """
+    cache the data of list responses per user, collection version and
+    normalized query params
+
+    the params named in `id_list_params` are comma separated ids whose
+    order does not matter, they are sorted before building the key.
+    """
+    id_list_params = ()
+
+    def _normalized_params(self, request):
+        params = []
+        for name in sorted(request.query_params):
+            values = request.query_params.getlist(name)
+            if name in self.id_list_params:
+                values = [
+                    ','.join(sorted({
+                        value.strip()
+                        for param in values
+                        for value in param.split(',')
+                    }))
+                ]
+            params.append((name, values))
+        return params
+
+    def list_cache_key(self, request):
+        """return the cache key of the list request"""
+        digest = hashlib.sha1(repr((
+            request.get_host(),
+            request.path,
+            request.accepted_media_type,
+            self._normalized_params(request),
+        )).encode('utf-8')).hexdigest()
+        return (
+            f'recipe-list:{request.user.pk}:{request_version(request)}:'
+            f'{digest}'
+        )
+
+    def list(self, request, *args, **kwargs):
+        cache = _list_cache()
+        if cache is None or _cache() is None:
+            return super().list(request, *args, **kwargs)
+
+        key = self.list_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            list_cache_stats.hit()
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        list_cache_stats.miss()
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(
+                key,
+                response.data,
+                getattr(settings, 'RECIPE_LIST_CACHE_TIMEOUT', 300),
+            )
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,43 @@
+"""filtering for recipe api"""
+from django.db.models import (
+    Count,
+    Exists,
+    OuterRef,
+)
+
+from core.models import Recipe
+
+
+def _through_rows(field_name, ids):
+    """return the through rows of the m2m field_name to ids"""
+    field = Recipe._meta.get_field(field_name)
+    source = f'{field.m2m_field_name()}_id'
+    target = f'{field.m2m_reverse_field_name()}_id'
+    rows = field.remote_field.through.objects.filter(**{f'{target}__in': ids})
+    return rows, source, target
+
+
+def filter_by_related(queryset, field_name, ids, match_all=False):
+    """
+    filter recipes related to any of ids through the m2m field_name
+
+    the relation is checked with a semi-join on the through table, so no
+    DISTINCT is needed. with match_all the recipe must be related to every
+    id, which is answered by grouping the through rows of those ids.
+    """
+    ids = set(ids)
+    rows, source, target = _through_rows(field_name, ids)
+
+    if match_all:
+        matching = rows.values(source).annotate(
+            matched=Count(target),
+        ).filter(matched=len(ids)).values(source)
+        return queryset.filter(id__in=matching)
+
+    return queryset.filter(Exists(rows.filter(**{source: OuterRef('pk')})))
+
+
+def exclude_related(queryset, field_name, ids):
+    """exclude recipes related to any of ids through the m2m field_name"""
+    rows, source, target = _through_rows(field_name, set(ids))
+    return queryset.filter(~Exists(rows.filter(**{source: OuterRef('pk')})))
@@ -0,0 +1,322 @@
+"""
+resized variants of recipe images
+
+every uploaded image gets a variant per size in RECIPE_IMAGE_SIZES that
+fits in a square of that many pixels. variants are stored next to the
+original under names derived from its name, so they need no column.
+
+with RECIPE_IMAGE_ASYNC, uploads are stored as they are, left pending
+and answered at once. the variants are made by process_images workers,
+separate processes claiming the pending recipes from the database, so
+the queue survives restarts and the web processes do no image work. the
+progress is kept in Recipe.image_status.
+
+with RECIPE_IMAGE_CONTENT_ADDRESSED, uploads are stored under the sha256
+of their content. recipes with the same image share the file and its
+variants, counted by a ContentImage row, and the files are deleted when
+the last recipe lets go of them.
+"""
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import (
+    Image,
+    ImageOps,
+)
+
+from core.models import (
+    ContentImage,
+    ImageStatus,
+    Recipe,
+)
+from recipe.caching import bump_version
+
+logger = logging.getLogger(__name__)
+
+JPEG_QUALITY = 85
+CONTENT_ADDRESSED_DIRECTORY = 'uploads/recipe/sha256'
+# file extensions of the pillow formats, others use the format name
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif'}
+
+
+def sizes():
+    """return the sizes of the variants, largest first"""
+    return sorted(
+        getattr(settings, 'RECIPE_IMAGE_SIZES', (128, 512, 1024)),
+        reverse=True,
+    )
+
+
+def variant_name(name, size):
+    """return the storage name of the variant of image name at size"""
+    root, ext = os.path.splitext(name)
+    return f'{root}_{size}{ext}'
+
+
+def _encode(image, image_format):
+    """return image encoded in image_format"""
+    options = {'optimize': True}
+    if image_format == 'JPEG':
+        options.update(quality=JPEG_QUALITY, progressive=True)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def create_variants(image):
+    """
+    write the resized variants of image, a FieldFile
+
+    jpeg is decoded at the smallest scale still covering the largest
+    size, and every variant is resized from the next larger one.
+    """
+    largest = sizes()[0]
+    with image.open('rb'), Image.open(image) as original:
+        image_format = original.format
+        original.draft('RGB', (largest, largest))
+        current = ImageOps.exif_transpose(original)
+        current.load()
+
+    storage = image.storage
+    for size in sizes():
+        current.thumbnail((size, size), Image.LANCZOS)
+        name = variant_name(image.name, size)
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(_encode(current, image_format)))
+
+
+def delete_variants(image):
+    """delete the stored variants of image"""
+    for size in sizes():
+        image.storage.delete(variant_name(image.name, size))
+
+
+def variants_exist(storage, name):
+    """return True if every variant of the image name is in storage"""
+    return all(
+        storage.exists(variant_name(name, size)) for size in sizes()
+    )
+
+
+def is_content_addressed_name(name):
+    """return True if name is the storage name of a content addressed file"""
+    return name.startswith(f'{CONTENT_ADDRESSED_DIRECTORY}/')
+
+
+def is_content_addressed():
+    """return True if uploads are stored under the digest of their content"""
+    return getattr(settings, 'RECIPE_IMAGE_CONTENT_ADDRESSED', False)
+
+
+def image_extension(file):
+    """
+    return the file extension of the format of an uploaded image
+
+    the format is the one found by pillow in the content, not the one the
+    client named the file after. files validated by an ImageField carry
+    the image it opened, others are opened again.
+    """
+    image_format = getattr(getattr(file, 'image', None), 'format', None)
+    if image_format is None:
+        file.seek(0)
+        with Image.open(file) as image:
+            image_format = image.format
+        file.seek(0)
+    return FORMAT_EXTENSIONS.get(image_format, f'.{image_format.lower()}')
+
+
+def content_name(file):
+    """
+    return the content addressed storage name of an uploaded file
+
+    files from recipe.uploads.ImageUploadHandler were hashed while they
+    were received, others are read again.
+    """
+    digest = getattr(file, 'sha256', None)
+    if digest is None:
+        digest = hashlib.sha256()
+        for chunk in file.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+    ext = image_extension(file)
+    return f'{CONTENT_ADDRESSED_DIRECTORY}/{digest[:2]}/{digest}{ext}'
+
+
+def store_image(field, file):
+    """
+    store an uploaded file under its digest and return its name
+
+    the file is written only if no recipe references the same content.
+    the reference taken is released with release_image. call it inside
+    a transaction.
+    """
+    name = content_name(file)
+    image, _ = ContentImage.objects.select_for_update().get_or_create(
+        name=name,
+    )
+    if not field.storage.exists(name):
+        field.storage.save(name, file)
+    image.references += 1
+    image.save(update_fields=['references'])
+    return name
+
+
+def release_image(image):
+    """
+    drop a reference to a content addressed image, a FieldFile, and
+    delete its files with the last one
+
+    the files go while the row is locked, so a concurrent upload of the
+    same content waits and then writes them again.
+    """
+    with transaction.atomic():
+        if not is_content_addressed_name(image.name):
+            return
+        content = ContentImage.objects.select_for_update().filter(
+            name=image.name,
+        ).first()
+        if content is None:
+            return
+        content.references -= 1
+        if content.references > 0:
+            content.save(update_fields=['references'])
+            return
+
+        content.delete()
+        delete_variants(image)
+        image.storage.delete(image.name)
+
+
+def save_upload(serializer):
+    """
+    save the recipe of a valid ImageSerializer with its new image
+
+    content addressed images already processed for another recipe are
+    ready at once.
+    """
+    if not is_content_addressed():
+        return serializer.save(image_status=ImageStatus.PENDING)
+
+    field = Recipe._meta.get_field('image')
+    old = serializer.instance.image or None
+    with transaction.atomic():
+        name = store_image(field, serializer.validated_data['image'])
+        recipe = serializer.save(
+            image=name,
+            image_status=(
+                ImageStatus.READY if variants_exist(field.storage, name)
+                else ImageStatus.PENDING
+            ),
+        )
+        if old is not None:
+            release_image(old)
+    return recipe
+
+
+def variant_urls(image):
+    """return the urls of the variants of image by size"""
+    return {
+        str(size): image.storage.url(variant_name(image.name, size))
+        for size in sorted(sizes())
+    }
+
+
+def is_async():
+    """return True if uploads are left to the process_images workers"""
+    return getattr(settings, 'RECIPE_IMAGE_ASYNC', False)
+
+
+def set_status(recipe, image_status):
+    """
+    record the image status of recipe, unless its image changed since
+
+    the recipe counts as updated, so cached responses showing the old
+    status are not served.
+    """
+    updated = Recipe.objects.filter(
+        pk=recipe.pk, image=recipe.image.name,
+    ).update(image_status=image_status, updated_at=timezone.now())
+    if updated:
+        recipe.image_status = image_status
+        bump_version(recipe.user_id)
+    return bool(updated)
+
+
+def process_image(recipe_id):
+    """create the variants of the image of a recipe and record the outcome"""
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'id', 'user_id', 'image', 'image_status',
+    ).first()
+    if recipe is None or not recipe.image:
+        return
+    if not set_status(recipe, ImageStatus.PROCESSING):
+        return
+    make_variants(recipe)
+
+
+def make_variants(recipe):
+    """
+    create the variants of the image of recipe and record the outcome
+
+    return False if the image could not be processed.
+    """
+    try:
+        create_variants(recipe.image)
+    except Exception:
+        logger.exception('processing the image of recipe %s failed', recipe.pk)
+        set_status(recipe, ImageStatus.FAILED)
+        return False
+    set_status(recipe, ImageStatus.READY)
+    return True
+
+
+def claim_image(statuses=(ImageStatus.PENDING,), stale_after=None):
+    """
+    mark the recipe waiting longest with an image in one of statuses as
+    processing and return it, or None if there is none
+
+    with stale_after seconds, recipes left processing that long by a
+    stopped worker are claimed too. the status is changed with an update
+    conditional on the row read, so of concurrent workers only one claims
+    a recipe and the others move on to the next.
+    """
+    waiting = Q(image_status__in=statuses)
+    if stale_after is not None:
+        waiting |= Q(
+            image_status=ImageStatus.PROCESSING,
+            updated_at__lt=timezone.now() - timedelta(seconds=stale_after),
+        )
+    candidates = Recipe.objects.filter(waiting).exclude(image='').exclude(
+        image=None,
+    ).order_by('updated_at', 'id').only(
+        'id', 'user_id', 'image', 'image_status', 'updated_at',
+    )
+
+    while True:
+        recipe = candidates.first()
+        if recipe is None:
+            return None
+        claimed = Recipe.objects.filter(
+            pk=recipe.pk,
+            image=recipe.image.name,
+            image_status=recipe.image_status,
+            updated_at=recipe.updated_at,
+        ).update(
+            image_status=ImageStatus.PROCESSING,
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            recipe.image_status = ImageStatus.PROCESSING
+            bump_version(recipe.user_id)
+            return recipe
@@ -0,0 +1,318 @@
+"""
+bulk import of recipes from NDJSON or CSV records
+
+records are read one at a time and written in batches, one transaction
+per batch. tag and ingredient names are resolved against a dictionary of
+the names of each user, loaded once, so a batch only looks up the names
+it sees for the first time. recipes and their through rows are written
+with COPY on postgres and bulk_create elsewhere.
+
+the writes send the bulk signals of recipe.signals, so the indexes and
+collection versions follow the imported rows.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import (
+    connection,
+    transaction,
+)
+from django.db.models import (
+    Q,
+    Value,
+)
+from django.db.models.functions import Lower
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.signals import (
+    named_objects_created,
+    recipe_relations_changed,
+    recipes_created,
+)
+
+FORMATS = ('ndjson', 'csv')
+RECIPE_FIELDS = ('title', 'description', 'time_minutes', 'price', 'link')
+NAMED_FIELDS = {
+    'tags': Tag,
+    'ingredients': Ingredient,
+}
+# separates the tag and ingredient names in a csv column
+CSV_NAME_SEPARATOR = '|'
+
+
+class InvalidRecord(ValueError):
+    """a record that can not be imported"""
+
+
+def read_records(stream, input_format):
+    """yield the raw records of a text stream in input_format"""
+    if input_format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield line
+
+
+def _names(value, field_name):
+    """return the names of a tags or ingredients value"""
+    if isinstance(value, str):
+        value = value.split(CSV_NAME_SEPARATOR)
+    if not isinstance(value, list):
+        raise InvalidRecord(f'{field_name}: expected a list of names')
+
+    max_length = NAMED_FIELDS[field_name]._meta.get_field('name').max_length
+    names = []
+    for item in value:
+        # exported recipes carry {"id": ..., "name": ...} objects
+        if isinstance(item, dict):
+            item = item.get('name')
+        if not isinstance(item, str):
+            raise InvalidRecord(f'{field_name}: expected a list of names')
+        item = item.strip()
+        if len(item) > max_length:
+            raise InvalidRecord(f'{field_name}: name longer than {max_length}')
+        if item:
+            names.append(item)
+    return names
+
+
+def _copy_value(value):
+    """return value as a field of COPY csv input, NULL written as \\N"""
+    if value is None:
+        return '\\N'
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class RecipeImporter:
+    """
+    write records to the database in batches
+
+    records are dicts, or NDJSON lines, with the recipe fields, tags and
+    ingredients as lists of names and optionally the email of the owner
+    as user, which defaults to default_user.
+    """
+
+    def __init__(self, default_user=None, use_copy=None):
+        self.default_user = default_user
+        if use_copy is None:
+            use_copy = connection.vendor == 'postgresql'
+        self.use_copy = use_copy
+        self.users = {}
+        self.names = {}
+
+    def _user_id(self, email):
+        if email not in self.users:
+            self.users[email] = get_user_model().objects.filter(
+                email=email,
+            ).values_list('id', flat=True).first()
+        if self.users[email] is None:
+            raise InvalidRecord(f'user: no user with email {email}')
+        return self.users[email]
+
+    def clean(self, raw):
+        """
+        return the recipe and (field name, names) pairs of a raw record
+
+        raise InvalidRecord if it can not be imported.
+        """
+        if isinstance(raw, str):
+            try:
+                raw = json.loads(raw)
+            except ValueError as exc:
+                raise InvalidRecord(f'invalid JSON: {exc}') from exc
+        if not isinstance(raw, dict):
+            raise InvalidRecord('expected an object')
+
+        email = raw.get('user') or self.default_user
+        if not email:
+            raise InvalidRecord('user: no user given')
+        values = {name: raw[name] for name in RECIPE_FIELDS if name in raw}
+        for name, value in values.items():
+            field = Recipe._meta.get_field(name)
+            # clean_fields skips empty fields allowed to be blank, a null
+            # would only fail on insert and take the batch with it
+            if value is None and not field.null and \
+                    field.empty_strings_allowed:
+                values[name] = ''
+        recipe = Recipe(user_id=self._user_id(email), **values)
+        try:
+            recipe.clean_fields(exclude=['user', 'image', 'updated_at'])
+        except ValidationError as exc:
+            raise InvalidRecord('; '.join(
+                f'{name}: {" ".join(messages)}'
+                for name, messages in exc.message_dict.items()
+            )) from exc
+
+        return recipe, [
+            (field_name, _names(raw.get(field_name) or [], field_name))
+            for field_name in NAMED_FIELDS
+        ]
+
+    def _known_names(self, model, user_id):
+        """return the lower cased name to id map of a user, loaded once"""
+        key = (model, user_id)
+        if key not in self.names:
+            self.names[key] = {
+                name.lower(): pk
+                for pk, name in model.objects.filter(
+                    user_id=user_id,
+                ).values_list('id', 'name')
+            }
+        return self.names[key]
+
+    def _create_missing(self, model, user_id, names):
+        """create the names a user does not have yet"""
+        known = self._known_names(model, user_id)
+        missing = {}
+        for name in names:
+            if name.lower() not in known:
+                missing.setdefault(name.lower(), name)
+        if not missing:
+            return
+
+        # rows inserted meanwhile by the api conflict on the unique
+        # (user, lower(name)) index and are looked up below
+        model.objects.bulk_create(
+            [model(user_id=user_id, name=name) for name in missing.values()],
+            ignore_conflicts=True,
+        )
+        named_objects_created.send(sender=model, user_id=user_id)
+        rows = model.objects.annotate(name_key=Lower('name')).filter(
+            Q(name_key__in=list(missing)) | Q(name__in=list(missing.values())),
+            user_id=user_id,
+        ).values_list('id', 'name')
+        known.update((name.lower(), pk) for pk, name in rows)
+        for key, name in missing.items():
+            if key not in known:
+                # lower cased differently by python and the database, look
+                # it up the way the unique index compares names
+                known[key] = model.objects.annotate(
+                    name_key=Lower('name'),
+                ).filter(
+                    user_id=user_id, name_key=Lower(Value(name)),
+                ).values_list('id', flat=True).get()
+
+    def _reserve_ids(self, model, count):
+        """return count ids taken from the sequence of model"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [model._meta.db_table, model._meta.pk.column, count],
+            )
+            return [pk for pk, in cursor.fetchall()]
+
+    def _copy(self, model, objs, with_ids):
+        """write objs with COPY, setting their ids first with with_ids"""
+        if with_ids:
+            for obj, pk in zip(objs, self._reserve_ids(model, len(objs))):
+                obj.pk = pk
+        fields = [
+            field for field in model._meta.concrete_fields
+            if with_ids or not field.primary_key
+        ]
+        buffer = io.StringIO()
+        for obj in objs:
+            buffer.write(','.join(
+                _copy_value(field.get_db_prep_save(
+                    field.pre_save(obj, True), connection,
+                ))
+                for field in fields
+            ))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {quote(model._meta.db_table)} '
+                f'({", ".join(quote(field.column) for field in fields)}) '
+                f"FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer,
+            )
+
+    def _insert(self, model, objs, with_ids=False):
+        """write objs in bulk, with with_ids their ids are set after"""
+        if self.use_copy:
+            self._copy(model, objs, with_ids)
+            return
+
+        if with_ids and \
+                not connection.features.can_return_rows_from_bulk_insert:
+            # the backend only returns the id of a single row insert, the
+            # ids of concurrent inserts may interleave with ours
+            fields = [
+                field for field in model._meta.concrete_fields
+                if not field.primary_key
+            ]
+            for obj in objs:
+                (obj.pk,), = model._base_manager._insert(
+                    [obj], fields, returning_fields=[model._meta.pk],
+                )
+                obj._state.adding = False
+            return
+
+        model.objects.bulk_create(objs)
+
+    def write(self, batch):
+        """write a batch of cleaned records in one transaction"""
+        if not batch:
+            return
+
+        with transaction.atomic():
+            recipes = [recipe for recipe, _ in batch]
+            self._insert(Recipe, recipes, with_ids=True)
+
+            names = defaultdict(list)
+            for recipe, related in batch:
+                for field_name, item_names in related:
+                    names[field_name, recipe.user_id].extend(item_names)
+            for (field_name, user_id), item_names in names.items():
+                self._create_missing(
+                    NAMED_FIELDS[field_name], user_id, item_names,
+                )
+
+            pairs = defaultdict(list)
+            for recipe, related in batch:
+                for field_name, item_names in related:
+                    known = self._known_names(
+                        NAMED_FIELDS[field_name], recipe.user_id,
+                    )
+                    pairs[recipe.user_id, field_name].extend(dict.fromkeys(
+                        (recipe.pk, known[name.lower()])
+                        for name in item_names
+                    ))
+
+            recipe_ids = defaultdict(list)
+            for recipe in recipes:
+                recipe_ids[recipe.user_id].append(recipe.pk)
+            for user_id, ids in recipe_ids.items():
+                recipes_created.send(
+                    sender=Recipe, user_id=user_id, recipe_ids=ids,
+                )
+
+            for (user_id, field_name), added in pairs.items():
+                field = Recipe._meta.get_field(field_name)
+                through = field.remote_field.through
+                self._insert(through, [
+                    through(**{
+                        f'{field.m2m_field_name()}_id': recipe_pk,
+                        f'{field.m2m_reverse_field_name()}_id': pk,
+                    })
+                    for recipe_pk, pk in added
+                ])
+                recipe_relations_changed.send(
+                    sender=Recipe,
+                    user_id=user_id,
+                    field_name=field_name,
+                    added=added,
+                )
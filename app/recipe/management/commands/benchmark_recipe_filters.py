@@ -0,0 +1,92 @@
+"""
+Django command to compare the query plans of the recipe filters.
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Recipe
+from recipe.benchmarks import create_sample_data
+from recipe.filters import filter_by_related
+
+
+class Command(BaseCommand):
+    """Django command to benchmark JOIN+DISTINCT against semi-joins."""
+    help = (
+        'Create sample recipes in a rolled back transaction and compare '
+        'the plans and timings of the recipe filters.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--vocabulary', type=int, default=50)
+        parser.add_argument('--per-recipe', type=int, default=5)
+        parser.add_argument('--filter-size', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--explain', action='store_true')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            user, tag_ids, ingredient_ids = create_sample_data(
+                rng,
+                options['recipes'],
+                options['vocabulary'],
+                options['per_recipe'],
+            )
+            tags = rng.sample(tag_ids, options['filter_size'])
+            ingredients = rng.sample(ingredient_ids, options['filter_size'])
+            queryset = Recipe.objects.filter(user=user).order_by('-id')
+
+            for name, candidate in self._querysets(
+                queryset, tags, ingredients,
+            ):
+                self._run(name, candidate, options)
+
+            transaction.set_rollback(True)
+
+    def _querysets(self, queryset, tags, ingredients):
+        """Return the named querysets to compare."""
+        join_all = queryset
+        for pk in tags:
+            join_all = join_all.filter(tags__id=pk)
+        for pk in ingredients:
+            join_all = join_all.filter(ingredients__id=pk)
+
+        return [
+            ('join + distinct (any)', queryset.filter(
+                tags__id__in=tags,
+                ingredients__id__in=ingredients,
+            ).distinct()),
+            ('semi-join (any)', filter_by_related(
+                filter_by_related(queryset, 'tags', tags),
+                'ingredients', ingredients,
+            )),
+            ('join per id + distinct (all)', join_all.distinct()),
+            ('grouped semi-join (all)', filter_by_related(
+                filter_by_related(queryset, 'tags', tags, True),
+                'ingredients', ingredients, True,
+            )),
+        ]
+
+    def _run(self, name, queryset, options):
+        """Time queryset and print its plan."""
+        ids = queryset.values_list('id', flat=True)
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            count = len(ids.all())
+            timings.append((time.perf_counter() - start) * 1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: {count} rows, median {statistics.median(timings):.2f} '
+            f'ms, min {min(timings):.2f} ms'
+        ))
+        if options['explain']:
+            self.stdout.write(ids.explain())
+            self.stdout.write('')
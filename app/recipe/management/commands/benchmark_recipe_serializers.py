@@ -0,0 +1,93 @@
+"""
+Django command to compare the regular and the fast recipe list serializer.
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.db import transaction
+from django.db.models import Prefetch
+
+from rest_framework.renderers import JSONRenderer
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.benchmarks import create_sample_data
+from recipe.serializers import (
+    FastRecipeSerializer,
+    RecipeSerializer,
+)
+
+
+class Command(BaseCommand):
+    """Django command to benchmark RecipeSerializer against the fast path."""
+    help = (
+        'Create sample recipes in a rolled back transaction, render them '
+        'with both list serializers, check the output is identical and '
+        'compare the timings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--vocabulary', type=int, default=50)
+        parser.add_argument('--per-recipe', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            user, _, _ = create_sample_data(
+                rng,
+                options['recipes'],
+                options['vocabulary'],
+                options['per_recipe'],
+            )
+            queryset = Recipe.objects.filter(user=user).order_by('-id')
+            regular = self._run('RecipeSerializer', lambda: RecipeSerializer(
+                queryset.prefetch_related(
+                    Prefetch('tags', queryset=Tag.objects.order_by('id')),
+                    Prefetch(
+                        'ingredients',
+                        queryset=Ingredient.objects.order_by('id'),
+                    ),
+                ),
+                many=True,
+            ).data, options)
+            fast = self._run('FastRecipeSerializer', lambda: (
+                FastRecipeSerializer(
+                    queryset.values(*FastRecipeSerializer.columns()),
+                    many=True,
+                ).data
+            ), options)
+
+            transaction.set_rollback(True)
+
+        if regular[0] != fast[0]:
+            raise CommandError('The serializers rendered different output.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Output identical, speedup {regular[1] / fast[1]:.1f}x'
+        ))
+
+    def _run(self, name, serialize, options):
+        """Time serialize and rendering, return the output and median."""
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            content = JSONRenderer().render(serialize())
+            timings.append((time.perf_counter() - start) * 1000)
+
+        median = statistics.median(timings)
+        self.stdout.write(
+            f'{name}: {len(content)} bytes, median {median:.2f} ms, '
+            f'min {min(timings):.2f} ms'
+        )
+        return content, median
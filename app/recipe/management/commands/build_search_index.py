@@ -0,0 +1,48 @@
+"""
+Django command to build the recipe search index.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import (
+    Recipe,
+    RecipeSearchDocument,
+)
+from recipe import search
+
+
+class Command(BaseCommand):
+    """Django command to rebuild the search index in batches."""
+    help = (
+        'Drop the search index entries and index every recipe again, '
+        'optionally only the recipes of one user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='only index this user id')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        recipes = Recipe.objects.only('id', 'user_id', *search.SEARCH_FIELDS)
+        documents = RecipeSearchDocument.objects.all()
+        if options['user'] is not None:
+            recipes = recipes.filter(user_id=options['user'])
+            documents = documents.filter(user_id=options['user'])
+
+        with transaction.atomic():
+            documents.delete()
+            total = 0
+            batch = []
+            for recipe in recipes.order_by('id').iterator(
+                chunk_size=options['batch_size'],
+            ):
+                batch.append(recipe)
+                if len(batch) >= options['batch_size']:
+                    search.index_recipes(batch, created=True)
+                    total += len(batch)
+                    batch = []
+            search.index_recipes(batch, created=True)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} recipes'))
@@ -0,0 +1,144 @@
+"""
+Django command to import recipes from NDJSON or CSV.
+"""
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from recipe.importer import (
+    FORMATS,
+    InvalidRecord,
+    RecipeImporter,
+    read_records,
+)
+
+
+class Command(BaseCommand):
+    """Django command to bulk import recipes, resuming from checkpoints."""
+    help = (
+        'Import recipes from an NDJSON or CSV file, or - for stdin. '
+        'Tags and ingredients are given by name, in CSV separated by |. '
+        'With --checkpoint the position reached is saved after every '
+        'batch and a rerun continues from it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='input format, by default from the file extension',
+        )
+        parser.add_argument(
+            '--user',
+            help='email of the owner of records without a user',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--checkpoint',
+            help='file saving the number of records done',
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='write with bulk_create even on postgres',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        path = options['path']
+        input_format = options['format']
+        if input_format is None:
+            input_format = os.path.splitext(path)[1].lstrip('.').lower()
+            if input_format == 'jsonl':
+                input_format = 'ndjson'
+            if input_format not in FORMATS:
+                raise CommandError('Give the input format with --format')
+
+        checkpoint = options['checkpoint']
+        skip = self._read_checkpoint(checkpoint, path)
+        importer = RecipeImporter(
+            default_user=options['user'],
+            use_copy=False if options['no_copy'] else None,
+        )
+
+        if path == '-':
+            self._import(sys.stdin, input_format, importer, skip, options)
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                self._import(stream, input_format, importer, skip, options)
+
+    def _read_checkpoint(self, checkpoint, path):
+        """Return the number of records a previous run imported."""
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+
+        with open(checkpoint, encoding='utf-8') as file:
+            state = json.load(file)
+        if state['path'] != path:
+            raise CommandError(
+                f'The checkpoint {checkpoint} belongs to {state["path"]}'
+            )
+        self.stdout.write(f'Resuming after record {state["position"]}')
+        return state['position']
+
+    def _write_checkpoint(self, checkpoint, path, position):
+        """Save position, replacing the checkpoint file atomically."""
+        if not checkpoint:
+            return
+
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump({'path': path, 'position': position}, file)
+        os.replace(temporary, checkpoint)
+
+    def _import(self, stream, input_format, importer, skip, options):
+        """Import the records of stream in batches."""
+        started = time.monotonic()
+        imported = 0
+        invalid = 0
+        position = 0
+        batch = []
+
+        def flush():
+            nonlocal imported, batch
+            importer.write(batch)
+            imported += len(batch)
+            batch = []
+            self._write_checkpoint(
+                options['checkpoint'], options['path'], position,
+            )
+            self.stdout.write(
+                f'{position} records read, {imported} recipes imported, '
+                f'{self._rate(imported, started):.0f} rows/s'
+            )
+
+        for position, raw in enumerate(read_records(stream, input_format), 1):
+            if position <= skip:
+                continue
+            try:
+                batch.append(importer.clean(raw))
+            except InvalidRecord as exc:
+                invalid += 1
+                self.stderr.write(f'Record {position}: {exc}')
+                continue
+            if len(batch) >= options['batch_size']:
+                flush()
+        if position > skip:
+            flush()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes in '
+            f'{time.monotonic() - started:.1f}s '
+            f'({self._rate(imported, started):.0f} rows/s), '
+            f'skipped {invalid} invalid records'
+        ))
+
+    def _rate(self, count, started):
+        return count / max(time.monotonic() - started, 1e-9)
@@ -0,0 +1,93 @@
+"""
+Django command to make the variants of uploaded recipe images.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.models import (
+    ImageStatus,
+    Recipe,
+)
+from recipe import images
+
+
+class Command(BaseCommand):
+    """Django command running a worker that processes recipe images."""
+    help = (
+        'Run a worker making the resized variants of the recipe images '
+        'uploaded with RECIPE_IMAGE_ASYNC, polling for pending ones. Any '
+        'number of workers can run side by side. With --once, process the '
+        'images still pending, left processing by a stopped worker or '
+        'uploaded before variants existed, then exit.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='process the images waiting now and exit',
+        )
+        parser.add_argument(
+            '--failed',
+            action='store_true',
+            help='with --once, also retry the images that failed',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='seconds to wait when no image is pending',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='seconds after which an image left processing by a '
+                 'stopped worker is claimed again',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        if options['once']:
+            self._process_waiting(options['failed'])
+        else:
+            self._work(options['interval'], options['stale_after'])
+
+    def _process_waiting(self, failed):
+        """Process every image not processed yet."""
+        statuses = [
+            ImageStatus.NONE,
+            ImageStatus.PENDING,
+            ImageStatus.PROCESSING,
+        ]
+        if failed:
+            statuses.append(ImageStatus.FAILED)
+        recipe_ids = list(Recipe.objects.filter(
+            image_status__in=statuses,
+        ).exclude(image='').exclude(image=None).values_list('id', flat=True))
+
+        for recipe_id in recipe_ids:
+            images.process_image(recipe_id)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed {len(recipe_ids)} images')
+        )
+
+    def _work(self, interval, stale_after):
+        """Claim and process pending images until interrupted."""
+        self.stdout.write('Waiting for images...')
+        try:
+            while True:
+                close_old_connections()
+                recipe = images.claim_image(stale_after=stale_after)
+                if recipe is None:
+                    time.sleep(interval)
+                    continue
+                if images.make_variants(recipe):
+                    self.stdout.write(f'Processed recipe {recipe.pk}')
+                else:
+                    self.stderr.write(f'Failed recipe {recipe.pk}')
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Stopped'))
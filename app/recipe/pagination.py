@@ -0,0 +1,273 @@
+"""pagination for recipe api"""
+import binascii
+import json
+from base64 import (
+    urlsafe_b64decode,
+    urlsafe_b64encode,
+)
+from collections import OrderedDict
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import (
+    remove_query_param,
+    replace_query_param,
+)
+
+
+class OptInPaginationMixin:
+    """
+    only paginate when the client asks for it with the `page_size` or
+    `cursor` query params, otherwise return the full list as before
+    """
+
+    def is_requested(self, request):
+        """return True if the client opted in to pagination"""
+        params = request.query_params
+        return (
+            self.cursor_query_param in params or
+            self.page_size_query_param in params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """paginate the queryset only if the client opted in"""
+        if not self.is_requested(request):
+            return None
+
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(OptInPaginationMixin, CursorPagination):
+    """opt-in keyset pagination for recipes, seeking on -id"""
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def id_window(self, request):
+        """
+        return the before, after and limit bounds of the ids the page
+        requested is read from, or None if it is not paginated or the
+        bounds cannot be told from the cursor
+        """
+        if not self.is_requested(request):
+            return None
+        cursor = self.decode_cursor(request)
+        limit = self.get_page_size(request) + 1
+        if cursor is None:
+            return {'before': None, 'after': None, 'limit': limit}
+        if cursor.position is None:
+            return None
+        try:
+            position = int(cursor.position)
+        except ValueError:
+            return None
+
+        limit += cursor.offset
+        if cursor.reverse:
+            return {'before': None, 'after': position, 'limit': limit}
+        return {'before': position, 'after': None, 'limit': limit}
+
+
+class RankedPagination(PageNumberPagination):
+    """
+    opt-in page numbers over ranked search results, which have no key to
+    seek on, asked for with the `page` or `page_size` query params
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """paginate the queryset only if the client opted in"""
+        params = request.query_params
+        if self.page_query_param not in params and \
+                self.page_size_query_param not in params:
+            return None
+
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetCursorPagination(OptInPaginationMixin, BasePagination):
+    """
+    opt-in keyset pagination seeking on a compound key
+
+    `ordering` must end with a unique field so every row has a distinct
+    position. a page is fetched with a row value comparison against the
+    position of the last row seen, so deep pages cost the same as the
+    first one.
+    """
+    ordering = ('-name', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """return a single page of results seeking past the cursor"""
+        if not self.is_requested(request):
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._flip(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        if results:
+            self.next_position = self._position(results[-1])
+            self.previous_position = self._position(results[0])
+        else:
+            self.next_position = self.previous_position = position
+        self.page = results
+
+        return results
+
+    def get_page_size(self, request):
+        """return the page size requested by the client"""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        """return the link to the next page"""
+        if not self.has_next:
+            return None
+
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        """return the link to the previous page"""
+        if not self.has_previous:
+            return None
+
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        """return the page along with next and previous links"""
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        """describe the paginated response for the api schema"""
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        """describe the pagination query params for the api schema"""
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def decode_cursor(self, request):
+        """return the position and direction stored in the cursor"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position = data['p']
+            reverse = bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        """return the url for the page starting at position"""
+        if position is None:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+
+        data = {'p': position}
+        if reverse:
+            data['r'] = 1
+        encoded = urlsafe_b64encode(
+            json.dumps(data, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii')
+
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            parse.unquote(encoded),
+        )
+
+    def _position(self, instance):
+        """return the key values of instance"""
+        return [
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        ]
+
+    def _flip(self, field):
+        """return field ordered in the opposite direction"""
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def _seek(self, position, reverse):
+        """
+        return a filter matching rows after position in the ordering
+
+        (a, b) after (x, y) expands to a > x OR (a = x AND b > y)
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            descending = field.startswith('-') != reverse
+            name = field.lstrip('-')
+            lookup = 'lt' if descending else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+
+        return condition
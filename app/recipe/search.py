@@ -0,0 +1,181 @@
+"""
+full-text search over recipe titles and descriptions
+
+every recipe has a RecipeSearchDocument holding its length in terms and
+a RecipeSearchPosting per distinct term, forming an inverted index keyed
+on (user, term). a query reads only the postings of its terms and ranks
+the recipes with BM25.
+
+the index is written by the signal handlers in recipe.signals and can be
+rebuilt with the build_search_index command.
+"""
+import hashlib
+import heapq
+import math
+import re
+from collections import (
+    Counter,
+    defaultdict,
+)
+
+from django.conf import settings
+from django.db.models import (
+    BooleanField,
+    Count,
+    Exists,
+    OuterRef,
+    Sum,
+    Value,
+)
+
+from core.models import (
+    RecipeSearchDocument,
+    RecipeSearchPosting,
+)
+
+K1 = 1.2
+B = 0.75
+MAX_TERM_LENGTH = 64
+SEARCH_FIELDS = ('title', 'description')
+TOKEN_RE = re.compile(r'\w+')
+
+
+def max_results():
+    """return the number of ranked recipes a search returns"""
+    return getattr(settings, 'RECIPE_SEARCH_MAX_RESULTS', 100)
+
+
+def tokenize(text):
+    """return the lower case terms of text"""
+    return [
+        term[:MAX_TERM_LENGTH] for term in TOKEN_RE.findall(text.lower())
+    ]
+
+
+def _text(recipe):
+    return '\n'.join(getattr(recipe, field) for field in SEARCH_FIELDS)
+
+
+def _checksum(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def index_recipes(recipes, created=False):
+    """
+    write the index entries of recipes
+
+    recipes whose text did not change since they were indexed are
+    skipped. with created, the recipes are known to have no entries yet
+    and are inserted without looking them up.
+    """
+    recipes = {recipe.pk: recipe for recipe in recipes}
+    if not recipes:
+        return
+
+    indexed = {}
+    if not created:
+        indexed = dict(
+            RecipeSearchDocument.objects.filter(
+                recipe_id__in=list(recipes),
+            ).values_list('recipe_id', 'checksum')
+        )
+
+    new = []
+    changed = []
+    postings = []
+    for pk, recipe in recipes.items():
+        text = _text(recipe)
+        checksum = _checksum(text)
+        if indexed.get(pk) == checksum:
+            continue
+
+        terms = Counter(tokenize(text))
+        document = RecipeSearchDocument(
+            recipe_id=pk,
+            user_id=recipe.user_id,
+            length=sum(terms.values()),
+            checksum=checksum,
+        )
+        (changed if pk in indexed else new).append(document)
+        postings.extend(
+            RecipeSearchPosting(
+                document_id=pk,
+                user_id=recipe.user_id,
+                term=term,
+                frequency=frequency,
+            )
+            for term, frequency in terms.items()
+        )
+
+    if changed:
+        RecipeSearchPosting.objects.filter(
+            document_id__in=[document.pk for document in changed],
+        ).delete()
+        RecipeSearchDocument.objects.bulk_update(
+            changed, ['length', 'checksum'],
+        )
+    if new:
+        RecipeSearchDocument.objects.bulk_create(new)
+    if postings:
+        RecipeSearchPosting.objects.bulk_create(postings)
+
+
+def search(user_id, query, limit=None, queryset=None):
+    """
+    return the ids of the recipes of a user matching query, best first
+
+    a recipe matches if it contains any term of the query. recipes are
+    ranked by their BM25 score, ties by highest id. with queryset, only
+    the recipes in it are returned, still scored against every recipe of
+    the user.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+
+    stats = RecipeSearchDocument.objects.filter(user_id=user_id).aggregate(
+        count=Count('pk'),
+        total=Sum('length'),
+    )
+    if not stats['count']:
+        return []
+    average_length = (stats['total'] or 0) / stats['count'] or 1
+
+    # every posting counts in the document frequencies, the recipes not
+    # in queryset are only left out of the results
+    if queryset is None:
+        selected = Value(True, output_field=BooleanField())
+    else:
+        selected = Exists(
+            queryset.order_by().filter(pk=OuterRef('document_id'))
+        )
+    rows_by_term = defaultdict(list)
+    rows = RecipeSearchPosting.objects.filter(
+        user_id=user_id,
+        term__in=terms,
+    ).annotate(selected=selected).values_list(
+        'term', 'document_id', 'frequency', 'document__length', 'selected',
+    )
+    for term, pk, frequency, length, selected in rows:
+        rows_by_term[term].append((pk, frequency, length, selected))
+
+    scores = defaultdict(float)
+    for term_rows in rows_by_term.values():
+        frequency_in_docs = len(term_rows)
+        idf = math.log(
+            1 + (stats['count'] - frequency_in_docs + 0.5) /
+            (frequency_in_docs + 0.5)
+        )
+        for pk, frequency, length, selected in term_rows:
+            if not selected:
+                continue
+            norm = K1 * (1 - B + B * length / average_length)
+            scores[pk] += idf * frequency * (K1 + 1) / (frequency + norm)
+
+    ranked = [(score, pk) for pk, score in scores.items()]
+    if limit is not None:
+        ranked = heapq.nlargest(limit, ranked)
+    else:
+        ranked.sort(reverse=True)
+
+    return [pk for _, pk in ranked]
@@ -1,11 +1,33 @@
 """serializers for recipe api"""
+from collections import (
+    OrderedDict,
+    defaultdict,
+)
+
+from django.db import (
+    connection,
+    transaction,
+)
+from django.db.models import Value
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 from core.models import (
+    ImageStatus,
     Recipe,
     Tag,
     Ingredient,
 )
+from recipe import images
+from recipe.signals import (
+    named_objects_created,
+    recipes_created,
+    recipes_updated,
+    recipe_relations_changed,
+)
 
 class IngredientSerializer(serializers.ModelSerializer):
     """serializers for ingredients """
@@ -21,7 +43,131 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
         read_only_fields = ['id']
 
-class RecipeSerializer(serializers.ModelSerializer):
+
+class DynamicFieldsMixin:
+    """
+    only build the fields named in the `fields` context entry, when it is
+    not None
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """serializer for creating or updating many recipes at once"""
+    max_batch_size = 1000
+
+    def validate(self, attrs):
+        """check the batch is not too large"""
+        if len(attrs) > self.max_batch_size:
+            raise serializers.ValidationError(
+                f'Ensure this list has at most {self.max_batch_size} items.',
+                code='max_length',
+            )
+
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """
+        create all recipes with bulk inserts
+
+        tag and ingredient names are deduplicated across the whole batch
+        and resolved together, so the number of queries does not depend
+        on the number of recipes.
+        """
+        tags = [item.pop('tags', []) for item in validated_data]
+        ingredients = [item.pop('ingredients', []) for item in validated_data]
+        recipes = [Recipe(**item) for item in validated_data]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            recipes_created.send(
+                sender=Recipe,
+                user_id=self.child.context['request'].user.pk,
+                recipe_ids=[recipe.pk for recipe in recipes],
+            )
+        else:
+            for recipe in recipes:
+                recipe.save()
+
+        self._add_named(Tag, 'tags', recipes, tags)
+        self._add_named(Ingredient, 'ingredients', recipes, ingredients)
+
+        return recipes
+
+    @transaction.atomic
+    def update(self, instances, validated_data):
+        """
+        apply each item of validated_data to the recipe at the same index
+
+        scalar fields and updated_at are written with one bulk update and
+        tags and ingredients are replaced with set-based statements across all
+        recipes.
+        """
+        fields = {'updated_at'}
+        now = timezone.now()
+        tags = {}
+        ingredients = {}
+        for recipe, attrs in zip(instances, validated_data):
+            if 'tags' in attrs:
+                tags[recipe] = attrs.pop('tags')
+            if 'ingredients' in attrs:
+                ingredients[recipe] = attrs.pop('ingredients')
+            for attr, value in attrs.items():
+                setattr(recipe, attr, value)
+            fields.update(attrs)
+            recipe.updated_at = now
+
+        if instances:
+            Recipe.objects.bulk_update(instances, sorted(fields))
+            recipes_updated.send(
+                sender=Recipe,
+                user_id=self.child.context['request'].user.pk,
+                recipe_ids=[recipe.pk for recipe in instances],
+                fields=sorted(fields),
+            )
+        self._replace_named(Tag, 'tags', tags)
+        self._replace_named(Ingredient, 'ingredients', ingredients)
+
+        return instances
+
+    def _resolve_named(self, model, items_per_recipe):
+        """return the named objects of all items by lower cased name"""
+        return {
+            obj.name.lower(): obj
+            for obj in self.child._get_or_create_named(
+                model,
+                [item for items in items_per_recipe for item in items],
+            )
+        }
+
+    def _add_named(self, model, field_name, recipes, items_per_recipe):
+        """get or create the named objects and attach them to recipes"""
+        objs = self._resolve_named(model, items_per_recipe)
+        self.child._add_through_rows(field_name, [
+            (recipe.pk, objs[item['name'].lower()].pk)
+            for recipe, items in zip(recipes, items_per_recipe)
+            for item in items
+        ])
+
+    def _replace_named(self, model, field_name, items_by_recipe):
+        """get or create the named objects and make them the only ones"""
+        if not items_by_recipe:
+            return
+
+        objs = self._resolve_named(model, items_by_recipe.values())
+        self.child._replace_through_rows(field_name, {
+            recipe.pk: {objs[item['name'].lower()].pk for item in items}
+            for recipe, items in items_by_recipe.items()
+        })
+
+
+class RecipeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     "serializers for recipe"
 
     tags = TagSerializer(many=True, required=False)
@@ -33,27 +179,145 @@ class RecipeSerializer(serializers.ModelSerializer):
                    'ingredients'
         ]
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
 
-    def get_or_create_tags(self, tags, recipe):
-        """handle getting or creating tags as needed"""
+    def _named(self, model, keys):
+        """return objects of model whose lower cased name is one of keys"""
+        return model.objects.annotate(name_key=Lower('name')).filter(
+            user=self.context['request'].user,
+            name_key__in=keys,
+        )
+
+    def _get_or_create_named(self, model, items):
+        """
+        return objects of model named in items, creating missing ones
+
+        names are matched ignoring case, the first spelling is the one
+        created. every name is looked up in one query and the missing ones
+        are inserted with one bulk insert.
+        """
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user = auth_user,
-                **tag,
+        names = {}
+        for item in items:
+            names.setdefault(item['name'].lower(), item['name'])
+        if not names:
+            return []
+
+        objs = {obj.name.lower(): obj for obj in self._named(model, names)}
+        missing = [key for key in names if key not in objs]
+        if missing:
+            # rows inserted meanwhile by a concurrent request conflict on
+            # the unique (user, lower(name)) index and are looked up below
+            model.objects.bulk_create(
+                [model(user=auth_user, name=names[key]) for key in missing],
+                ignore_conflicts=True,
+            )
+            named_objects_created.send(sender=model, user_id=auth_user.pk)
+            objs.update(
+                (obj.name.lower(), obj) for obj in self._named(model, missing)
             )
-            recipe.tags.add(tag_obj)
 
-    def get_or_create_ingredients(self, ingredients, recipe):
-        """handle getting or creating ingredients as needed"""
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user = auth_user,
-                **ingredient,
+        for key in names:
+            if key not in objs:
+                # python and the database lower case some names, like
+                # non-ascii ones, differently. look them up the way the
+                # unique index compares them
+                objs[key] = self._named(
+                    model, [Lower(Value(names[key]))],
+                ).get()
+
+        return [objs[key] for key in names]
+
+    def _through(self, field_name):
+        """return the through model of a recipe m2m field and its columns"""
+        field = Recipe._meta.get_field(field_name)
+        return (
+            field.remote_field.through,
+            f'{field.m2m_field_name()}_id',
+            f'{field.m2m_reverse_field_name()}_id',
+        )
+
+    def _set_related(self, recipe, field_name, objs, replace=False):
+        """
+        attach objs to the recipe m2m field
+
+        with replace, objects not in objs are detached.
+        """
+        wanted = [obj.pk for obj in objs]
+        if replace:
+            self._replace_through_rows(field_name, {recipe.pk: set(wanted)})
+        else:
+            self._add_through_rows(
+                field_name, [(recipe.pk, pk) for pk in wanted],
+            )
+
+    def _replace_through_rows(self, field_name, wanted):
+        """
+        make wanted, a map of recipe id to related ids, the only rows of
+        those recipes
+
+        only the rows that differ from what is already stored are deleted
+        or inserted.
+        """
+        through, source, target = self._through(field_name)
+        current = defaultdict(set)
+        removed = []
+        rows = through.objects.filter(
+            **{f'{source}__in': list(wanted)}
+        ).values_list('pk', source, target)
+        for pk, recipe_pk, related_pk in rows:
+            current[recipe_pk].add(related_pk)
+            if related_pk not in wanted[recipe_pk]:
+                removed.append((pk, recipe_pk, related_pk))
+        if removed:
+            through.objects.filter(
+                pk__in=[pk for pk, _, _ in removed]
+            ).delete()
+            recipe_relations_changed.send(
+                sender=Recipe,
+                user_id=self.context['request'].user.pk,
+                field_name=field_name,
+                removed=[(recipe_pk, pk) for _, recipe_pk, pk in removed],
             )
-            recipe.ingredients.add(ingredient_obj)
 
+        self._add_through_rows(field_name, [
+            (recipe_pk, pk)
+            for recipe_pk, pks in wanted.items()
+            for pk in pks if pk not in current[recipe_pk]
+        ])
+
+    def _add_through_rows(self, field_name, pairs):
+        """insert (recipe id, related id) pairs with one bulk insert"""
+        if not pairs:
+            return
+
+        through, source, target = self._through(field_name)
+        pairs = list(dict.fromkeys(pairs))
+        through.objects.bulk_create(
+            [
+                through(**{source: recipe_pk, target: pk})
+                for recipe_pk, pk in pairs
+            ],
+            ignore_conflicts=True,
+        )
+        recipe_relations_changed.send(
+            sender=Recipe,
+            user_id=self.context['request'].user.pk,
+            field_name=field_name,
+            added=pairs,
+        )
+
+    def get_or_create_tags(self, tags, recipe, replace=False):
+        """handle getting or creating tags as needed"""
+        tag_objs = self._get_or_create_named(Tag, tags)
+        self._set_related(recipe, 'tags', tag_objs, replace)
+
+    def get_or_create_ingredients(self, ingredients, recipe, replace=False):
+        """handle getting or creating ingredients as needed"""
+        ingredient_objs = self._get_or_create_named(Ingredient, ingredients)
+        self._set_related(recipe, 'ingredients', ingredient_objs, replace)
+
+    @transaction.atomic
     def create(self, validated_data):
         """create a recipe"""
         tags = validated_data.pop('tags', [])
@@ -64,17 +328,18 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """update recipe"""
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
 
         if tags is not None:
-            instance.tags.clear()
-            self.get_or_create_tags(tags, instance)
+            self.get_or_create_tags(tags, instance, replace=True)
         if ingredients is not None:
-            instance.ingredients.clear()
-            self.get_or_create_ingredients(ingredients, instance)
+            self.get_or_create_ingredients(
+                ingredients, instance, replace=True
+            )
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -83,17 +348,123 @@ class RecipeSerializer(serializers.ModelSerializer):
         return instance
 
 
+class FastRecipeListSerializer(serializers.ListSerializer):
+    """
+    read-only list serializer building the output of RecipeSerializer
+    straight from `.values()` rows
+
+    scalar values go through the child's field to_representation, tags
+    and ingredients are loaded for all rows with one query each and
+    ordered by id like the prefetches of the regular path, so the output
+    is identical without instantiating serializers per row.
+    """
+
+    def _related_map(self, field_name, recipe_ids):
+        """return the nested representations of each recipe by id"""
+        through, source, target = self.child._through(field_name)
+        field = Recipe._meta.get_field(field_name)
+        name = f'{field.m2m_reverse_field_name()}__name'
+        related = defaultdict(list)
+        rows = through.objects.filter(
+            **{f'{source}__in': recipe_ids}
+        ).order_by(target).values_list(source, target, name)
+        for recipe_id, pk, related_name in rows:
+            related[recipe_id].append(
+                OrderedDict((('id', pk), ('name', related_name)))
+            )
+        return related
+
+    def to_representation(self, data):
+        rows = list(data)
+        fields = self.child.fields
+        recipe_ids = [row['id'] for row in rows]
+        related = {
+            name: self._related_map(name, recipe_ids)
+            for name, field in fields.items()
+            if isinstance(field, serializers.ListSerializer)
+        }
+
+        ret = []
+        for row in rows:
+            item = OrderedDict()
+            for name, field in fields.items():
+                if name in related:
+                    item[name] = related[name].get(row['id'], [])
+                    continue
+                value = row[name]
+                item[name] = None if value is None else \
+                    field.to_representation(value)
+            ret.append(item)
+        return ret
+
+
+class FastRecipeSerializer(RecipeSerializer):
+    """RecipeSerializer reading lists with FastRecipeListSerializer"""
+
+    class Meta(RecipeSerializer.Meta):
+        list_serializer_class = FastRecipeListSerializer
+
+    @classmethod
+    def columns(cls, fields=None):
+        """return the columns the list rows need for fields"""
+        return ['id'] + [
+            name for name in (fields or cls.Meta.fields)
+            if name not in ('id', 'tags', 'ingredients')
+        ]
+
+
+@extend_schema_field({
+    'type': 'object',
+    'additionalProperties': {'type': 'string', 'format': 'uri'},
+    'nullable': True,
+})
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    urls of the resized variants of an image field by size, once they
+    are made
+    """
+
+    def to_representation(self, value):
+        if not value or value.instance.image_status != ImageStatus.READY:
+            return None
+
+        urls = images.variant_urls(value)
+        request = self.context.get('request')
+        if request is not None:
+            urls = {
+                size: request.build_absolute_uri(url)
+                for size, url in urls.items()
+            }
+        return urls
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """serialzer for recipe detail view"""
+    thumbnails = ImageVariantsField(source='image')
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image', 'thumbnails', 'image_status',
+        ]
+        # images are only written through the upload action, which
+        # makes their variants
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + [
+            'image', 'image_status',
+        ]
 
 class ImageSerializer(serializers.ModelSerializer):
     "serializers for uploading image to recipe"
+    thumbnails = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image' ]
-        read_only_fields = ['id']
+        fields = ['id', 'image', 'thumbnails', 'image_status']
+        read_only_fields = ['id', 'image_status']
         extra_kwargs = {'image':{'required':'True'}}
+
+
+class ListCacheStatsSerializer(serializers.Serializer):
+    """serializer for the list cache counters of a process"""
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    process = serializers.IntegerField(help_text='id of the process counting')
@@ -0,0 +1,249 @@
+"""
+signals sent by the recipe api and the handlers keeping indexes,
+collection versions and recipe updated_at in sync
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import (
+    Signal,
+    receiver,
+)
+from django.utils import timezone
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe import (
+    images,
+    search,
+)
+from recipe.autocomplete import name_index
+from recipe.caching import bump_version
+from recipe.bitmap_index import recipe_index
+
+# sent with user_id and recipe_ids after recipes are created with
+# bulk_create, which sends no post_save
+recipes_created = Signal()
+
+# sent with user_id, recipe_ids and the names of the changed fields
+# after recipes are updated with bulk_update, which sends no post_save
+recipes_updated = Signal()
+
+# sent with user_id after tags or ingredients, the sender, are created
+# with bulk_create, which sends no post_save
+named_objects_created = Signal()
+
+# sent with user_id, field_name and the added and removed
+# (recipe id, related id) pairs after the through rows of a recipe m2m
+# field are written in bulk, which sends no m2m_changed
+recipe_relations_changed = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    """add a new recipe to the index"""
+    if created:
+        recipe_index.add_recipe(instance.user_id, instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """remove a deleted recipe from the index"""
+    recipe_index.remove_recipe(instance.user_id, instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_released(sender, instance, **kwargs):
+    """drop the reference of a deleted recipe to its content addressed image"""
+    if instance.image:
+        images.release_image(instance.image)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_saved(sender, instance, created, update_fields, **kwargs):
+    """index the text of a saved recipe"""
+    if update_fields and not set(search.SEARCH_FIELDS) & set(update_fields):
+        return
+    search.index_recipes([instance], created=created)
+
+
+@receiver(recipes_created)
+def recipes_bulk_created(sender, user_id, recipe_ids, **kwargs):
+    """add recipes created in bulk to the index"""
+    for recipe_id in recipe_ids:
+        recipe_index.add_recipe(user_id, recipe_id)
+
+
+def _searchable(recipe_ids):
+    return Recipe.objects.filter(pk__in=recipe_ids).only(
+        'id', 'user_id', *search.SEARCH_FIELDS,
+    )
+
+
+@receiver(recipes_created)
+def recipes_search_bulk_created(sender, recipe_ids, **kwargs):
+    """index the text of recipes created in bulk"""
+    search.index_recipes(_searchable(recipe_ids), created=True)
+
+
+@receiver(recipes_updated)
+def recipes_search_bulk_updated(sender, recipe_ids, fields, **kwargs):
+    """reindex the text of recipes updated in bulk"""
+    if set(search.SEARCH_FIELDS) & set(fields):
+        search.index_recipes(_searchable(recipe_ids))
+
+
+@receiver(recipe_relations_changed)
+def relations_bulk_changed(sender, user_id, field_name, added=(),
+                           removed=(), **kwargs):
+    """apply through rows written in bulk to the index"""
+    recipe_index.remove(user_id, field_name, removed)
+    recipe_index.add(user_id, field_name, added)
+
+
+def _relations_changed(field_name, sender, instance, action, reverse,
+                       pk_set, **kwargs):
+    """apply an m2m change made through a related manager to the index"""
+    if action in ('post_add', 'post_remove'):
+        if reverse:
+            pairs = [(pk, instance.pk) for pk in pk_set]
+        else:
+            pairs = [(instance.pk, pk) for pk in pk_set]
+        if action == 'post_add':
+            recipe_index.add(instance.user_id, field_name, pairs)
+        else:
+            recipe_index.remove(instance.user_id, field_name, pairs)
+    elif action == 'post_clear':
+        if reverse:
+            recipe_index.remove_related(
+                instance.user_id, field_name, instance.pk,
+            )
+        else:
+            recipe_index.clear_recipe(
+                instance.user_id, field_name, instance.pk,
+            )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, **kwargs):
+    _relations_changed('tags', sender, **kwargs)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed(sender, **kwargs):
+    _relations_changed('ingredients', sender, **kwargs)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    recipe_index.remove_related(instance.user_id, 'tags', instance.pk)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    recipe_index.remove_related(instance.user_id, 'ingredients', instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def named_object_changed(sender, instance, **kwargs):
+    """drop the autocomplete index of the owner of a written name"""
+    name_index.invalidate(sender, instance.user_id)
+
+
+@receiver(named_objects_created)
+def named_objects_bulk_created(sender, user_id, **kwargs):
+    """drop the autocomplete index of a user after names are bulk created"""
+    name_index.invalidate(sender, user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def collection_written(sender, instance, **kwargs):
+    """change the collection version of the owner of a written row"""
+    bump_version(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_created(sender, instance, created, **kwargs):
+    """start a new user on a fresh version, in case the id is reused"""
+    if created:
+        bump_version(instance.pk)
+
+
+@receiver(recipes_created)
+@receiver(recipes_updated)
+@receiver(recipe_relations_changed)
+@receiver(named_objects_created)
+def collection_bulk_written(sender, user_id, **kwargs):
+    """change the collection version of a user after a bulk write"""
+    bump_version(user_id)
+
+
+def _touch_recipes(**filters):
+    """move the updated_at of the matching recipes to now"""
+    Recipe.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+def _relations_touched(field_name, instance, action, reverse, pk_set,
+                       **kwargs):
+    """touch recipes whose relations changed through a related manager"""
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    bump_version(instance.user_id)
+    if not reverse:
+        if action != 'pre_clear':
+            _touch_recipes(pk=instance.pk)
+    elif action == 'pre_clear':
+        _touch_recipes(**{field_name: instance})
+    elif action != 'post_clear':
+        _touch_recipes(pk__in=pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_touched(sender, **kwargs):
+    _relations_touched('tags', **kwargs)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_touched(sender, **kwargs):
+    _relations_touched('ingredients', **kwargs)
+
+
+@receiver(post_save, sender=Tag)
+def tag_renamed(sender, instance, created, **kwargs):
+    """touch the recipes showing a renamed tag"""
+    if not created:
+        _touch_recipes(tags=instance)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    """touch the recipes losing a deleted tag"""
+    _touch_recipes(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    """touch the recipes showing a renamed ingredient"""
+    if not created:
+        _touch_recipes(ingredients=instance)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    """touch the recipes losing a deleted ingredient"""
+    _touch_recipes(ingredients=instance)
@@ -0,0 +1,143 @@
+"""
+tests for the tag and ingredient autocomplete
+"""
+from unittest.mock import patch
+
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Tag,
+    Ingredient,
+)
+from recipe.autocomplete import (
+    name_index,
+    trigrams,
+)
+from recipe.tests.test_recipe_api import (
+    RECIPES_URL,
+    create_user,
+)
+
+INGREDIENTS_URL = reverse('recipe:ingredient-autocomplete')
+TAGS_URL = reverse('recipe:tag-autocomplete')
+
+
+class AutocompleteTests(TestCase):
+    """test autocompleting tag and ingredient names"""
+
+    def setUp(self):
+        name_index.clear()
+        self.addCleanup(name_index.clear)
+        self.client = APIClient()
+        # committed, so the version changes of the tests are their own
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = create_user(
+                email='user@example.com',
+                password='test123',
+            )
+            for name in ['Tomato', 'Tofu', 'Tomato paste', 'Potato', 'Salt']:
+                Ingredient.objects.create(user=self.user, name=name)
+        self.client.force_authenticate(self.user)
+
+    def complete(self, query, url=INGREDIENTS_URL, **params):
+        res = self.client.get(url, {'q': query, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in res.data]
+
+    def test_trigrams(self):
+        """test words are padded like pg_trgm"""
+        self.assertEqual(trigrams('Ab'), {'  a', ' ab', 'ab '})
+
+    def test_prefix_matches_first(self):
+        """test prefix matches come before similar names"""
+        self.assertEqual(
+            self.complete('tomato pasta'),
+            ['Tomato paste', 'Tomato'],
+        )
+        self.assertEqual(self.complete('tom'), ['Tomato', 'Tomato paste'])
+        self.assertEqual(self.complete('TO', limit=2), ['Tofu', 'Tomato'])
+
+    def test_similar_names(self):
+        """test misspelled queries match by trigram similarity"""
+        self.assertEqual(self.complete('tomatoe')[:1], ['Tomato'])
+        self.assertEqual(self.complete('xyz'), [])
+        self.assertEqual(self.complete(''), [])
+
+    def test_limited_to_user_and_model(self):
+        """test other users' names and other models are not suggested"""
+        other = create_user(email='other@example.com', password='test123')
+        Ingredient.objects.create(user=other, name='Tonic')
+        Tag.objects.create(user=self.user, name='Toast')
+
+        self.assertNotIn('Tonic', self.complete('to'))
+        self.assertEqual(self.complete('to', url=TAGS_URL), ['Toast'])
+
+    def test_served_from_memory(self):
+        """test repeated queries do not hit the database for names"""
+        self.complete('to')
+
+        # only the collection version
+        with self.assertNumQueries(1):
+            self.complete('sal')
+
+    @override_settings(RECIPE_VERSION_CACHE=None)
+    def test_served_from_memory_without_versions(self):
+        """test without a version cache names are read until the TTL"""
+        self.complete('to')
+
+        with self.assertNumQueries(0):
+            self.complete('sal')
+
+    def test_writes_of_other_processes_seen(self):
+        """test names written without dropping this index are suggested"""
+        self.complete('to')
+
+        with patch.object(name_index, '_drop'), \
+                self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(user=self.user, name='Toast')
+
+        self.assertEqual(self.complete('toa'), ['Toast'])
+
+    def test_invalidated_on_writes(self):
+        """test created, renamed and bulk created names are suggested"""
+        self.complete('to')
+        salt = Ingredient.objects.get(name='Salt')
+        salt.name = 'Toffee'
+        salt.save()
+        self.client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': '1.00',
+            'ingredients': [{'name': 'Tortilla'}],
+        }, format='json')
+
+        self.assertEqual(
+            self.complete('tof'),
+            ['Toffee', 'Tofu'],
+        )
+        self.assertIn('Tortilla', self.complete('tor'))
+
+    def test_invalidated_again_on_commit(self):
+        """test an index built before a name is committed is dropped"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(user=self.user, name='Toast')
+            # built from the names before the commit by another request
+            name_index.complete(Ingredient, self.user.id, 'toa')
+            self.assertIsNotNone(
+                name_index._indexes.get((Ingredient._meta.label, self.user.id))
+            )
+
+        self.assertIsNone(
+            name_index._indexes.get((Ingredient._meta.label, self.user.id))
+        )
+
+    def test_invalid_limit(self):
+        """test a non numeric limit is rejected"""
+        res = self.client.get(INGREDIENTS_URL, {'q': 'to', 'limit': 'x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
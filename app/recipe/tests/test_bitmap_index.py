@@ -0,0 +1,190 @@
+"""
+tests for the recipe bitmap index
+"""
+import re
+from unittest.mock import patch
+
+from django.db import (
+    DatabaseError,
+    connection,
+    transaction,
+)
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from core.models import (
+    Tag,
+    Ingredient,
+)
+from recipe.bitmap_index import recipe_index
+from recipe.tests.test_recipe_api import (
+    BULK_URL,
+    RECIPES_URL,
+    create_recipe,
+    create_user,
+    detail_url,
+)
+
+ID_IN_RE = re.compile(r'"core_recipe"\."id" IN \(([^)]*)\)')
+
+
+@override_settings(RECIPE_BITMAP_INDEX=True)
+class BitmapIndexTests(TestCase):
+    """test filtering recipes through the bitmap index"""
+
+    def setUp(self):
+        recipe_index.clear()
+        self.addCleanup(recipe_index.clear)
+        self.client = APIClient()
+        # committed, so the version changes of the tests are their own
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = create_user(
+                email='user@example.com',
+                password='test123',
+            )
+            self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+            self.dinner = Tag.objects.create(user=self.user, name='Dinner')
+            self.tofu = Ingredient.objects.create(user=self.user, name='Tofu')
+            self.both = create_recipe(user=self.user, title='Both')
+            self.both.tags.add(self.vegan, self.dinner)
+            self.both.ingredients.add(self.tofu)
+            self.vegan_only = create_recipe(user=self.user, title='Vegan')
+            self.vegan_only.tags.add(self.vegan)
+            self.plain = create_recipe(user=self.user, title='Plain')
+        self.client.force_authenticate(self.user)
+
+    def list_ids(self, **params):
+        res = self.client.get(RECIPES_URL, params)
+        return [r['id'] for r in res.data]
+
+    def write_updates(self):
+        """create, update and delete recipes and their tags"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                detail_url(self.both.id), {'tags': []}, format='json',
+            )
+            self.plain.tags.add(self.vegan)
+            self.client.delete(detail_url(self.vegan_only.id))
+            self.client.post(BULK_URL, [
+                {
+                    'title': 'Bulk', 'time_minutes': 5, 'price': '1.00',
+                    'tags': [{'name': 'Vegan'}],
+                },
+            ], format='json')
+        return self.user.recipe_set.get(title='Bulk')
+
+    def test_any_all_and_exclude(self):
+        """test OR, AND and NOT filters"""
+        tags = f'{self.vegan.id},{self.dinner.id}'
+
+        self.assertEqual(
+            self.list_ids(tags=tags),
+            [self.vegan_only.id, self.both.id],
+        )
+        self.assertEqual(self.list_ids(tags=tags, match='all'), [self.both.id])
+        self.assertEqual(
+            self.list_ids(exclude_tags=str(self.dinner.id)),
+            [self.plain.id, self.vegan_only.id],
+        )
+        self.assertEqual(
+            self.list_ids(
+                tags=str(self.vegan.id),
+                exclude_ingredients=str(self.tofu.id),
+            ),
+            [self.vegan_only.id],
+        )
+
+    def test_index_limited_to_user(self):
+        """test other users' recipes are not matched"""
+        other = create_user(email='other@example.com', password='test123')
+        recipe = create_recipe(user=other)
+        recipe.tags.add(self.vegan)
+
+        self.assertEqual(
+            self.list_ids(tags=str(self.vegan.id)),
+            [self.vegan_only.id, self.both.id],
+        )
+
+    def test_index_rebuilt_on_new_version(self):
+        """test the index is rebuilt once the collection version changes"""
+        self.list_ids(tags=str(self.vegan.id))
+        with self.assertNumQueries(4):
+            self.list_ids(tags=str(self.vegan.id))
+
+        bulk = self.write_updates()
+
+        # and the index of the recipes, their tags and their ingredients
+        with self.assertNumQueries(7):
+            ids = self.list_ids(tags=str(self.vegan.id))
+        self.assertEqual(ids, [bulk.id, self.plain.id])
+
+    def test_writes_of_other_processes_seen(self):
+        """test writes not applied to this index are seen at once"""
+        self.list_ids(tags=str(self.vegan.id))
+
+        with patch.object(recipe_index, '_apply'):
+            bulk = self.write_updates()
+
+        self.assertEqual(
+            self.list_ids(tags=str(self.vegan.id)),
+            [bulk.id, self.plain.id],
+        )
+
+    @override_settings(RECIPE_VERSION_CACHE=None)
+    def test_index_updated_on_writes(self):
+        """test the loaded index follows creates, updates and deletes"""
+        self.list_ids(tags=str(self.vegan.id))
+
+        bulk = self.write_updates()
+
+        # the recipes and their tags and ingredients, no filter query
+        with self.assertNumQueries(3):
+            ids = self.list_ids(tags=str(self.vegan.id))
+        self.assertEqual(ids, [bulk.id, self.plain.id])
+
+    def test_paginated_query_limited_to_page(self):
+        """test a page only asks the database for the ids around it"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                create_recipe(user=self.user).tags.add(self.vegan)
+        expected = self.list_ids(tags=str(self.vegan.id))
+
+        ids = []
+        url, params = RECIPES_URL, {'tags': self.vegan.id, 'page_size': 2}
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get(url, params)
+            ids += [recipe['id'] for recipe in res.data['results']]
+            url, params = res.data['next'], None
+            # the collection version, then the recipes of the page and
+            # the one telling if there is a next page
+            in_list = ID_IN_RE.search(ctx.captured_queries[1]['sql'])
+            self.assertLessEqual(len(in_list.group(1).split(',')), 3)
+
+        self.assertEqual(ids, expected)
+
+    def test_deleted_tag_dropped(self):
+        """test deleting a tag removes it from the index"""
+        tag_id = self.dinner.id
+        self.list_ids(tags=str(tag_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dinner.delete()
+
+        self.assertEqual(self.list_ids(tags=str(tag_id)), [])
+
+    def test_rolled_back_writes_not_applied(self):
+        """test writes of a rolled back transaction leave the index alone"""
+        ids = self.list_ids(tags=str(self.vegan.id))
+
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                self.plain.tags.add(self.vegan)
+                self.vegan_only.delete()
+                raise DatabaseError('rolled back')
+
+        self.assertEqual(self.list_ids(tags=str(self.vegan.id)), ids)
@@ -0,0 +1,308 @@
+"""
+test recipe management commands
+"""
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase
+
+from core.models import (
+    Recipe,
+    RecipeSearchDocument,
+    Tag,
+    Ingredient,
+)
+from recipe import search
+from recipe.importer import _copy_value
+
+
+class BenchmarkCommandTests(TestCase):
+    """test the benchmark commands"""
+
+    def test_benchmark_recipe_filters(self):
+        """test the filter benchmark compares every filter and rolls back"""
+        out = StringIO()
+
+        call_command(
+            'benchmark_recipe_filters',
+            recipes=50, vocabulary=5, repeat=1, explain=True, stdout=out,
+        )
+
+        output = out.getvalue()
+        self.assertIn('join + distinct (any)', output)
+        self.assertIn('grouped semi-join (all)', output)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_benchmark_recipe_serializers(self):
+        """test the serializer benchmark checks the output is identical"""
+        out = StringIO()
+
+        call_command(
+            'benchmark_recipe_serializers',
+            recipes=20, vocabulary=5, repeat=1, stdout=out,
+        )
+
+        self.assertIn('Output identical', out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
+
+
+class BuildSearchIndexCommandTests(TestCase):
+    """test the search index command"""
+
+    def test_build_search_index(self):
+        """test the command rebuilds the index of every recipe"""
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='test123',
+        )
+        for i in range(5):
+            Recipe.objects.create(
+                user=user, title=f'Curry {i}', time_minutes=5, price=1,
+            )
+        RecipeSearchDocument.objects.all().delete()
+        out = StringIO()
+
+        call_command('build_search_index', batch_size=2, stdout=out)
+
+        self.assertIn('Indexed 5 recipes', out.getvalue())
+        self.assertEqual(len(search.search(user.pk, 'curry')), 5)
+
+
+class ImportRecipesCommandTests(TestCase):
+    """test the recipe import command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='test123',
+        )
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def ndjson(self, records):
+        return self.write('recipes.ndjson', ''.join(
+            record if isinstance(record, str) else json.dumps(record) + '\n'
+            for record in records
+        ))
+
+    def call(self, path, **options):
+        out = StringIO()
+        err = StringIO()
+        call_command(
+            'import_recipes', path, user='user@example.com',
+            stdout=out, stderr=err, **options,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_import_ndjson(self):
+        """test records are imported with their names resolved"""
+        path = self.ndjson([
+            {
+                'title': 'Tofu curry',
+                'time_minutes': 20,
+                'price': '7.50',
+                'tags': ['vegan', 'Dinner'],
+                'ingredients': [{'id': 1, 'name': 'Tofu'}, 'tofu'],
+            },
+            {'title': 'Toast', 'time_minutes': 2, 'price': 1,
+             'tags': ['DINNER']},
+            {'title': 'Broken', 'time_minutes': 2, 'price': 'abc'},
+            'not json\n',
+        ])
+
+        out, err = self.call(path, batch_size=1)
+
+        self.assertIn('Imported 2 recipes', out)
+        self.assertIn('skipped 2 invalid records', out)
+        self.assertIn('rows/s', out)
+        self.assertIn('Record 3: price', err)
+        self.assertIn('Record 4: invalid JSON', err)
+        curry = Recipe.objects.get(title='Tofu curry')
+        self.assertEqual(curry.price, Decimal('7.50'))
+        self.assertEqual(curry.user, self.user)
+        self.assertEqual(
+            sorted(curry.tags.values_list('name', flat=True)),
+            ['Dinner', 'Vegan'],
+        )
+        self.assertEqual(
+            list(curry.ingredients.values_list('name', flat=True)),
+            ['Tofu'],
+        )
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertEqual(search.search(self.user.pk, 'toast'), [
+            Recipe.objects.get(title='Toast').pk,
+        ])
+
+    def test_import_csv(self):
+        """test csv records with names separated by | and a user column"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='test123',
+        )
+        path = self.write('recipes.csv', (
+            'title,time_minutes,price,tags,ingredients,user\n'
+            'Salad,5,3.20,Vegan|Lunch,Lettuce|Oil,\n'
+            '"Soup, hot",30,4,,Leek,other@example.com\n'
+        ))
+
+        out, _ = self.call(path)
+
+        self.assertIn('Imported 2 recipes', out)
+        salad = Recipe.objects.get(title='Salad')
+        self.assertEqual(salad.user, self.user)
+        self.assertEqual(
+            sorted(salad.tags.values_list('id', flat=True)),
+            sorted([self.vegan.id, Tag.objects.get(name='Lunch').id]),
+        )
+        self.assertEqual(salad.ingredients.count(), 2)
+        soup = Recipe.objects.get(title='Soup, hot')
+        self.assertEqual(soup.user, other)
+        self.assertEqual(soup.ingredients.get().user, other)
+
+    def test_resume_from_checkpoint(self):
+        """test a rerun skips the records a checkpoint covers"""
+        path = self.ndjson([
+            {'title': f'Recipe {i}', 'time_minutes': 1, 'price': 1}
+            for i in range(5)
+        ])
+        checkpoint = os.path.join(self.directory, 'checkpoint.json')
+        with open(checkpoint, 'w', encoding='utf-8') as file:
+            json.dump({'path': path, 'position': 3}, file)
+
+        out, _ = self.call(path, batch_size=2, checkpoint=checkpoint)
+
+        self.assertIn('Resuming after record 3', out)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Recipe 3', 'Recipe 4'],
+        )
+        with open(checkpoint, encoding='utf-8') as file:
+            self.assertEqual(json.load(file)['position'], 5)
+
+        out, _ = self.call(path, checkpoint=checkpoint)
+
+        self.assertIn('Imported 0 recipes', out)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_import_nulls(self):
+        """test nulls are blank text fields, or invalid where required"""
+        path = self.ndjson([
+            {'title': 'Soup', 'time_minutes': 5, 'price': 1,
+             'description': None, 'link': None},
+            {'title': None, 'time_minutes': 5, 'price': 1},
+            {'title': 'Stew', 'time_minutes': None, 'price': 1},
+        ])
+
+        out, err = self.call(path)
+
+        self.assertIn('Imported 1 recipes', out)
+        self.assertIn('Record 2: title', err)
+        self.assertIn('Record 3: time_minutes', err)
+        soup = Recipe.objects.get()
+        self.assertEqual((soup.description, soup.link), ('', ''))
+
+    def test_import_interleaved_inserts(self):
+        """test the names join the imported recipes, not concurrent ones"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='test123',
+        )
+        insert = QuerySet._insert
+
+        def interleaved_insert(queryset, objs, *args, **kwargs):
+            rows = insert(queryset, objs, *args, **kwargs)
+            if queryset.model is Recipe and objs[0].user == self.user:
+                insert(queryset, [Recipe(
+                    user=other, title='Concurrent', time_minutes=1, price=1,
+                )], Recipe._meta.concrete_fields[1:])
+            return rows
+
+        path = self.ndjson([
+            {'title': 'Soup', 'time_minutes': 5, 'price': 1,
+             'tags': ['Vegan']},
+            {'title': 'Stew', 'time_minutes': 5, 'price': 1,
+             'tags': ['Dinner']},
+        ])
+
+        with mock.patch.object(QuerySet, '_insert', interleaved_insert):
+            self.call(path)
+
+        self.assertEqual(
+            list(Recipe.objects.get(title='Soup').tags.values_list(
+                'name', flat=True,
+            )),
+            ['Vegan'],
+        )
+        self.assertEqual(
+            list(Recipe.objects.get(title='Stew').tags.values_list(
+                'name', flat=True,
+            )),
+            ['Dinner'],
+        )
+        self.assertFalse(
+            Recipe.objects.filter(title='Concurrent', tags__isnull=False)
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs postgres')
+    def test_import_with_copy(self):
+        """test recipes and their names are written with COPY"""
+        path = self.ndjson([
+            {
+                'title': f'Recipe "{i}"',
+                'description': 'a,b\n\\N' if i else None,
+                'time_minutes': i + 1,
+                'price': '1.50',
+                'tags': ['Vegan', f'Tag {i}'],
+                'ingredients': ['Salt'],
+            }
+            for i in range(3)
+        ])
+
+        out, _ = self.call(path, batch_size=2)
+
+        self.assertIn('Imported 3 recipes', out)
+        recipes = Recipe.objects.order_by('id')
+        self.assertEqual(
+            [recipe.title for recipe in recipes],
+            ['Recipe "0"', 'Recipe "1"', 'Recipe "2"'],
+        )
+        self.assertEqual(recipes[0].description, '')
+        self.assertEqual(recipes[1].description, 'a,b\n\\N')
+        self.assertEqual(recipes[2].price, Decimal('1.50'))
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertIn(self.vegan, recipe.tags.all())
+            self.assertEqual(recipe.ingredients.get().name, 'Salt')
+        self.assertEqual(Tag.objects.count(), 4)
+        # the sequence moved past the ids taken for COPY
+        self.assertGreater(
+            Recipe.objects.create(
+                user=self.user, title='Next', time_minutes=1, price=1,
+            ).id,
+            recipes[2].id,
+        )
+
+    def test_copy_value(self):
+        """test COPY fields are always quoted so only \\N is NULL"""
+        self.assertEqual(_copy_value(None), '\\N')
+        self.assertEqual(_copy_value(''), '""')
+        self.assertEqual(_copy_value('\\N'), '"\\N"')
+        self.assertEqual(_copy_value('say "hi"'), '"say ""hi"""')
+        self.assertEqual(_copy_value(Decimal('1.50')), '"1.50"')
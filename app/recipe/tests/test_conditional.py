@@ -0,0 +1,241 @@
+"""
+tests for ETag and Last-Modified conditional requests
+"""
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import (
+    cache,
+    caches,
+)
+from django.db import (
+    DatabaseError,
+    transaction,
+)
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import checks
+from core.models import (
+    Recipe,
+    Tag,
+)
+from recipe.caching import bump_version
+from recipe.tests.test_recipe_api import (
+    BULK_URL,
+    RECIPES_URL,
+    create_recipe,
+    create_user,
+    detail_url,
+)
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class ConditionalRequestTests(TestCase):
+    """test conditional GETs of the recipe endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        # committed, so the version changes of the tests are their own
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = create_user(
+                email='user@example.com',
+                password='test123',
+            )
+            self.recipe = create_recipe(user=self.user)
+        self.client.force_authenticate(self.user)
+
+    def etag(self, url=RECIPES_URL, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res['ETag']
+
+    def test_unchanged_list_not_modified(self):
+        """test a matching If-None-Match gets 304 without the list query"""
+        etag = self.etag()
+
+        # only the collection version is read
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertFalse(res.content)
+
+    def test_etag_depends_on_request(self):
+        """test other params and other users get other ETags"""
+        etag = self.etag()
+        other = create_user(email='other@example.com', password='test123')
+
+        self.assertNotEqual(self.etag(page_size=1), etag)
+        self.assertNotEqual(self.etag(TAGS_URL), etag)
+        self.client.force_authenticate(other)
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_writes_change_etag(self):
+        """test writes to recipes, tags and ingredients change the ETag"""
+        writes = [
+            lambda: self.client.patch(
+                detail_url(self.recipe.id), {'title': 'new'}, format='json',
+            ),
+            lambda: self.client.post(BULK_URL, [
+                {'title': 'bulk', 'time_minutes': 5, 'price': '1.00'},
+            ], format='json'),
+            lambda: Tag.objects.create(user=self.user, name='Vegan'),
+            lambda: self.recipe.tags.add(Tag.objects.get(name='Vegan')),
+            lambda: self.client.delete(detail_url(self.recipe.id)),
+        ]
+        etags = {self.etag(), self.etag(TAGS_URL)}
+        for write in writes:
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+            etags.update([self.etag(), self.etag(TAGS_URL)])
+
+        self.assertEqual(len(etags), 2 * (len(writes) + 1))
+
+    def test_rolled_back_write_keeps_etag(self):
+        """test a write of a rolled back transaction keeps the ETag"""
+        etag = self.etag()
+
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                Tag.objects.create(user=self.user, name='Vegan')
+                raise DatabaseError('rolled back')
+
+        self.assertEqual(self.etag(), etag)
+
+    def test_version_bumped_once_per_transaction(self):
+        """test the writes of a transaction change the version once"""
+        with patch('recipe.caching._set_new_version') as set_new_version, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                bump_version(self.user.id)
+                bump_version(self.user.id)
+
+        self.assertEqual(len(callbacks), 1)
+        set_new_version.assert_called_once_with(self.user.id)
+
+    def test_version_bumped_after_rolled_back_savepoint(self):
+        """test a write after a rolled back savepoint changes the version"""
+        etag = self.etag()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                with self.assertRaises(DatabaseError):
+                    with transaction.atomic():
+                        bump_version(self.user.id)
+                        raise DatabaseError('rolled back')
+                bump_version(self.user.id)
+
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_write_of_other_process_changes_etag(self):
+        """test a version changed through another cache instance is seen"""
+        etag = self.etag()
+
+        # another process writing, with its own connection to the cache
+        other = caches.create_connection('shared')
+        with patch('recipe.caching._cache', return_value=other), \
+                self.captureOnCommitCallbacks(execute=True):
+            bump_version(self.user.id)
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    @override_settings(RECIPE_VERSION_CACHE=None)
+    def test_no_etag_without_version_cache(self):
+        """test lists carry no ETag without a version cache"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', res)
+
+    @override_settings(RECIPE_VERSION_CACHE='default')
+    def test_local_version_cache_check(self):
+        """test a process local version cache is reported"""
+        errors = checks.check_recipe_version_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E002'])
+
+    def test_other_users_writes_keep_etag(self):
+        """test writes of another user leave the ETag unchanged"""
+        etag = self.etag()
+        other = create_user(email='other@example.com', password='test123')
+        create_recipe(user=other)
+
+        self.assertEqual(self.etag(), etag)
+
+    def test_detail_last_modified(self):
+        """test detail responses support If-Modified-Since"""
+        res = self.client.get(detail_url(self.recipe.id))
+        last_modified = res['Last-Modified']
+
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_MODIFIED_SINCE=last_modified,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['Last-Modified'], last_modified)
+
+    def test_detail_etag(self):
+        """test detail responses support If-None-Match"""
+        etag = self.etag(detail_url(self.recipe.id))
+
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_NONE_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_detail_etag_changes_within_a_second(self):
+        """test a write in the same second as the last one is seen"""
+        updated_at = self.recipe.updated_at.replace(microsecond=1000)
+        Recipe.objects.filter(pk=self.recipe.pk).update(updated_at=updated_at)
+        res = self.client.get(detail_url(self.recipe.id))
+        etag, last_modified = res['ETag'], res['Last-Modified']
+
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            title='new title',
+            updated_at=updated_at.replace(microsecond=900000),
+        )
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_NONE_MATCH=etag,
+            HTTP_IF_MODIFIED_SINCE=last_modified,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'new title')
+        self.assertEqual(res['Last-Modified'], last_modified)
+
+    def test_detail_modified_by_tag_rename(self):
+        """test renaming a tag of the recipe moves its Last-Modified"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        past = timezone.now() - timedelta(days=1)
+        Recipe.objects.filter(pk=self.recipe.pk).update(updated_at=past)
+        since = http_date(past.timestamp())
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_MODIFIED_SINCE=since,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Vegetarian')
@@ -0,0 +1,105 @@
+"""
+tests for the streaming recipe export
+"""
+import json
+
+from django.db import connection
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Tag,
+    Ingredient,
+)
+from recipe.tests.test_recipe_api import (
+    create_recipe,
+    create_user,
+    detail_url,
+)
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class PublicExportTests(TestCase):
+    """test the export without authentication"""
+
+    def test_auth_required(self):
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    """test streaming the recipes of a user as NDJSON"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Salt',
+        )
+        self.recipes = []
+        for i in range(5):
+            recipe = create_recipe(
+                user=self.user, title=f'Recipe {i} ',
+            )
+            recipe.tags.add(self.tag)
+            if i % 2:
+                recipe.ingredients.add(self.ingredient)
+            self.recipes.append(recipe)
+
+    def export(self, **headers):
+        res = self.client.get(EXPORT_URL, **headers)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        return res, b''.join(res.streaming_content)
+
+    def test_export_lines_match_detail(self):
+        """test every recipe is a line equal to its detail response"""
+        other = create_user(email='other@example.com', password='test123')
+        create_recipe(user=other)
+
+        res, content = self.export()
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertIn('recipes.ndjson', res['Content-Disposition'])
+        lines = content.decode('utf-8').splitlines()
+        self.assertEqual(len(lines), len(self.recipes))
+        for recipe, line in zip(self.recipes, lines):
+            detail = self.client.get(detail_url(recipe.id))
+            self.assertEqual(json.loads(line), json.loads(detail.content))
+
+    def test_export_other_accept(self):
+        """test clients asking for JSON still get the NDJSON export"""
+        res, content = self.export(HTTP_ACCEPT='application/json')
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(content.splitlines()), len(self.recipes))
+
+    def test_export_queries_per_chunk(self):
+        """test the relations are loaded once per chunk of recipes"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.export()
+
+        # the recipes, then tags and ingredients for each of 3 chunks
+        self.assertEqual(len(ctx.captured_queries), 1 + 3 * 2)
+
+    def test_export_empty(self):
+        """test a user without recipes gets an empty body"""
+        self.client.force_authenticate(
+            create_user(email='new@example.com', password='test123')
+        )
+
+        _, content = self.export()
+
+        self.assertEqual(content, b'')
@@ -0,0 +1,459 @@
+"""
+tests for the resized variants of recipe images
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import (
+    BytesIO,
+    StringIO,
+)
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    ContentImage,
+    ImageStatus,
+    Recipe,
+)
+from recipe import images
+from recipe.images import variant_name
+from recipe.uploads import ImageUploadHandler
+from recipe.tests.test_recipe_api import (
+    create_recipe,
+    create_user,
+    detail_url,
+    image_upload_url,
+)
+
+
+def image_file(size, image_format='JPEG', mode='RGB', name='photo.jpg',
+               color=0):
+    """return an in-memory image file of size"""
+    file = BytesIO()
+    Image.new(mode, size, color).save(file, format=image_format)
+    file.name = name
+    file.seek(0)
+    return file
+
+
+class MediaRootMixin:
+    """store the files written by a test in a temporary MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class ImageVariantTests(MediaRootMixin, TestCase):
+    """test creating and serving resized variants of uploads"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def upload(self, file, expected=status.HTTP_200_OK):
+        res = self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': file},
+            format='multipart',
+        )
+        self.assertEqual(res.status_code, expected)
+        self.recipe.refresh_from_db()
+        return res
+
+    def test_upload_creates_variants(self):
+        """test a variant fitting each size is stored and linked"""
+        res = self.upload(image_file((2000, 1000)))
+
+        expected = {128: (128, 64), 512: (512, 256), 1024: (1024, 512)}
+        for size, dimensions in expected.items():
+            name = variant_name(self.recipe.image.name, size)
+            with default_storage.open(name) as file, \
+                    Image.open(file) as variant:
+                self.assertEqual(variant.size, dimensions)
+                self.assertEqual(variant.format, 'JPEG')
+            self.assertTrue(
+                res.data['thumbnails'][str(size)].endswith(
+                    default_storage.url(name)
+                )
+            )
+        self.assertEqual(list(res.data['thumbnails']), ['128', '512', '1024'])
+
+    def test_small_image_not_enlarged(self):
+        """test images smaller than a size are stored at their size"""
+        self.upload(image_file((100, 50)))
+
+        name = variant_name(self.recipe.image.name, 1024)
+        with default_storage.open(name) as file, Image.open(file) as variant:
+            self.assertEqual(variant.size, (100, 50))
+
+    def test_png_keeps_format(self):
+        """test variants are encoded in the format of the upload"""
+        self.upload(image_file((600, 600), 'PNG', 'RGBA', 'photo.png'))
+
+        name = variant_name(self.recipe.image.name, 512)
+        with default_storage.open(name) as file, Image.open(file) as variant:
+            self.assertEqual(variant.format, 'PNG')
+            self.assertEqual(variant.mode, 'RGBA')
+
+    def test_failed_processing(self):
+        """test an image failing to process is rejected and recorded"""
+        with patch.object(
+            images, 'create_variants', side_effect=OSError('broken'),
+        ), self.assertLogs('recipe.images', 'ERROR'):
+            res = self.upload(
+                image_file((300, 300)), status.HTTP_400_BAD_REQUEST,
+            )
+
+        self.assertIn('image', res.data)
+        self.assertEqual(self.recipe.image_status, ImageStatus.FAILED)
+
+    def test_detail_update_keeps_image(self):
+        """test the image cannot be replaced through the detail endpoint"""
+        self.upload(image_file((300, 300)))
+        name = self.recipe.image.name
+
+        res = self.client.patch(
+            detail_url(self.recipe.id),
+            {'title': 'new title', 'image': image_file((200, 200))},
+            format='multipart',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'new title')
+        self.assertEqual(self.recipe.image.name, name)
+
+    @override_settings(RECIPE_IMAGE_SIZES=(64,))
+    def test_detail_thumbnails(self):
+        """test the detail has the variant urls, or None without image"""
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertIsNone(res.data['thumbnails'])
+
+        self.upload(image_file((200, 200)))
+        res = self.client.get(
+            detail_url(self.recipe.id), {'fields': 'id,thumbnails'},
+        )
+
+        self.assertEqual(list(res.data), ['id', 'thumbnails'])
+        self.assertEqual(list(res.data['thumbnails']), ['64'])
+
+
+@override_settings(RECIPE_IMAGE_ASYNC=True)
+class AsyncImageTests(ImageVariantTests):
+    """test processing uploads outside the request"""
+
+    def upload(self, file, expected=status.HTTP_200_OK):
+        """upload and process the pending image, like a worker would"""
+        res = super().upload(file, status.HTTP_202_ACCEPTED)
+
+        recipe = images.claim_image()
+        self.assertEqual(recipe.id, self.recipe.id)
+        images.make_variants(recipe)
+        self.recipe.refresh_from_db()
+        return self.client.get(res['Location'])
+
+    def test_upload_accepted(self):
+        """test an upload is answered before processing, with a status url"""
+        res = self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': image_file((300, 300))},
+            format='multipart',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['image_status'], ImageStatus.PENDING)
+        self.assertIsNone(res.data['thumbnails'])
+        self.assertEqual(res['Location'], res.data['status_url'])
+        status_res = self.client.get(res.data['status_url'])
+        self.assertEqual(status_res.status_code, status.HTTP_200_OK)
+        self.assertEqual(status_res.data['image_status'], 'pending')
+
+    def test_failed_processing(self):
+        """test an error while processing is recorded on the recipe"""
+        with patch.object(
+            images, 'create_variants', side_effect=OSError('broken'),
+        ), self.assertLogs('recipe.images', 'ERROR'):
+            res = self.upload(image_file((300, 300)))
+
+        self.assertEqual(res.data['image_status'], ImageStatus.FAILED)
+        self.assertIsNone(res.data['thumbnails'])
+
+    def test_stale_job_ignored(self):
+        """test a job for a replaced image does not change the status"""
+        self.upload(image_file((300, 300)))
+        old = self.recipe.image.name
+        self.recipe.image.name = 'uploads/recipe/other.jpg'
+        self.recipe.save()
+
+        self.recipe.image.name = old
+        self.assertFalse(images.set_status(self.recipe, ImageStatus.FAILED))
+
+    def test_claimed_once(self):
+        """test a pending image is claimed by one worker only"""
+        self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': image_file((300, 300))},
+            format='multipart',
+        )
+
+        recipe = images.claim_image()
+
+        self.assertEqual(recipe.image_status, ImageStatus.PROCESSING)
+        self.assertIsNone(images.claim_image())
+
+    def test_stale_processing_claimed_again(self):
+        """test an image left processing by a stopped worker is claimed"""
+        self.upload(image_file((300, 300)))
+        Recipe.objects.filter(pk=self.recipe.id).update(
+            image_status=ImageStatus.PROCESSING,
+            updated_at=timezone.now() - timedelta(minutes=20),
+        )
+
+        self.assertIsNone(images.claim_image(stale_after=30 * 60))
+        recipe = images.claim_image(stale_after=10 * 60)
+
+        self.assertEqual(recipe.id, self.recipe.id)
+
+
+@override_settings(RECIPE_IMAGE_CONTENT_ADDRESSED=True)
+class ContentAddressedImageTests(ImageVariantTests):
+    """test storing uploads once under the digest of their content"""
+
+    def upload_to(self, recipe, file):
+        res = self.client.post(
+            image_upload_url(recipe.id), {'image': file}, format='multipart',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        return res
+
+    def test_identical_images_shared(self):
+        """test the same content is stored and processed once"""
+        other = create_recipe(user=self.user)
+        self.upload_to(self.recipe, image_file((300, 300)))
+
+        with patch.object(images, 'create_variants') as create_variants:
+            res = self.upload_to(other, image_file((300, 300), name='b.JPG'))
+
+        create_variants.assert_not_called()
+        self.assertEqual(res.data['image_status'], ImageStatus.READY)
+        self.assertEqual(other.image.name, self.recipe.image.name)
+        self.assertTrue(other.image.name.startswith('uploads/recipe/sha256/'))
+        self.assertEqual(
+            ContentImage.objects.get(name=other.image.name).references, 2,
+        )
+
+    def test_extension_from_content(self):
+        """test the stored name ends with the extension of the format"""
+        self.upload_to(
+            self.recipe, image_file((300, 300), 'PNG', name='photo.jpg'),
+        )
+
+        self.assertTrue(self.recipe.image.name.endswith('.png'))
+        self.assertEqual(
+            images.content_name(File(image_file((10, 10)), 'x.gif'))[-4:],
+            '.jpg',
+        )
+
+    def test_last_reference_deletes_files(self):
+        """test files are deleted once no recipe references them"""
+        other = create_recipe(user=self.user)
+        self.upload_to(self.recipe, image_file((300, 300)))
+        self.upload_to(other, image_file((300, 300)))
+        name = self.recipe.image.name
+
+        self.upload_to(self.recipe, image_file((300, 300), color=255))
+        self.assertNotEqual(self.recipe.image.name, name)
+        self.assertEqual(ContentImage.objects.get(name=name).references, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        other.delete()
+
+        self.assertFalse(ContentImage.objects.filter(name=name).exists())
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(variant_name(name, 128)))
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+
+    def test_detail_update_keeps_reference(self):
+        """test a detail update neither stores an image nor drops one"""
+        self.upload_to(self.recipe, image_file((300, 300)))
+        name = self.recipe.image.name
+
+        self.client.patch(
+            detail_url(self.recipe.id),
+            {'image': image_file((200, 200), color=255)},
+            format='multipart',
+        )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, name)
+        self.assertEqual(ContentImage.objects.get(name=name).references, 1)
+        self.assertEqual(ContentImage.objects.count(), 1)
+
+    def test_uploaded_names_not_released(self):
+        """test images stored before content addressing are left alone"""
+        self.recipe.image.save('photo.jpg', image_file((10, 10)))
+        name = self.recipe.image.name
+
+        self.recipe.delete()
+
+        self.assertTrue(default_storage.exists(name))
+
+
+class ImageUploadHandlerTests(MediaRootMixin, TestCase):
+    """test checking uploads while they stream to disk"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def post(self, file):
+        res = self.client.post(
+            image_upload_url(self.recipe.id), {'image': file},
+            format='multipart',
+        )
+        self.recipe.refresh_from_db()
+        return res
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1000)
+    def test_too_large_rejected(self):
+        """test uploads over the size cap are refused"""
+        file = BytesIO()
+        Image.frombytes('RGB', (100, 100), os.urandom(30000)).save(
+            file, format='PNG',
+        )
+        file.name = 'photo.png'
+        file.seek(0)
+
+        res = self.post(file)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('at most', res.data['image'][0])
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1000)
+    def test_rejected_upload_not_read_further(self):
+        """test the chunks after a rejected one are not received"""
+        file = BytesIO(image_file((10, 10)).read() + os.urandom(30000))
+        file.name = 'photo.jpg'
+
+        with patch.object(ImageUploadHandler, 'chunk_size', 1024), \
+                patch.object(
+                    ImageUploadHandler, 'receive_data_chunk', autospec=True,
+                    side_effect=ImageUploadHandler.receive_data_chunk,
+                ) as receive_data_chunk:
+            res = self.post(file)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('at most', res.data['image'][0])
+        self.assertEqual(receive_data_chunk.call_count, 1)
+
+    def test_not_an_image_rejected(self):
+        """test files not starting like an image are refused"""
+        file = BytesIO(b'<?php echo "not an image"; ?>' * 10)
+        file.name = 'photo.jpg'
+
+        res = self.post(file)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('valid image', res.data['image'][0])
+
+    def test_truncated_image_rejected(self):
+        """test an image with a valid header but cut short is refused"""
+        file = BytesIO(image_file((300, 300), 'PNG').read()[:200])
+        file.name = 'photo.png'
+
+        res = self.post(file)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+        self.assertFalse(self.recipe.image)
+        self.assertEqual(self.recipe.image_status, ImageStatus.NONE)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        """test the dimensions are checked from the header"""
+        res = self.post(image_file((20, 20)))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('100 pixels', res.data['image'][0])
+
+    @override_settings(RECIPE_IMAGE_CONTENT_ADDRESSED=True)
+    def test_digest_computed_while_received(self):
+        """test the digest of the stream names the stored file"""
+        file = image_file((30, 30))
+        digest = hashlib.sha256(file.getvalue()).hexdigest()
+
+        with patch.object(Image.Image, 'verify') as verify:
+            res = self.post(file)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        verify.assert_not_called()
+        self.assertIn(digest, self.recipe.image.name)
+
+
+class ProcessImagesCommandTests(MediaRootMixin, TestCase):
+    """test the command processing left over images"""
+
+    def test_process_images(self):
+        """test unprocessed images get variants and ready recipes are kept"""
+        user = create_user(email='user@example.com', password='test123')
+        pending = create_recipe(user=user)
+        pending.image.save('photo.jpg', image_file((300, 300)))
+        ready = create_recipe(user=user, image_status=ImageStatus.READY)
+        create_recipe(user=user)
+        out = StringIO()
+
+        call_command('process_images', once=True, stdout=out)
+
+        self.assertIn('Processed 1 images', out.getvalue())
+        pending.refresh_from_db()
+        self.assertEqual(pending.image_status, ImageStatus.READY)
+        self.assertTrue(default_storage.exists(
+            variant_name(pending.image.name, 128)
+        ))
+        ready.refresh_from_db()
+        self.assertEqual(ready.image_status, ImageStatus.READY)
+
+    def test_worker_processes_pending(self):
+        """test the worker claims pending images until interrupted"""
+        user = create_user(email='user@example.com', password='test123')
+        pending = create_recipe(user=user, image_status=ImageStatus.PENDING)
+        pending.image.save('photo.jpg', image_file((300, 300)))
+        out = StringIO()
+
+        # interrupted once no image is left
+        with patch('time.sleep', side_effect=KeyboardInterrupt) as sleep:
+            call_command('process_images', interval=5, stdout=out)
+
+        sleep.assert_called_once_with(5)
+        self.assertIn(f'Processed recipe {pending.id}', out.getvalue())
+        pending.refresh_from_db()
+        self.assertEqual(pending.image_status, ImageStatus.READY)
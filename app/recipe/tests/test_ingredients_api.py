@@ -132,3 +132,20 @@ class PrivateIngredientsApiTests(TestCase):
 
         self.assertEqual(len(res.data), 1)
 
+    def test_cursor_pagination(self):
+        """test paging through ingredients ordered by name"""
+        for name in ['Kale', 'Salt', 'Pepper', 'Sea salt', 'Lemon']:
+            Ingredient.objects.create(user=self.user, name=name)
+        expected = list(
+            Ingredient.objects.order_by('-name', '-id')
+            .values_list('id', flat=True)
+        )
+
+        seen = []
+        url = INGREDIENTS_URL + '?page_size=2'
+        while url:
+            res = self.client.get(url)
+            seen.extend(ingredient['id'] for ingredient in res.data['results'])
+            url = res.data['next']
+
+        self.assertEqual(seen, expected)
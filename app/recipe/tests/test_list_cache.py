@@ -0,0 +1,144 @@
+"""
+tests for the recipe list response cache
+"""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import (
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag
+from recipe.caching import list_cache_stats
+from recipe.tests.test_recipe_api import (
+    RECIPES_URL,
+    create_recipe,
+    create_user,
+    detail_url,
+)
+
+STATS_URL = reverse('recipe:recipe-list-cache-stats')
+
+
+@override_settings(RECIPE_LIST_CACHE='default')
+class ListCacheTests(TestCase):
+    """test caching recipe list responses"""
+
+    def setUp(self):
+        cache.clear()
+        list_cache_stats.reset()
+        self.client = APIClient()
+        # committed, so the version changes of the tests are their own
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = create_user(
+                email='user@example.com',
+                password='test123',
+            )
+            self.tag1 = Tag.objects.create(user=self.user, name='Vegan')
+            self.tag2 = Tag.objects.create(user=self.user, name='Dinner')
+            self.recipe = create_recipe(user=self.user)
+            self.recipe.tags.add(self.tag1, self.tag2)
+        self.client.force_authenticate(self.user)
+
+    def get(self, **params):
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res
+
+    def test_identical_request_served_from_cache(self):
+        """test a repeated list runs no query and counts a hit"""
+        first = self.get(tags=f'{self.tag1.id},{self.tag2.id}')
+
+        # only the collection version is read
+        with self.assertNumQueries(1):
+            second = self.get(tags=f'{self.tag2.id}, {self.tag1.id}')
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(list_cache_stats.as_dict(), {'hits': 1, 'misses': 1})
+
+    def test_other_params_and_users_miss(self):
+        """test the key covers the params and the user"""
+        self.get()
+        other = create_user(email='other@example.com', password='test123')
+
+        self.assertEqual(self.get(tags=str(self.tag1.id))['X-Cache'], 'MISS')
+        self.client.force_authenticate(other)
+        res = self.get()
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data, [])
+
+    def test_write_invalidates(self):
+        """test a write is seen by the next list"""
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                detail_url(self.recipe.id), {'title': 'New title'},
+                format='json',
+            )
+
+        res = self.get()
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data[0]['title'], 'New title')
+
+    @override_settings(RECIPE_LIST_CACHE=None)
+    def test_cache_disabled(self):
+        """test no cache is used when disabled"""
+        self.get()
+        res = self.get()
+
+        self.assertNotIn('X-Cache', res)
+
+    def test_file_based_cache(self):
+        """test the cache works with the file based backend"""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caches = {
+            **settings.CACHES,
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': location,
+            },
+        }
+        with override_settings(CACHES=caches):
+            first = self.get()
+            second = self.get()
+
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+
+    def test_stats_for_staff(self):
+        """test staff users get the counters of the process"""
+        self.get()
+        self.get()
+        staff = get_user_model().objects.create_superuser(
+            'admin@example.com', 'test123',
+        )
+        self.client.force_authenticate(staff)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data,
+            {'hits': 1, 'misses': 1, 'process': os.getpid()},
+        )
+
+    def test_stats_staff_only(self):
+        """test other users can not read the counters"""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
@@ -2,13 +2,17 @@
 test for recipe APIs
 """
 from decimal import Decimal
+from unittest.mock import patch
 import tempfile
 import os
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import (
+    TestCase,
+    override_settings,
+)
 from django.urls import reverse
 
 from rest_framework import status
@@ -20,12 +24,15 @@ from core.models import (
     Ingredient,
 )
 
+from recipe.images import delete_variants
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
+    RecipeListSerializer,
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
 
 def detail_url(recipe_id):
     """create and return recipe detail url"""
@@ -423,8 +430,467 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_filter_by_tags_unique(self):
+        """test a recipe matching several tags is listed once"""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dinner')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+
+    def test_filter_match_all_tags(self):
+        """test match=all only lists recipes with every tag"""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Dinner')
+        both = create_recipe(user=self.user, title='Both')
+        both.tags.add(tag1, tag2)
+        one = create_recipe(user=self.user, title='One')
+        one.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id},{tag1.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data], [both.id])
+
+    def test_filter_by_tags_and_ingredients(self):
+        """test combining tag and ingredient filters"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        r1 = create_recipe(user=self.user)
+        r1.tags.add(tag)
+        r1.ingredients.add(ingredient)
+        r2 = create_recipe(user=self.user)
+        r2.tags.add(tag)
+
+        params = {'tags': str(tag.id), 'ingredients': str(ingredient.id)}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data], [r1.id])
+
+    def test_filter_exclude_tags(self):
+        """test excluding recipes with any of the given tags"""
+        tag1 = Tag.objects.create(user=self.user, name='Meat')
+        tag2 = Tag.objects.create(user=self.user, name='Fish')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        r1 = create_recipe(user=self.user)
+        r1.ingredients.add(ingredient)
+        r2 = create_recipe(user=self.user)
+        r2.tags.add(tag1)
+        r2.ingredients.add(ingredient)
+        r3 = create_recipe(user=self.user)
+        r3.tags.add(tag2)
+
+        params = {
+            'ingredients': str(ingredient.id),
+            'exclude_tags': f'{tag1.id},{tag2.id}',
+        }
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data], [r1.id])
+
+    def test_list_sparse_fields(self):
+        """test ?fields= limits the fields of each recipe"""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        res = self.client.get(RECIPES_URL, {'fields': 'id,title,tags'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{
+            'id': recipe.id,
+            'title': recipe.title,
+            'tags': [{'id': recipe.tags.get().id, 'name': 'Vegan'}],
+        }])
+
+    def test_detail_sparse_fields(self):
+        """test ?fields= applies to the detail fields"""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(detail_url(recipe.id), {'fields': 'description'})
+
+        self.assertEqual(res.data, {'description': recipe.description})
+
+    def test_unknown_sparse_field(self):
+        """test asking for an unknown field is rejected"""
+        res = self.client.get(RECIPES_URL, {'fields': 'id,description'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_LIST_CACHE=None)
+    def test_fast_list_output_identical(self):
+        """test the fast list renders the same bytes as RecipeSerializer"""
+        for i in range(3):
+            recipe = create_recipe(
+                user=self.user, price=Decimal(f'{i}.5'), link='',
+            )
+            for name in [f'tag {i}', 'shared']:
+                tag, _ = Tag.objects.get_or_create(user=self.user, name=name)
+                recipe.tags.add(tag)
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'ing {i}')
+            )
+
+        for params in [{}, {'fields': 'price,tags'}, {'page_size': 2}]:
+            fast = self.client.get(RECIPES_URL, params)
+            with override_settings(RECIPE_FAST_LIST_SERIALIZER=False):
+                regular = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(fast.content, regular.content)
+
+    def test_create_recipe_with_duplicate_tags(self):
+        """test repeated tag names in a payload create a single tag"""
+        payload = {
+            'title': 'Thai prawn curry',
+            'time_minutes': 30,
+            'price': Decimal('2.50'),
+            'tags': [{'name': 'Thai'}, {'name': 'Thai'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.tags.count(), 1)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_create_recipe_matches_tag_names_ignoring_case(self):
+        """test tag names differing only in case reuse one tag"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        payload = {
+            'title': 'Salad',
+            'time_minutes': 5,
+            'price': Decimal('2.00'),
+            'tags': [{'name': 'vegan'}, {'name': 'Lunch'}, {'name': 'LUNCH'}],
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            sorted(t['name'] for t in res.data['tags']),
+            ['Lunch', 'Vegan'],
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertIn(tag.id, [t['id'] for t in res.data['tags']])
+
+    def test_create_recipe_matches_names_lowered_differently(self):
+        """test names python and the database lower case differently"""
+        # sqlite lowers ascii only, postgres may lower 'İ' unlike python
+        tag = Tag.objects.create(user=self.user, name='Äpfel')
+        payload = {
+            'title': 'Strudel',
+            'time_minutes': 50,
+            'price': Decimal('4.00'),
+            'tags': [{'name': 'Äpfel'}, {'name': 'Öl'}],
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            sorted(t['name'] for t in res.data['tags']),
+            ['Äpfel', 'Öl'],
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertIn(tag.id, [t['id'] for t in res.data['tags']])
+
+    def test_create_recipe_rolls_back_on_error(self):
+        """test a failure while adding tags does not leave a recipe"""
+        payload = {
+            'title': 'Thai prawn curry',
+            'time_minutes': 30,
+            'price': Decimal('2.50'),
+            'tags': [{'name': 'Thai'}],
+        }
+        with patch.object(
+            RecipeSerializer, 'get_or_create_ingredients',
+            side_effect=RuntimeError,
+        ):
+            with self.assertRaises(RuntimeError):
+                self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+        self.assertFalse(Tag.objects.filter(user=self.user).exists())
+
+    def test_list_unpaginated_by_default(self):
+        """test the recipe list is not paginated unless requested"""
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(res.data, list)
+
+    def test_cursor_pagination(self):
+        """test paging through recipes with cursors"""
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+        ids = [recipe.id for recipe in reversed(recipes)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], ids[:2])
+        self.assertIsNone(res.data['previous'])
+
+        seen = []
+        url = RECIPES_URL + '?page_size=2'
+        while url:
+            res = self.client.get(url)
+            seen.extend(r['id'] for r in res.data['results'])
+            url = res.data['next']
+
+        self.assertEqual(seen, ids)
+
+    def test_cursor_pagination_previous(self):
+        """test the previous cursor returns the earlier page"""
+        recipes = [create_recipe(user=self.user) for _ in range(4)]
+        ids = [recipe.id for recipe in reversed(recipes)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        res = self.client.get(res.data['next'])
+        self.assertEqual([r['id'] for r in res.data['results']], ids[2:])
 
+        res = self.client.get(res.data['previous'])
+        self.assertEqual([r['id'] for r in res.data['results']], ids[:2])
 
+    def test_cursor_pagination_with_filter(self):
+        """test cursor pagination keeps the tag filter across pages"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tagged = []
+        for _ in range(3):
+            recipe = create_recipe(user=self.user)
+            recipe.tags.add(tag)
+            tagged.append(recipe.id)
+            create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'tags': tag.id, 'page_size': 2})
+        seen = [r['id'] for r in res.data['results']]
+        res = self.client.get(res.data['next'])
+        seen.extend(r['id'] for r in res.data['results'])
+
+        self.assertEqual(seen, sorted(tagged, reverse=True))
+        self.assertIsNone(res.data['next'])
+
+
+class BulkRecipeAPITests(TestCase):
+    """test creating many recipes in one request"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create(self):
+        """test creating recipes with shared tags and ingredients"""
+        Tag.objects.create(user=self.user, name='Thai')
+        payload = [
+            {
+                'title': 'Thai prawn curry',
+                'time_minutes': 30,
+                'price': '2.50',
+                'tags': [{'name': 'Thai'}, {'name': 'Dinner'}],
+                'ingredients': [{'name': 'Prawns'}],
+            },
+            {
+                'title': 'Pad thai',
+                'time_minutes': 20,
+                'price': '3.00',
+                'description': 'Noodles',
+                'tags': [{'name': 'Thai'}],
+                'ingredients': [{'name': 'Noodles'}, {'name': 'Prawns'}],
+            },
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [recipe['title'] for recipe in res.data],
+            ['Thai prawn curry', 'Pad thai'],
+        )
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(recipes.count(), 2)
+        self.assertEqual(recipes[1].description, 'Noodles')
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 2,
+        )
+        self.assertEqual(
+            sorted(recipes[0].tags.values_list('name', flat=True)),
+            ['Dinner', 'Thai'],
+        )
+        self.assertEqual(
+            sorted(recipes[1].ingredients.values_list('name', flat=True)),
+            ['Noodles', 'Prawns'],
+        )
+        self.assertEqual(
+            res.data, RecipeDetailSerializer(recipes, many=True).data,
+        )
+
+    def test_bulk_create_errors_per_item(self):
+        """test invalid items are reported and nothing is created"""
+        payload = [
+            {'title': 'Valid', 'time_minutes': 5, 'price': '1.00'},
+            {'title': 'Invalid', 'price': '1.00'},
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('time_minutes', res.data[1])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_create_requires_list(self):
+        """test the bulk endpoint rejects a single object"""
+        payload = {'title': 'Valid', 'time_minutes': 5, 'price': '1.00'}
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_partial_update(self):
+        """test updating fields and tags of many recipes at once"""
+        r1 = create_recipe(user=self.user, title='One')
+        r2 = create_recipe(user=self.user, title='Two')
+        r1.tags.add(Tag.objects.create(user=self.user, name='Old'))
+        payload = [
+            {'id': r1.id, 'price': '9.99', 'tags': [{'name': 'New'}]},
+            {'id': r2.id, 'title': 'Second', 'tags': [{'name': 'New'}]},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': r1.id, 'status': 'updated'},
+            {'id': r2.id, 'status': 'updated'},
+        ])
+        r1.refresh_from_db()
+        r2.refresh_from_db()
+        self.assertEqual(r1.price, Decimal('9.99'))
+        self.assertEqual(r1.title, 'One')
+        self.assertEqual(r2.title, 'Second')
+        self.assertEqual(r2.price, Decimal('5.25'))
+        self.assertEqual(list(r1.tags.values_list('name', flat=True)), ['New'])
+        self.assertEqual(list(r2.tags.values_list('name', flat=True)), ['New'])
+        self.assertEqual(Tag.objects.filter(name='New').count(), 1)
+
+    def test_bulk_partial_update_reports_per_id(self):
+        """test other users recipes and invalid changes are reported"""
+        other_user = create_user(email='other@example.com', password='test123')
+        other = create_recipe(user=other_user, title='Other')
+        mine = create_recipe(user=self.user, title='Mine')
+        valid = create_recipe(user=self.user, title='Valid')
+        payload = [
+            {'id': other.id, 'title': 'Stolen'},
+            {'id': mine.id, 'price': 'not a price'},
+            {'id': valid.id, 'title': 'Changed'},
+            {'title': 'no id'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0], {'id': other.id, 'status': 'not_found'})
+        self.assertEqual(res.data[1]['status'], 'invalid')
+        self.assertIn('price', res.data[1]['errors'])
+        self.assertEqual(res.data[2], {'id': valid.id, 'status': 'updated'})
+        self.assertEqual(res.data[3]['status'], 'invalid')
+        other.refresh_from_db()
+        mine.refresh_from_db()
+        valid.refresh_from_db()
+        self.assertEqual(other.title, 'Other')
+        self.assertEqual(mine.price, Decimal('5.25'))
+        self.assertEqual(valid.title, 'Changed')
+
+    def test_bulk_partial_update_by_filter(self):
+        """test applying the same changes to recipes matching a filter"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1 = create_recipe(user=self.user)
+        r1.tags.add(tag)
+        r2 = create_recipe(user=self.user)
+        payload = {'changes': {'time_minutes': 99}}
+
+        res = self.client.patch(
+            f'{BULK_URL}?tags={tag.id}', payload, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': r1.id, 'status': 'updated'}])
+        r1.refresh_from_db()
+        r2.refresh_from_db()
+        self.assertEqual(r1.time_minutes, 99)
+        self.assertEqual(r2.time_minutes, 22)
+
+    @patch.object(RecipeListSerializer, 'max_batch_size', 2)
+    def test_bulk_partial_update_batch_size(self):
+        """test updating more recipes than a batch at once is rejected"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipes = [create_recipe(user=self.user) for _ in range(3)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+        payload = [{'id': recipe.id, 'title': 'New'} for recipe in recipes]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+        by_filter = self.client.patch(
+            f'{BULK_URL}?tags={tag.id}', {'changes': {'title': 'New'}},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(by_filter.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.filter(title='New').exists())
+
+    def test_bulk_delete(self):
+        """test deleting many recipes by id"""
+        other_user = create_user(email='other@example.com', password='test123')
+        other = create_recipe(user=other_user)
+        r1 = create_recipe(user=self.user)
+        r2 = create_recipe(user=self.user)
+        kept = create_recipe(user=self.user)
+
+        res = self.client.delete(
+            BULK_URL, {'ids': [r1.id, other.id, r2.id]}, format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': r1.id, 'status': 'deleted'},
+            {'id': other.id, 'status': 'not_found'},
+            {'id': r2.id, 'status': 'deleted'},
+        ])
+        self.assertTrue(Recipe.objects.filter(id=other.id).exists())
+        self.assertEqual(
+            list(Recipe.objects.filter(user=self.user)), [kept],
+        )
+
+    def test_bulk_delete_by_filter(self):
+        """test deleting recipes matching an ingredient filter"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Fish')
+        r1 = create_recipe(user=self.user)
+        r1.ingredients.add(ingredient)
+        kept = create_recipe(user=self.user)
+
+        res = self.client.delete(f'{BULK_URL}?ingredients={ingredient.id}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': r1.id, 'status': 'deleted'}])
+        self.assertEqual(
+            list(Recipe.objects.filter(user=self.user)), [kept],
+        )
+
+    def test_bulk_delete_requires_selection(self):
+        """test bulk delete without ids or a filter deletes nothing"""
+        create_recipe(user=self.user)
+
+        res = self.client.delete(BULK_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recipe.objects.filter(user=self.user).exists())
 
 
 class ImageUploadTests(TestCase):
@@ -439,6 +905,8 @@ class ImageUploadTests(TestCase):
         self.recipe = create_recipe(user=self.user)
 
     def tearDown(self):
+        if self.recipe.image:
+            delete_variants(self.recipe.image)
         self.recipe.image.delete()
 
     def test_upload_image(self):
@@ -463,24 +931,3 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format= 'multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
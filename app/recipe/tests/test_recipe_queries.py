@@ -0,0 +1,381 @@
+"""
+test the number of queries run by the recipe APIs
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.caching import get_version
+
+RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+def detail_url(recipe_id):
+    """create and return recipe detail url"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, tags=(), ingredients=(), **params):
+    """create and return a sample recipe with tags and ingredients"""
+    defaults = {
+        'title': 'sample recipe title',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+    }
+    defaults.update(params)
+    recipe = Recipe.objects.create(user=user, **defaults)
+    for name in tags:
+        recipe.tags.add(Tag.objects.create(user=user, name=name))
+    for name in ingredients:
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=user, name=name)
+        )
+
+    return recipe
+
+
+class QueryCountTestMixin:
+    """helpers asserting a request runs a fixed number of queries"""
+
+    def count_queries(self, func):
+        """
+        return the response of func and the number of queries it ran,
+        with those of its on_commit callbacks
+        """
+        with CaptureQueriesContext(connection) as ctx, \
+                self.captureOnCommitCallbacks(execute=True):
+            res = func()
+
+        return res, len(ctx.captured_queries)
+
+    def assertConstantQueries(self, func, grow, expected):
+        """
+        assert func runs `expected` queries and still does after grow()
+        has added more data for it to work on
+        """
+        res, before = self.count_queries(func)
+        with self.captureOnCommitCallbacks(execute=True):
+            grow()
+        res, after = self.count_queries(func)
+
+        self.assertEqual(before, expected)
+        self.assertEqual(after, expected)
+        return res
+
+
+class RecipeQueryCountTests(QueryCountTestMixin, TestCase):
+    """test recipe endpoints do not run N+1 queries"""
+
+    def setUp(self):
+        self.client = APIClient()
+        # fixtures are committed, so the on_commit callbacks counted are
+        # those of the request
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = get_user_model().objects.create_user(
+                'user@example.com',
+                'testpass123',
+            )
+        self.client.force_authenticate(self.user)
+        # lists read the collection version from the shared cache, one
+        # query once it exists
+        get_version(self.user.pk)
+
+    def create_recipe(self, **params):
+        """create and commit a sample recipe of the user"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_recipe(self.user, **params)
+
+    def add_recipes(self, count=5):
+        """add recipes with several tags and ingredients each"""
+        start = Recipe.objects.filter(user=self.user).count()
+        for i in range(start, start + count):
+            self.create_recipe(
+                tags=[f'tag {i} a', f'tag {i} b'],
+                ingredients=[f'ingredient {i} a', f'ingredient {i} b'],
+            )
+
+    def test_list_queries(self):
+        """test listing recipes runs a fixed number of queries"""
+        self.add_recipes(1)
+
+        res = self.assertConstantQueries(
+            lambda: self.client.get(RECIPES_URL),
+            self.add_recipes,
+            expected=4,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 6)
+        self.assertEqual(len(res.data[0]['tags']), 2)
+
+    def test_filtered_list_queries(self):
+        """test filtering recipes runs a fixed number of queries"""
+        self.add_recipes(1)
+        ids = ','.join(str(tag.id) for tag in Tag.objects.all())
+
+        res = self.assertConstantQueries(
+            lambda: self.client.get(RECIPES_URL, {'tags': ids}),
+            self.add_recipes,
+            expected=4,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+
+    def test_filtered_list_without_distinct(self):
+        """test filtering uses a semi-join instead of DISTINCT"""
+        self.add_recipes(2)
+        tags = ','.join(str(tag.id) for tag in Tag.objects.all())
+        ingredients = ','.join(
+            str(ingredient.id) for ingredient in Ingredient.objects.all()
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(
+                RECIPES_URL, {'tags': tags, 'ingredients': ingredients},
+            )
+
+        self.assertEqual(len(res.data), 2)
+        # the list query follows the collection version
+        self.assertIn('"core_recipe"', ctx.captured_queries[1]['sql'])
+        self.assertNotIn('DISTINCT', ctx.captured_queries[1]['sql'])
+
+    def test_sparse_list_queries(self):
+        """test ?fields= skips unrequested columns and prefetches"""
+        self.add_recipes()
+
+        res, queries = self.count_queries(
+            lambda: self.client.get(RECIPES_URL, {'fields': 'id,title'})
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(RECIPES_URL, {'fields': 'title', 'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # the collection version and the recipes
+        self.assertEqual(queries, 2)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertNotIn('description', ctx.captured_queries[1]['sql'])
+        self.assertEqual(set(res.data[0]), {'id', 'title'})
+
+    def test_retrieve_queries(self):
+        """test retrieving a recipe runs a fixed number of queries"""
+        recipe = self.create_recipe(
+            tags=['Vegan', 'Dinner'],
+            ingredients=['Tofu', 'Rice', 'Chili'],
+        )
+
+        res, queries = self.count_queries(
+            lambda: self.client.get(detail_url(recipe.id))
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, 3)
+        self.assertEqual(len(res.data['ingredients']), 3)
+
+    def test_create_queries(self):
+        """test the create response loads relations in fixed queries"""
+        payload = {
+            'title': 'Pongal',
+            'time_minutes': 60,
+            'price': Decimal('4.50'),
+        }
+
+        res, queries = self.count_queries(
+            lambda: self.client.post(RECIPES_URL, payload, format='json')
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        # 5 of them write the new collection version once, on commit
+        self.assertEqual(queries, 12)
+
+    def test_update_queries(self):
+        """test the update response loads relations in fixed queries"""
+        recipe = self.create_recipe(
+            tags=['Vegan', 'Dinner'],
+            ingredients=['Tofu', 'Rice'],
+        )
+
+        res, queries = self.count_queries(
+            lambda: self.client.patch(
+                detail_url(recipe.id),
+                {'title': 'new title'},
+                format='json',
+            )
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # 4 of them reindex the changed title and 5 write the new
+        # collection version once, on commit
+        self.assertEqual(queries, 17)
+        self.assertEqual(len(res.data['tags']), 2)
+
+    def test_create_with_nested_queries(self):
+        """test creating with tags and ingredients runs fixed queries"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(user=self.user, name='existing tag')
+
+        def payload(count):
+            return {
+                'title': 'Pongal',
+                'time_minutes': 60,
+                'price': Decimal('4.50'),
+                'tags': [{'name': 'existing tag'}] + [
+                    {'name': f'tag {count} {i}'} for i in range(count)
+                ],
+                'ingredients': [
+                    {'name': f'ingredient {count} {i}'} for i in range(count)
+                ],
+            }
+
+        res, few = self.count_queries(
+            lambda: self.client.post(RECIPES_URL, payload(2), format='json')
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res, many = self.count_queries(
+            lambda: self.client.post(RECIPES_URL, payload(20), format='json')
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(few, many)
+        self.assertEqual(len(res.data['tags']), 21)
+        self.assertEqual(len(res.data['ingredients']), 20)
+
+    def test_update_with_nested_queries(self):
+        """test updating tags and ingredients runs fixed queries"""
+        recipe = self.create_recipe(
+            tags=['Vegan'],
+            ingredients=['Tofu'],
+        )
+
+        def patch(count):
+            payload = {
+                'tags': [{'name': f'tag {count} {i}'} for i in range(count)],
+                'ingredients': [
+                    {'name': f'ingredient {count} {i}'} for i in range(count)
+                ],
+            }
+            return self.client.patch(
+                detail_url(recipe.id), payload, format='json'
+            )
+
+        res, few = self.count_queries(lambda: patch(2))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, many = self.count_queries(lambda: patch(20))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(few, many)
+        self.assertEqual(recipe.tags.count(), 20)
+
+    def test_unchanged_relations_write_nothing(self):
+        """test a patch repeating the current tags runs no m2m writes"""
+        recipe = self.create_recipe(
+            tags=['Vegan', 'Dinner'],
+            ingredients=['Tofu'],
+        )
+        through_ids = set(
+            Recipe.tags.through.objects.values_list('id', flat=True)
+        )
+        payload = {
+            'tags': [{'name': 'Dinner'}, {'name': 'Vegan'}],
+            'ingredients': [{'name': 'Tofu'}],
+        }
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id), payload, format='json'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        writes = [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith(('INSERT', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(
+            set(Recipe.tags.through.objects.values_list('id', flat=True)),
+            through_ids,
+        )
+
+    def test_changed_relations_write_difference(self):
+        """test a patch only deletes and inserts the changed m2m rows"""
+        recipe = self.create_recipe(tags=['Vegan', 'Dinner'])
+        kept = Recipe.tags.through.objects.get(tag__name='Vegan')
+        payload = {'tags': [{'name': 'Vegan'}, {'name': 'Lunch'}]}
+
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            Recipe.tags.through.objects.filter(id=kept.id).exists()
+        )
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Lunch', 'Vegan'],
+        )
+
+    def test_bulk_create_queries(self):
+        """test bulk create does not run queries per nested item"""
+        def payload(count):
+            return [
+                {
+                    'title': f'recipe {i}',
+                    'time_minutes': 5,
+                    'price': '1.00',
+                    'tags': [{'name': 'shared'}, {'name': f'tag {i}'}],
+                    'ingredients': [{'name': f'ingredient {i}'}],
+                }
+                for i in range(count)
+            ]
+
+        res, few = self.count_queries(
+            lambda: self.client.post(BULK_URL, payload(2), format='json')
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res, many = self.count_queries(
+            lambda: self.client.post(BULK_URL, payload(10), format='json')
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        if connection.features.can_return_rows_from_bulk_insert:
+            self.assertEqual(few, many)
+        else:
+            # recipes are inserted one by one without returning ids, each
+            # with its search document and postings
+            self.assertEqual(many - few, 24)
+
+    def test_bulk_update_queries(self):
+        """test bulk update does not run queries per recipe"""
+        recipes = [
+            self.create_recipe(tags=[f'tag {i}']) for i in range(10)
+        ]
+
+        def patch(count):
+            payload = [
+                {
+                    'id': recipe.id,
+                    'price': f'{count}.00',
+                    'tags': [{'name': f'new {count}'}],
+                }
+                for recipe in recipes[:count]
+            ]
+            return self.client.patch(BULK_URL, payload, format='json')
+
+        res, few = self.count_queries(lambda: patch(2))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res, many = self.count_queries(lambda: patch(10))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(few, many)
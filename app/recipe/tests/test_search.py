@@ -0,0 +1,167 @@
+"""
+tests for the recipe full-text search
+"""
+from django.test import (
+    TestCase,
+    override_settings,
+)
+
+from rest_framework.test import APIClient
+
+from core.models import (
+    RecipeSearchDocument,
+    RecipeSearchPosting,
+)
+from recipe import search
+from recipe.bitmap_index import recipe_index
+from recipe.tests.test_recipe_api import (
+    BULK_URL,
+    RECIPES_URL,
+    create_recipe,
+    create_user,
+    detail_url,
+)
+
+
+class RecipeSearchTests(TestCase):
+    """test searching recipes with the q param"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def search_ids(self, query, **params):
+        res = self.client.get(RECIPES_URL, {'q': query, **params})
+        return [r['id'] for r in res.data]
+
+    def test_tokenize(self):
+        """test terms are lower cased words"""
+        self.assertEqual(
+            search.tokenize('Spicy Thai-Curry, 2 bowls!'),
+            ['spicy', 'thai', 'curry', '2', 'bowls'],
+        )
+
+    def test_search_ranks_best_match_first(self):
+        """test recipes matching more query terms rank higher"""
+        curry = create_recipe(
+            user=self.user, title='Thai green curry',
+            description='A spicy curry with tofu',
+        )
+        soup = create_recipe(
+            user=self.user, title='Thai soup', description='Light soup',
+        )
+        create_recipe(user=self.user, title='Pancakes', description='Sweet')
+
+        self.assertEqual(
+            self.search_ids('spicy thai curry'),
+            [curry.id, soup.id],
+        )
+        self.assertEqual(self.search_ids('SOUP'), [soup.id])
+        self.assertEqual(self.search_ids('lasagna'), [])
+        self.assertEqual(self.search_ids('!!!'), [])
+
+    def test_search_limited_to_user(self):
+        """test other users' recipes are not searched"""
+        other = create_user(email='other@example.com', password='test123')
+        create_recipe(user=other, title='Curry')
+        mine = create_recipe(user=self.user, title='Curry')
+
+        self.assertEqual(self.search_ids('curry'), [mine.id])
+
+    def test_search_with_filters(self):
+        """test search combines with the other filters"""
+        r1 = create_recipe(user=self.user, title='Curry')
+        r1.tags.create(user=self.user, name='Vegan')
+        create_recipe(user=self.user, title='Curry')
+
+        tag = r1.tags.get()
+        self.assertEqual(self.search_ids('curry', tags=str(tag.id)), [r1.id])
+
+    @override_settings(RECIPE_SEARCH_MAX_RESULTS=1)
+    def test_filters_applied_before_best_matches(self):
+        """test the best matches are taken among the filtered recipes"""
+        tagged = create_recipe(user=self.user, title='Curry')
+        tag = tagged.tags.create(user=self.user, name='Vegan')
+        create_recipe(user=self.user, title='Curry curry')
+
+        self.assertEqual(
+            self.search_ids('curry', tags=str(tag.id)),
+            [tagged.id],
+        )
+
+    @override_settings(
+        RECIPE_BITMAP_INDEX=True,
+        RECIPE_SEARCH_MAX_RESULTS=1,
+    )
+    def test_bitmap_filters_applied_before_best_matches(self):
+        """test filters answered by the bitmap index apply to searches"""
+        recipe_index.clear()
+        self.addCleanup(recipe_index.clear)
+        tagged = create_recipe(user=self.user, title='Curry')
+        tag = tagged.tags.create(user=self.user, name='Vegan')
+        create_recipe(user=self.user, title='Curry curry')
+
+        self.assertEqual(
+            self.search_ids('curry', tags=str(tag.id)),
+            [tagged.id],
+        )
+
+    def test_filtered_search_keeps_ranking(self):
+        """test filtered results are ranked like unfiltered ones"""
+        best = create_recipe(user=self.user, title='Curry curry soup')
+        tag = best.tags.create(user=self.user, name='Vegan')
+        other = create_recipe(user=self.user, title='Soup')
+        other.tags.add(tag)
+        create_recipe(user=self.user, title='Curry')
+        ranked = self.search_ids('curry soup')
+
+        queryset = self.user.recipe_set.filter(tags=tag)
+        self.assertEqual(
+            search.search(self.user.id, 'curry soup', queryset=queryset),
+            [pk for pk in ranked if pk in (best.id, other.id)],
+        )
+
+    def test_search_paginated(self):
+        """test ranked results are paginated by page number"""
+        recipes = [
+            create_recipe(user=self.user, title='soup ' * count)
+            for count in range(1, 6)
+        ]
+        expected = [recipe.id for recipe in reversed(recipes)]
+
+        ids = []
+        url, params = RECIPES_URL, {'q': 'soup', 'page_size': 2}
+        while url:
+            res = self.client.get(url, params)
+            self.assertEqual(res.data['count'], 5)
+            ids += [recipe['id'] for recipe in res.data['results']]
+            url, params = res.data['next'], None
+
+        self.assertEqual(ids, expected)
+
+    def test_index_follows_writes(self):
+        """test the index is updated on create, update and delete"""
+        recipe = create_recipe(user=self.user, title='Tomato soup')
+        self.client.patch(
+            detail_url(recipe.id), {'title': 'Onion soup'}, format='json',
+        )
+        self.assertEqual(self.search_ids('tomato'), [])
+        self.assertEqual(self.search_ids('onion'), [recipe.id])
+
+        self.client.patch(BULK_URL, [
+            {'id': recipe.id, 'description': 'with garlic'},
+        ], format='json')
+        self.assertEqual(self.search_ids('garlic'), [recipe.id])
+
+        self.client.delete(detail_url(recipe.id))
+        self.assertFalse(RecipeSearchDocument.objects.exists())
+        self.assertFalse(RecipeSearchPosting.objects.exists())
+
+    def test_unchanged_text_not_reindexed(self):
+        """test saving without changing the text writes no postings"""
+        recipe = create_recipe(user=self.user, title='Tomato soup')
+        recipe.price = 10
+
+        with self.assertNumQueries(2):
+            recipe.save()
@@ -78,6 +78,17 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_update_tag_to_existing_name(self):
+        """test renaming to a name in use, ignoring case, is rejected"""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='Lunch')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Lunch')
+
     def test_delete_tag(self):
         """test deleting a tag"""
         tag = Tag.objects.create(user=self.user, name='Breakfast')
@@ -129,4 +140,67 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data), 1)
+
+    def test_cursor_pagination(self):
+        """test paging through tags ordered by name"""
+        names = ['Apple', 'Banana', 'Cherry', 'Blueberry', 'Date']
+        for name in names:
+            Tag.objects.create(user=self.user, name=name)
+        expected = list(
+            Tag.objects.order_by('-name', '-id').values_list('id', flat=True)
+        )
+
+        seen = []
+        url = TAGS_URL + '?page_size=2'
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data['results']), 2)
+            seen.extend(tag['id'] for tag in res.data['results'])
+            url = res.data['next']
+
+        self.assertEqual(seen, expected)
+
+    def test_cursor_pagination_previous(self):
+        """test the previous cursor returns the earlier page"""
+        for name in ['Apple', 'Banana', 'Cherry', 'Date']:
+            Tag.objects.create(user=self.user, name=name)
+
+        first = self.client.get(TAGS_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        res = self.client.get(second.data['previous'])
+
+        self.assertEqual(res.data['results'], first.data['results'])
+        self.assertIsNone(res.data['previous'])
+        self.assertEqual(
+            [tag['name'] for tag in second.data['results']],
+            ['Banana', 'Apple'],
+        )
+
+    def test_cursor_pagination_assigned_only(self):
+        """test cursor pagination with tags assigned to recipes"""
+        recipe = Recipe.objects.create(
+            title='Green egg toast',
+            time_minutes=10,
+            price=Decimal('2.5'),
+            user=self.user,
+        )
+        for name in ['Apple', 'Banana', 'Cherry', 'Date']:
+            tag = Tag.objects.create(user=self.user, name=name)
+            if name != 'Banana':
+                recipe.tags.add(tag)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1, 'page_size': 2})
+        names = [tag['name'] for tag in res.data['results']]
+        res = self.client.get(res.data['next'])
+        names.extend(tag['name'] for tag in res.data['results'])
+
+        self.assertEqual(names, ['Date', 'Cherry', 'Apple'])
+        self.assertIsNone(res.data['next'])
+
+    def test_invalid_cursor(self):
+        """test an invalid cursor returns not found"""
+        res = self.client.get(TAGS_URL, {'cursor': 'notacursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,133 @@
+"""
+streaming upload handler for recipe images
+
+uploads are written to a temporary file chunk by chunk, hashed on the
+way and dropped as soon as they pass RECIPE_IMAGE_MAX_UPLOAD_SIZE or do
+not start like an image, so a request holds about one chunk in memory
+whatever the size of the upload. the rest of the body of a dropped
+upload is not read. once complete, the format and the
+dimensions are read from the image header, without decoding the pixels.
+"""
+import hashlib
+import warnings
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+# the formats accepted and the bytes their files start with
+SIGNATURES = {
+    'JPEG': (b'\xff\xd8\xff',),
+    'PNG': (b'\x89PNG\r\n\x1a\n',),
+    'GIF': (b'GIF87a', b'GIF89a'),
+    'WEBP': (b'RIFF',),
+}
+SIGNATURE_LENGTH = 12
+
+
+def max_upload_size():
+    return getattr(settings, 'RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 ** 2)
+
+
+def max_pixels():
+    return getattr(settings, 'RECIPE_IMAGE_MAX_PIXELS', 40000000)
+
+
+def _has_signature(header):
+    """return True if header starts like a file of an accepted format"""
+    if header.startswith(b'RIFF') and header[8:12] != b'WEBP':
+        return False
+    return any(
+        header.startswith(signature)
+        for signatures in SIGNATURES.values()
+        for signature in signatures
+    )
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    write uploaded images to temporary files, checking them on the way
+
+    completed files carry their sha256 digest. they are still verified
+    in full by the serializer, the header alone does not tell a truncated
+    or corrupt image apart. rejected files are left out of request.FILES,
+    the reason is added to request.upload_errors under the name of their
+    field.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.header = b''
+        self.error = None
+
+    def _reject(self, message):
+        if self.error is None:
+            self.error = message
+            self.request.upload_errors = {
+                **getattr(self.request, 'upload_errors', {}),
+                self.field_name: [message],
+            }
+            self.file.truncate(0)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > max_upload_size():
+            self._reject(
+                'Upload an image of at most '
+                f'{filesizeformat(max_upload_size())}.'
+            )
+            raise StopUpload(connection_reset=True)
+
+        if len(self.header) < SIGNATURE_LENGTH:
+            self.header += raw_data[:SIGNATURE_LENGTH - len(self.header)]
+            if len(self.header) == SIGNATURE_LENGTH and \
+                    not _has_signature(self.header):
+                self._reject(self._invalid_message())
+                raise StopUpload(connection_reset=True)
+
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def _invalid_message(self):
+        return (
+            'Upload a valid image in one of the formats '
+            f'{", ".join(SIGNATURES)}.'
+        )
+
+    def file_complete(self, file_size):
+        if self.error is None and not _has_signature(self.header):
+            self._reject(self._invalid_message())
+        if self.error is not None:
+            self.upload_interrupted()
+            return None
+
+        file = super().file_complete(file_size)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', Image.DecompressionBombWarning)
+                # only reads the header, the pixels are never decoded
+                with Image.open(file) as image:
+                    image_format = image.format
+                    width, height = image.size
+        except (OSError, SyntaxError, Image.DecompressionBombWarning,
+                Image.DecompressionBombError):
+            image_format = None
+        file.seek(0)
+
+        if image_format not in SIGNATURES:
+            self._reject(self._invalid_message())
+        elif width * height > max_pixels():
+            self._reject(
+                f'Upload an image of at most {max_pixels()} pixels.'
+            )
+        if self.error is not None:
+            self.upload_interrupted()
+            return None
+
+        file.sha256 = self.digest.hexdigest()
+        return file
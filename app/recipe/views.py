@@ -1,3 +1,24 @@
+import os
+
+from django.conf import settings
+from django.db import (
+    IntegrityError,
+    transaction,
+)
+from django.db.models import (
+    Case,
+    IntegerField,
+    Prefetch,
+    When,
+    prefetch_related_objects,
+)
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import (
+    http_date,
+    parse_etags,
+    parse_http_date_safe,
+)
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -11,20 +32,72 @@ from rest_framework import (
 )
 
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import (
+    IsAdminUser,
+    IsAuthenticated,
+)
 
+from core.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
 from core.models import (
+    ImageStatus,
     Recipe,
     Tag,
     Ingredient,
 )
-from recipe import serializers
+from core.renderers import NDJSONRenderer
+from recipe import (
+    bitmap_index,
+    images,
+    search,
+    serializers,
+)
+from recipe.autocomplete import name_index
+from recipe.bitmap_index import recipe_index
+from recipe.caching import (
+    CachedListMixin,
+    CollectionETagMixin,
+    current_version,
+    list_cache_stats,
+    recipe_etag,
+)
+from recipe.filters import (
+    exclude_related,
+    filter_by_related,
+)
+from recipe.pagination import (
+    KeysetCursorPagination,
+    RankedPagination,
+    RecipeCursorPagination,
+)
+from recipe.uploads import ImageUploadHandler
+
+FIELDS_PARAMETER = OpenApiParameter(
+    'fields',
+    OpenApiTypes.STR,
+    description='Comma separated list of the fields to return',
+)
 
 @extend_schema_view(
     list=extend_schema(
         parameters = [
+            FIELDS_PARAMETER,
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                description='Search the recipe titles and descriptions, '
+                            'best matches first. Results are paginated '
+                            'with page and page_size instead of cursor',
+            ),
+            OpenApiParameter(
+                'page',
+                OpenApiTypes.INT,
+                description='Page of the search results, with q',
+            ),
             OpenApiParameter(
                 'tags',
                 OpenApiTypes.STR,
@@ -34,45 +107,218 @@ from recipe import serializers
                 'ingredients',
                 OpenApiTypes.STR,
                 description= 'Comma separated list of ingredients IDs to filter',
-            )
+            ),
+            OpenApiParameter(
+                'exclude_tags',
+                OpenApiTypes.STR,
+                description='Comma separated list of tag IDs to exclude',
+            ),
+            OpenApiParameter(
+                'exclude_ingredients',
+                OpenApiTypes.STR,
+                description='Comma separated list of ingredient IDs to '
+                            'exclude',
+            ),
+            OpenApiParameter(
+                'match',
+                OpenApiTypes.STR, enum=['any', 'all'],
+                description='Match recipes with any (default) or all of '
+                            'the listed tags and ingredients',
+            ),
         ]
-    )
+    ),
+    retrieve=extend_schema(parameters=[FIELDS_PARAMETER]),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CollectionETagMixin,
+                    CachedListMixin,
+                    viewsets.ModelViewSet):
     """view for manage recipe api"""
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    id_list_params = (
+        'tags',
+        'ingredients',
+        'exclude_tags',
+        'exclude_ingredients',
+    )
+
+    related_fields = ('tags', 'ingredients')
+    related_querysets = {
+        'tags': Tag.objects.order_by('id'),
+        'ingredients': Ingredient.objects.order_by('id'),
+    }
+    # model fields read by serializer fields of another name
+    field_sources = {'thumbnails': ('image', 'image_status')}
 
     def _params_to_ints(self, qs):
         """convert a list of string to integer 1,2,3"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _related_filters(self):
+        """return the included and excluded ids of each m2m field"""
+        params = self.request.query_params
+        include = {}
+        exclude = {}
+        for field_name in ('tags', 'ingredients'):
+            if params.get(field_name):
+                include[field_name] = self._params_to_ints(params[field_name])
+            if params.get(f'exclude_{field_name}'):
+                exclude[field_name] = self._params_to_ints(
+                    params[f'exclude_{field_name}']
+                )
+
+        return include, exclude
+
     def get_queryset(self):
         """retrieve recipe for authenticated user"""
         #return self.queryset.filter(user = self.request.user).order_by('-id')
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
+        include, exclude = self._related_filters()
+        match_all = self.request.query_params.get('match') == 'all'
         queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in = tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in = ingredient_ids)
+        if (include or exclude) and bitmap_index.is_enabled():
+            # ranked searches are not ordered by id
+            window = None
+            if self.action == 'list' and \
+                    not self.request.query_params.get('q'):
+                window = self.paginator.id_window(self.request)
+            queryset = queryset.filter(id__in=recipe_index.query(
+                self.request.user.pk, include, exclude, match_all,
+                version=current_version(self.request),
+                **(window or {}),
+            ))
+        else:
+            for field_name, ids in include.items():
+                queryset = filter_by_related(
+                    queryset, field_name, ids, match_all,
+                )
+            for field_name, ids in exclude.items():
+                queryset = exclude_related(queryset, field_name, ids)
 
-        return queryset.filter(
-            user = self.request.user
-        ).order_by('-id').distinct()
+        fields = self.requested_fields()
+        queryset = queryset.filter(user=self.request.user)
+        query = self.request.query_params.get('q')
+        ranked = None
+        if query and self.action == 'list':
+            ranked = search.search(
+                self.request.user.pk,
+                query,
+                search.max_results(),
+                queryset if include or exclude else None,
+            )
+        if self.fast_list():
+            queryset = queryset.values(
+                *serializers.FastRecipeSerializer.columns(fields)
+            )
+        else:
+            queryset = queryset.prefetch_related(
+                *self.related_prefetches(fields)
+            )
+            if fields is not None:
+                queryset = queryset.only('id', 'updated_at', *(
+                    source for name in fields
+                    if name not in self.related_fields
+                    for source in self.field_sources.get(name, (name,))
+                ))
+
+        if ranked is not None:
+            if not ranked:
+                return queryset.none()
+            return queryset.filter(id__in=ranked).order_by(Case(
+                *[When(id=pk, then=rank) for rank, pk in enumerate(ranked)],
+                output_field=IntegerField(),
+            ))
+
+        return queryset.order_by('-id')
+
+    @property
+    def paginator(self):
+        """ranked search results are paginated by page number"""
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            if request is not None and self.action == 'list' and \
+                    request.query_params.get('q'):
+                self._paginator = RankedPagination()
+            else:
+                return super().paginator
+        return self._paginator
 
+    def requested_fields(self):
+        """return the field names asked for with ?fields= on reads, or None"""
+        param = self.request.query_params.get('fields', '')
+        fields = [name.strip() for name in param.split(',') if name.strip()]
+        if not fields or self.action not in ('list', 'retrieve'):
+            return None
+
+        allowed = self.get_serializer_class().Meta.fields
+        unknown = [name for name in fields if name not in allowed]
+        if unknown:
+            raise ValidationError(
+                {'fields': [f'Unknown fields: {", ".join(unknown)}.']}
+            )
+        return fields
+
+    def related_prefetches(self, fields=None):
+        """return the prefetches of the requested relations, ordered by id"""
+        return [
+            Prefetch(name, queryset=self.related_querysets[name])
+            for name in self.related_fields
+            if fields is None or name in fields
+        ]
+
+    def fast_list(self):
+        """return True if the list is read with FastRecipeSerializer"""
+        return self.action == 'list' and \
+            getattr(settings, 'RECIPE_FAST_LIST_SERIALIZER', True)
+
+    def get_serializer_context(self):
+        """pass the requested fields on to the serializer"""
+        context = super().get_serializer_context()
+        context['fields'] = self.requested_fields()
+        return context
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        return the recipe, or 304 if unchanged
+
+        If-None-Match is compared with an ETag changing with updated_at to
+        the microsecond. If-Modified-Since only has second resolution and
+        is only used without If-None-Match.
+        """
+        instance = self.get_object()
+        etag = recipe_etag(request, instance)
+        last_modified = int(instance.updated_at.timestamp())
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            matches = parse_etags(request.META['HTTP_IF_NONE_MATCH'])
+            not_modified = etag in matches or '*' in matches
+        else:
+            since = parse_http_date_safe(
+                request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+            )
+            not_modified = since is not None and last_modified <= since
+        if not_modified:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(self.get_serializer(instance).data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
 
     def get_serializer_class(self):
         """return serializer class for request"""
         if self.action == 'list':
+            if self.fast_list():
+                return serializers.FastRecipeSerializer
             return serializers.RecipeSerializer
-        elif self.action == 'upload_image':
+        elif self.action in ('upload_image', 'image_status'):
             return serializers.ImageSerializer
+        elif self.action == 'cache_stats':
+            return serializers.ListCacheStatsSerializer
 
         return self.serializer_class
 
@@ -80,17 +326,272 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """create a new recipe"""
         serializer.save(user = self.request.user)
 
+    @extend_schema(request=serializers.RecipeDetailSerializer(many=True))
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """create many recipes in one request"""
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.save(user=request.user)
+
+        queryset = self.queryset.filter(
+            id__in=[recipe.id for recipe in recipes]
+        ).order_by('id').prefetch_related(*self.related_prefetches())
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def _is_id(self, value):
+        """return True if value is a recipe id"""
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def _selected_ids(self, request):
+        """
+        return the ids selected by a bulk request
+
+        ids come from the `ids` list in the body, or from the tags and
+        ingredients filter params when no ids are given.
+        """
+        ids = None
+        if isinstance(request.data, dict):
+            ids = request.data.get('ids')
+        if ids is None:
+            params = request.query_params
+            if not (params.get('tags') or params.get('ingredients')):
+                raise ValidationError(
+                    {'ids': ['Provide ids or a tags or ingredients filter.']}
+                )
+            return list(self.get_queryset().values_list('id', flat=True))
+
+        if not isinstance(ids, list) or not all(map(self._is_id, ids)):
+            raise ValidationError({'ids': ['Expected a list of integers.']})
+
+        return list(dict.fromkeys(ids))
+
+    def _bulk_items(self, request):
+        """
+        return the list of changes of a bulk update
+
+        the body is either a list of objects with an `id` and the fields
+        to change, or an object with `changes` to apply to every recipe
+        selected by `ids` or the filter params.
+        """
+        data = request.data
+        if isinstance(data, dict) and 'changes' in data:
+            changes = data['changes']
+            if not isinstance(changes, dict) or 'id' in changes:
+                raise ValidationError(
+                    {'changes': ['Expected an object of fields to change.']}
+                )
+            items = [
+                {**changes, 'id': pk} for pk in self._selected_ids(request)
+            ]
+        elif not isinstance(data, list) or \
+                not all(isinstance(item, dict) for item in data):
+            raise ValidationError(
+                {'non_field_errors': ['Expected a list of objects.']}
+            )
+        else:
+            items = data
+
+        max_batch_size = serializers.RecipeListSerializer.max_batch_size
+        if len(items) > max_batch_size:
+            raise ValidationError({'non_field_errors': [
+                f'Ensure this list has at most {max_batch_size} items.'
+            ]})
+        return items
+
+    @extend_schema(request=serializers.RecipeDetailSerializer(many=True))
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """partially update many recipes in one request"""
+        items = self._bulk_items(request)
+        recipes = self.queryset.filter(
+            user=request.user,
+            id__in=[item.get('id') for item in items if self._is_id(
+                item.get('id')
+            )],
+        ).in_bulk()
+
+        results = []
+        instances = []
+        validated_data = []
+        seen = set()
+        for item in items:
+            pk = item.get('id')
+            if not self._is_id(pk) or pk in seen:
+                results.append({
+                    'id': pk,
+                    'status': 'invalid',
+                    'errors': {'id': ['A valid and unique id is required.']},
+                })
+                continue
+            seen.add(pk)
+            if pk not in recipes:
+                results.append({'id': pk, 'status': 'not_found'})
+                continue
+
+            changes = {k: v for k, v in item.items() if k != 'id'}
+            serializer = self.get_serializer(
+                recipes[pk], data=changes, partial=True,
+            )
+            if not serializer.is_valid():
+                results.append({
+                    'id': pk,
+                    'status': 'invalid',
+                    'errors': serializer.errors,
+                })
+                continue
+
+            instances.append(recipes[pk])
+            validated_data.append(serializer.validated_data)
+            results.append({'id': pk, 'status': 'updated'})
+
+        if instances:
+            self.get_serializer(many=True).update(instances, validated_data)
+
+        return Response(results, status=status.HTTP_200_OK)
+
+    @extend_schema(request=None)
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        """delete many recipes in one request"""
+        ids = self._selected_ids(request)
+        found = set(
+            self.queryset.filter(
+                user=request.user,
+                id__in=ids,
+            ).values_list('id', flat=True)
+        )
+        if found:
+            Recipe.objects.filter(id__in=found).delete()
+
+        results = [
+            {'id': pk, 'status': 'deleted' if pk in found else 'not_found'}
+            for pk in ids
+        ]
+        return Response(results, status=status.HTTP_200_OK)
+
+    def _export_lines(self, queryset, chunk_size):
+        """
+        yield the recipes of queryset as NDJSON, one chunk at a time
+
+        the rows are read with a server-side cursor where the database
+        has one and the tags and ingredients are loaded per chunk, so
+        only one chunk is held in memory.
+        """
+        renderer = NDJSONRenderer()
+        context = self.get_serializer_context()
+        chunk = []
+        for recipe in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(recipe)
+            if len(chunk) < chunk_size:
+                continue
+            yield self._export_chunk(renderer, chunk, context)
+            chunk = []
+        if chunk:
+            yield self._export_chunk(renderer, chunk, context)
+
+    def _export_chunk(self, renderer, recipes, context):
+        prefetch_related_objects(recipes, *self.related_prefetches())
+        return renderer.render(
+            serializers.RecipeDetailSerializer(
+                recipes, many=True, context=context,
+            ).data
+        )
+
+    def perform_content_negotiation(self, request, force=False):
+        """the export is NDJSON whatever the Accept header asks for"""
+        return super().perform_content_negotiation(
+            request, force or self.action == 'export',
+        )
+
+    @extend_schema(
+        responses={200: serializers.RecipeDetailSerializer(many=True)},
+    )
+    @action(
+        methods=['GET'],
+        detail=False,
+        renderer_classes=[NDJSONRenderer],
+        pagination_class=None,
+    )
+    def export(self, request):
+        """stream every recipe of the user as newline delimited JSON"""
+        queryset = self.queryset.filter(user=request.user).order_by('id')
+        response = StreamingHttpResponse(
+            self._export_lines(
+                queryset,
+                getattr(settings, 'RECIPE_EXPORT_CHUNK_SIZE', 500),
+            ),
+            content_type=NDJSONRenderer.media_type,
+        )
+        response['Content-Disposition'] = \
+            'attachment; filename="recipes.ndjson"'
+        return response
+
     @action(methods=['POST'], detail = True, url_path = 'upload-image')
     def upload_image(self, request, pk=None):
         """upload an image to recipe"""
+        request._request.upload_handlers = [
+            ImageUploadHandler(request._request),
+        ]
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data = request.data)
 
-        if serializer.is_valid():
-            serializer.save()
+        upload_errors = getattr(request._request, 'upload_errors', None)
+        if upload_errors:
+            return Response(
+                upload_errors, status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        recipe = images.save_upload(serializer)
+        if recipe.image_status == ImageStatus.READY:
             return Response(serializer.data, status=status.HTTP_200_OK)
+        if images.is_async():
+            # left pending for the process_images workers
+            status_url = request.build_absolute_uri(
+                reverse('recipe:recipe-image-status', args=[recipe.pk])
+            )
+            response = Response(
+                {**serializer.data, 'status_url': status_url},
+                status=status.HTTP_202_ACCEPTED,
+            )
+            response['Location'] = status_url
+            return response
+
+        if not images.make_variants(recipe):
+            return Response(
+                {'image': ['The image could not be processed.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=True, url_path='image-status')
+    def image_status(self, request, pk=None):
+        """return the image of a recipe and the state of its processing"""
+        return Response(self.get_serializer(self.get_object()).data)
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    @extend_schema(responses={200: serializers.ListCacheStatsSerializer})
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='list-cache-stats',
+        url_name='list-cache-stats',
+        permission_classes=[IsAdminUser],
+        pagination_class=None,
+    )
+    def cache_stats(self, request):
+        """
+        return the list cache hits and misses counted by the process
+        answering, for staff users
+        """
+        return Response(serializers.ListCacheStatsSerializer({
+            **list_cache_stats.as_dict(),
+            'process': os.getpid(),
+        }).data)
 
 @extend_schema_view(
     list = extend_schema(
@@ -103,13 +604,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
+class BaseRecipeAttrViewSet(CollectionETagMixin,
+                            mixins.DestroyModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             viewsets.GenericViewSet):
     """base viewset for recipe attribute"""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetCursorPagination
+    autocomplete_max_limit = 50
 
     def get_queryset(self):
         """retrieve recipe for authenticated user"""
@@ -124,6 +631,53 @@ class BaseRecipeAttrViewSet(mixins.DestroyModelMixin,
             user = self.request.user
         ).order_by('-name').distinct()
 
+    def perform_update(self, serializer):
+        """rename, rejecting a name already used ignoring case"""
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError(
+                {'name': ['An item with this name already exists.']}
+            )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                required=True,
+                description='Text typed so far.',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of suggestions, 10 by default and '
+                            'at most 50.',
+            ),
+        ]
+    )
+    @action(methods=['GET'], detail=False, pagination_class=None)
+    def autocomplete(self, request):
+        """suggest names starting with or similar to the text typed so far"""
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        limit = max(1, min(limit, self.autocomplete_max_limit))
+
+        matches = name_index.complete(
+            self.queryset.model,
+            request.user.pk,
+            request.query_params.get('q', ''),
+            limit,
+            version=current_version(request),
+        )
+        serializer = self.get_serializer(
+            [{'id': pk, 'name': name} for pk, name in matches], many=True,
+        )
+        return Response(serializer.data)
+
 class TagViewSet(BaseRecipeAttrViewSet):
     """manage tag in the db"""
     serializer_class = serializers.TagSerializer
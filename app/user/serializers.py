@@ -7,6 +7,8 @@ from django.utils.translation import gettext as _
 
 from rest_framework import serializers
 
+from core import tokens
+
 class UserSerializer(serializers.ModelSerializer):
     "Serializers for the user object"
 
@@ -53,3 +55,50 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class TokenRefreshSerializer(serializers.Serializer):
+    """serializer for refreshing a signed token"""
+    refresh = serializers.CharField(trim_whitespace=False)
+
+    def validate(self, attrs):
+        """verify the refresh token and issue a new token pair"""
+        try:
+            refresh = tokens.verify(attrs['refresh'], tokens.REFRESH)
+        except tokens.InvalidToken as exc:
+            raise serializers.ValidationError(str(exc), code='authorization')
+
+        user = get_user_model().objects.filter(
+            pk=refresh.user_id,
+            is_active=True,
+        ).first()
+        if not user:
+            msg = _('User inactive or deleted.')
+            raise serializers.ValidationError(msg, code='authorization')
+
+        # a refresh token is used once, of concurrent refreshes with it
+        # only the one revoking it gets a new pair
+        if not tokens.revoke(refresh):
+            msg = _('Token has been revoked.')
+            raise serializers.ValidationError(msg, code='authorization')
+        attrs['tokens'] = tokens.issue_pair(user)
+        return attrs
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    """serializer for revoking a signed token"""
+    token = serializers.CharField(trim_whitespace=False)
+
+    def validate(self, attrs):
+        """verify the access or refresh token to revoke"""
+        for token_type in (tokens.REFRESH, tokens.ACCESS):
+            try:
+                attrs['signed_token'] = tokens.verify(
+                    attrs['token'], token_type,
+                )
+                return attrs
+            except tokens.InvalidToken:
+                pass
+
+        msg = _('Invalid token.')
+        raise serializers.ValidationError(msg, code='authorization')
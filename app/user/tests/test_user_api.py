@@ -1,4 +1,6 @@
-from django.test import TestCase
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
@@ -7,6 +9,8 @@ from rest_framework import status
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
+TOKEN_REFRESH_URL = reverse('user:token-refresh')
+TOKEN_REVOKE_URL = reverse('user:token-revoke')
 ME_URL = reverse('user:me')
 
 def create_user(**params):
@@ -99,6 +103,96 @@ class PublicUserApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
+
+@override_settings(AUTH_TOKEN_MODE='signed')
+class SignedTokenApiTests(TestCase):
+    """test the signed token mode of the token API"""
+
+    def setUp(self):
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+
+    def obtain_tokens(self):
+        """return the tokens issued for the test user"""
+        payload = {'email': 'test@example.com', 'password': 'testpass123'}
+        res = self.client.post(TOKEN_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_create_signed_tokens(self):
+        """test signed mode issues an access and a refresh token"""
+        data = self.obtain_tokens()
+
+        self.assertIn('token', data)
+        self.assertIn('refresh', data)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {data['token']}")
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_refresh_tokens(self):
+        """test a refresh token can be used once for new tokens"""
+        data = self.obtain_tokens()
+
+        res = self.client.post(TOKEN_REFRESH_URL, {'refresh': data['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.data)
+        self.assertNotEqual(res.data['refresh'], data['refresh'])
+
+        res = self.client.post(TOKEN_REFRESH_URL, {'refresh': data['refresh']})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_concurrent_refresh(self):
+        """test a refresh token revoked meanwhile gets no new tokens"""
+        data = self.obtain_tokens()
+
+        # another request consumed the token between verify and revoke
+        with patch('core.tokens.revoke', return_value=False):
+            res = self.client.post(
+                TOKEN_REFRESH_URL, {'refresh': data['refresh']},
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('token', res.data)
+
+    def test_refresh_inactive_user(self):
+        """test a deactivated user cannot refresh tokens"""
+        data = self.obtain_tokens()
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.post(TOKEN_REFRESH_URL, {'refresh': data['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revoke_token(self):
+        """test a revoked access token is rejected"""
+        data = self.obtain_tokens()
+
+        res = self.client.post(TOKEN_REVOKE_URL, {'token': data['token']})
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {data['token']}")
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_update_profile_with_signed_token(self):
+        """test updating the profile keeps the other user fields"""
+        data = self.obtain_tokens()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {data['token']}")
+
+        res = self.client.patch(ME_URL, {'name': 'New Name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'New Name')
+        self.assertEqual(self.user.email, 'test@example.com')
+        self.assertTrue(self.user.check_password('testpass123'))
+
 class PrivateUserApiTests(TestCase):
     """test api request that require authorization"""
     def setUp(self):
@@ -1,12 +1,25 @@
 """
 View for the user API
 """
-from rest_framework import generics, authentication, permissions
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.shortcuts import get_object_or_404
+
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+
+from core import tokens
+from core.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
+    TokenRefreshSerializer,
+    TokenRevokeSerializer,
 )
 
 class CreateUserView(generics.CreateAPIView):
@@ -18,12 +31,54 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """return a database token, or signed tokens in signed mode"""
+        if settings.AUTH_TOKEN_MODE != 'signed':
+            return super().post(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        return Response(tokens.issue_pair(user))
+
+
+class RefreshTokenView(generics.GenericAPIView):
+    """exchange a refresh token for new signed tokens"""
+    serializer_class = TokenRefreshSerializer
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.validated_data['tokens'])
+
+
+class RevokeTokenView(generics.GenericAPIView):
+    """revoke a signed access or refresh token"""
+    serializer_class = TokenRevokeSerializer
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tokens.revoke(serializer.validated_data['signed_token'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    ]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """trtrieve and return the authenticated user"""
+        if isinstance(self.request.auth, tokens.SignedToken):
+            return get_object_or_404(
+                get_user_model(),
+                pk=self.request.user.pk,
+                is_active=True,
+            )
         return self.request.user